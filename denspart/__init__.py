@@ -18,15 +18,72 @@
 # along with this program; if not, see <http://www.gnu.org/licenses/>
 #
 # --
-"""Density-based partitioning (fuzzy atoms-in-molecules) package"""
-
-
-from .base import *
-from .becke import *
-from .hirshfeld import *
-from .hirshfeld_i import *
-from .iterstock import *
-from .mbis import *
-from .mulliken import *
-from .proatomdb import *
-from .stockholder import *
+"""Density-based partitioning (fuzzy atoms-in-molecules) package
+
+   The public names of the submodules are imported lazily, when they are first
+   accessed, such that ``import denspart`` does not load h5py, scipy or
+   horton.grid. On Python versions without module-level ``__getattr__`` (before
+   3.7), all submodules are imported eagerly.
+"""
+
+
+import importlib
+import sys
+
+
+# The public names of the package and the submodules in which they are defined.
+# This must be kept consistent with the ``__all__`` lists of the submodules.
+_submodule_names = {
+    'base': ['Part', 'WPart'],
+    'becke': ['BeckeWPart', 'get_becke_radii', 'get_becke_neighbors'],
+    'cache': ['JustOnceClass', 'just_once', 'ArrayPool', 'Cache'],
+    'gisa': ['GaussianIterativeStockholderWPart'],
+    'hirshfeld': ['HirshfeldWPart'],
+    'hirshfeld_i': ['HirshfeldIWPart'],
+    'history': ['IterationHistory'],
+    'iterstock': ['ChargesConvergedCallback', 'IterativeProatomMixin',
+                  'IterativeStockholderWPart'],
+    'mbis': ['MBISWPart'],
+    'multi': ['MultiWPart'],
+    'mulliken': ['partition_mulliken', 'get_mulliken_operators', 'get_mulliken_populations',
+                 'get_mulliken_pair_populations', 'get_basis_centers', 'BasisCenterIndex'],
+    'poisson': ['get_spline_key', 'PoissonCache', 'poisson_cache'],
+    'proatomdb': ['ProAtomRecord', 'ProAtomDB', 'load_proatom_records', 'load_proatomdb'],
+    'spherical': ['get_shell_shape', 'get_angular_weights', 'SphericalAverager'],
+    'spline': ['RadialMap', 'RadialSplines'],
+    'stockholder': ['StockholderWPart'],
+    'template': ['get_cartesian_powers', 'get_pure_polynomials', 'get_radial_powers',
+                 'AtomicGridTemplate', 'TemplateCache', 'template_cache'],
+}
+
+_name_submodules = dict(
+    (name, submodule)
+    for submodule, names in _submodule_names.items()
+    for name in names
+)
+
+# The log module is cheap and always imported. When a submodule is imported,
+# it becomes an attribute of the package, which would hide the ``log`` object if
+# the log module was imported lazily.
+from .log import log, Timer
+
+__all__ = sorted(list(_name_submodules) + ['log', 'Timer'])
+
+
+def __getattr__(name):
+    submodule = _name_submodules.get(name)
+    if submodule is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module('.' + submodule, __name__), name)
+    # Store the value, such that __getattr__ is not called again for this name.
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if sys.version_info < (3, 7):
+    for _name in __all__:
+        __getattr__(_name)
@@ -21,13 +21,14 @@
 """Base classes for (atoms-in-molecules) partitioning algorithms"""
 
 
-from __future__ import print_function
-
 import numpy as np
 
 from .cache import JustOnceClass, just_once, Cache
+from .log import log, log_table, Timer
+from .poisson import poisson_cache
+from .template import template_cache
 from .utils import typecheck_geo
-from horton.grid import AtomicGrid, solve_poisson_becke
+from horton.grid import AtomicGrid
 
 
 __all__ = ["Part", "WPart"]
@@ -36,6 +37,13 @@ __all__ = ["Part", "WPart"]
 class Part(JustOnceClass):
     name = None
     linear = False  # whether the populations are linear in the density matrix.
+    # The outputs with one row per atom, e.g. written per atom by denspart-batch.
+    atom_outputs = ['populations', 'pseudo_populations', 'charges', 'spin_charges',
+                    'cartesian_multipoles', 'pure_multipoles', 'radial_moments']
+    # An ArrayPool shared by the caches of all instances, e.g. set
+    # ``Part.cache_pool = ArrayPool()`` before processing many frames. The
+    # arrays of one frame are given back with ``part.cache.release()``.
+    cache_pool = None
 
     def __init__(self, coordinates, numbers, pseudo_numbers, grid, moldens, spindens, local, lmax):
         """
@@ -86,7 +94,12 @@ class Part(JustOnceClass):
         self._lmax = lmax
 
         # Caching stuff, to avoid recomputation of earlier results
-        self._cache = Cache()
+        self._cache = Cache(pool=self.cache_pool)
+
+        # Timings and counters. The report is updated in place, such that the
+        # item in the cache is always up to date.
+        self._timer = Timer()
+        self._cache.dump('timings', self._timer.report, tags='o')
 
         # Initialize the subgrids
         if local:
@@ -140,6 +153,11 @@ class Part(JustOnceClass):
 
     cache = property(_get_cache)
 
+    def _get_timer(self):
+        return self._timer
+
+    timer = property(_get_timer)
+
     def __clear__(self):
         self.clear()
 
@@ -147,6 +165,8 @@ class Part(JustOnceClass):
         """Discard all cached results, e.g. because wfn changed"""
         JustOnceClass.clear(self)
         self.cache.clear()
+        self._timer.reset()
+        self.cache.dump('timings', self._timer.report, tags='o')
 
     def get_grid(self, index=None):
         """Return an integration grid
@@ -182,6 +202,16 @@ class Part(JustOnceClass):
         """
         raise NotImplementedError
 
+    def get_template(self, index):
+        """Return the AtomicGridTemplate of the grid of an atom, or None
+
+           A template is only available when the grid of the atom is a
+           translated atomic grid centered on the atom, without random
+           rotation. Otherwise, the moments are computed with
+           ``IntGrid.integrate``.
+        """
+        return None
+
     def _init_subgrids(self):
         raise NotImplementedError
 
@@ -192,44 +222,124 @@ class Part(JustOnceClass):
         raise NotImplementedError
 
     def _init_log_memory(self):
+        log.info('Coarse estimate of memory usage for the partitioning:')
+        log.info('                         Label  Memory[GB]')
+        nbyte_total = 0
+        for label, nbyte in self._compute_memory_estimates():
+            log.info('%30s  %10.3f', label, nbyte / 1024.0**3)
+            nbyte_total += nbyte
+        log.info('%30s  %10.3f', 'Total', nbyte_total / 1024.0**3)
+
+    def _compute_memory_estimates(self):
+        """Return a list of (label, nbyte) pairs with the estimated memory usage."""
         # precompute arrays sizes for certain grids
         nbyte_global = self.grid.size * 8
         nbyte_locals = np.array([self.get_grid(i).size * 8 for i in range(self.natom)])
-
-        # compute and report usage
-        estimates = self.get_memory_estimates()
-        nbyte_total = 0
-        print('5:Coarse estimate of memory usage for the partitioning:')
-        print('5:                         Label  Memory[GB]')
-        print()
-        for label, nlocals, nglobal in estimates:
-            nbyte = np.dot(nlocals, nbyte_locals) + nglobal * nbyte_global
-            print('5:%30s  %10.3f' % (label, nbyte / 1024.0**3))
-            nbyte_total += nbyte
-        print('5:%30s  %10.3f' % ('Total', nbyte_total / 1024.0**3))
-        print('5:' + '~' * 100)
-        print()
+        return [(label, np.dot(nlocals, nbyte_locals) + nglobal * nbyte_global)
+                for label, nlocals, nglobal in self.get_memory_estimates()]
 
     def get_memory_estimates(self):
         return [
             ('Atomic weights', np.ones(self.natom), 0),
             ('Promolecule', np.zeros(self.natom), 1),
             ('Working arrays', np.zeros(self.natom), 2),
+            ('Weighted density', np.zeros(self.natom), 1),
         ]
 
+    def get_memory_report(self):
+        """Compare the memory used by the cache with the estimates.
+
+           **Returns:** the dictionary returned by
+           ``Cache.get_memory_report``, extended with the item ``estimates``,
+           a list of (label, nbyte) pairs derived from
+           ``get_memory_estimates``, and the item ``estimate``, the sum of the
+           estimates.
+        """
+        report = self.cache.get_memory_report()
+        estimates = self._compute_memory_estimates()
+        report['estimates'] = estimates
+        report['estimate'] = sum(nbyte for label, nbyte in estimates)
+        return report
+
+    def log_memory_report(self):
+        """Write the memory usage of the cache and the estimate to the log."""
+        report = self.get_memory_report()
+        log.info('Memory used by arrays in the cache:')
+        log.info('                        Family  Memory[GB]    Peak[GB]  Alloc  Reuse   Dump')
+        for family, record in sorted(report['families'].items(), key=lambda item: str(item[0])):
+            log.info('%30s  %10.3f  %10.3f  %5i  %5i  %5i', family, record['nbyte'] / 1024.0**3,
+                     record['peak'] / 1024.0**3, record['nalloc'], record['nreuse'], record['ndump'])
+        log.info('%30s  %10.3f  %10.3f', 'Total', report['nbyte'] / 1024.0**3,
+                 report['peak'] / 1024.0**3)
+        log.info('%30s  %10.3f', 'Estimate', report['estimate'] / 1024.0**3)
+
     def to_atomic_grid(self, index, data):
         raise NotImplementedError
 
+    def get_weighted_density(self, spin=False):
+        """Return the density multiplied by the integration weights.
+
+           For local grids, the weights of the atomic grids are used, such that
+           the slice of an atom, see ``to_atomic_grid``, contains the density
+           times the weights of its atomic grid. The result is computed once
+           and stored in the cache.
+
+           **Optional arguments:**
+
+           spin
+                When True, the spin density is used instead of the density.
+        """
+        key = 'weighted_spindens' if spin else 'weighted_moldens'
+        result, new = self.cache.load(key, alloc=self.grid.shape)
+        if new:
+            dens = self._spindens if spin else self._moldens
+            if self.local:
+                for index in range(self.natom):
+                    np.multiply(self.get_grid(index).weights, self.to_atomic_grid(index, dens),
+                                out=self.to_atomic_grid(index, result))
+            else:
+                np.multiply(self.grid.weights, dens, out=result)
+        return result
+
+    def compute_pseudo_populations(self, indexes=None, spin=False):
+        """Compute the pseudo populations of several atoms at once.
+
+           The integrals are dot products of the atomic weights with the slices
+           of the weighted density, see ``get_weighted_density``, which avoids
+           temporary arrays for every atom.
+
+           **Optional arguments:**
+
+           indexes
+                The atoms for which the populations are computed. All atoms when
+                not given.
+
+           spin
+                When True, the spin populations are computed instead.
+
+           **Returns:** an array with the pseudo populations.
+        """
+        if indexes is None:
+            indexes = range(self.natom)
+        weighted = self.get_weighted_density(spin)
+        result = np.zeros(len(indexes))
+        for i, index in enumerate(indexes):
+            at_weights = self.cache.load('at_weights', index)
+            wcor = self.get_wcor(index)
+            if wcor is None:
+                result[i] = np.dot(at_weights, self.to_atomic_grid(index, weighted))
+            else:
+                dens = self.get_spindens(index) if spin else self.get_moldens(index)
+                result[i] = self.get_grid(index).integrate(at_weights, dens, wcor)
+        return result
+
     def compute_pseudo_population(self, index):
-        grid = self.get_grid(index)
-        dens = self.get_moldens(index)
-        at_weights = self.cache.load('at_weights', index)
-        wcor = self.get_wcor(index)
-        return grid.integrate(at_weights, dens, wcor)
+        return self.compute_pseudo_populations([index])[0]
 
     @just_once
     def do_partitioning(self):
-        self.update_at_weights()
+        with self.timer.section('update_at_weights'):
+            self.update_at_weights()
     do_partitioning.names = []
 
     def update_at_weights(self):
@@ -242,9 +352,9 @@ class Part(JustOnceClass):
         if new:
             self.do_partitioning()
             pseudo_populations = self.cache.load('pseudo_populations', alloc=self.natom, tags='o')[0]
-            print('5:Computing atomic populations.')
-            for i in range(self.natom):
-                pseudo_populations[i] = self.compute_pseudo_population(i)
+            log.info('Computing atomic populations.')
+            with self.timer.section('populations'):
+                pseudo_populations[:] = self.compute_pseudo_populations()
             populations[:] = pseudo_populations
             populations += self.numbers - self.pseudo_numbers
 
@@ -254,7 +364,7 @@ class Part(JustOnceClass):
         if new:
             self.do_populations()
             populations = self._cache.load('populations')
-            print('5:Computing atomic charges.')
+            log.info('Computing atomic charges.')
             charges[:] = self.numbers - populations
 
     @just_once
@@ -262,13 +372,8 @@ class Part(JustOnceClass):
         if self._spindens is not None:
             spin_charges, new = self._cache.load('spin_charges', alloc=self.natom, tags='o')
             self.do_partitioning()
-            print('5:Computing atomic spin charges.')
-            for index in range(self.natom):
-                grid = self.get_grid(index)
-                spindens = self.get_spindens(index)
-                at_weights = self.cache.load('at_weights', index)
-                wcor = self.get_wcor(index)
-                spin_charges[index] = grid.integrate(at_weights, spindens, wcor)
+            log.info('Computing atomic spin charges.')
+            spin_charges[:] = self.compute_pseudo_populations(spin=True)
 
     @just_once
     def do_moments(self):
@@ -283,35 +388,49 @@ class Part(JustOnceClass):
 
         if new1 or new2:
             self.do_partitioning()
-            print('5:Computing cartesian and pure AIM multipoles and radial AIM moments.')
-
-            for i in range(self.natom):
-                # 1) Define a 'window' of the integration grid for this atom
-                center = self.coordinates[i]
-                grid = self.get_grid(i)
-
-                # 2) Compute the AIM
-                aim = self.get_moldens(i) * self.cache.load('at_weights', i)
-
-                # 3) Compute weight corrections
-                wcor = self.get_wcor(i)
-
-                # 4) Compute Cartesian multipole moments
-                # The minus sign is present to account for the negative electron
-                # charge.
-                cartesian_multipoles[i] = -grid.integrate(aim, wcor, center=center, lmax=self.lmax, mtype=1)
-                cartesian_multipoles[i, 0] += self.pseudo_numbers[i]
-
-                # 5) Compute Pure multipole moments
-                # The minus sign is present to account for the negative electron
-                # charge.
-                pure_multipoles[i] = -grid.integrate(aim, wcor, center=center, lmax=self.lmax, mtype=2)
-                pure_multipoles[i, 0] += self.pseudo_numbers[i]
-
-                # 6) Compute Radial moments
-                # For the radial moments, it is not common to put a minus sign
-                # for the negative electron charge.
-                radial_moments[i] = grid.integrate(aim, wcor, center=center, lmax=self.lmax, mtype=3)
+            log.info('Computing cartesian and pure AIM multipoles and radial AIM moments.')
+            with self.timer.section('moments'):
+                for i in range(self.natom):
+                    # 1) Define a 'window' of the integration grid for this atom
+                    center = self.coordinates[i]
+                    grid = self.get_grid(i)
+
+                    # 2) Compute the AIM
+                    aim = self.get_moldens(i) * self.cache.load('at_weights', i)
+
+                    # 3) Compute weight corrections
+                    wcor = self.get_wcor(i)
+
+                    # 4) Compute the Cartesian, pure and radial moments of the AIM.
+                    # With a template, the polynomials are precomputed, see
+                    # AtomicGridTemplate.get_moment_table.
+                    template = self.get_template(i)
+                    if template is None:
+                        moments = [grid.integrate(aim, wcor, center=center, lmax=self.lmax, mtype=mtype)
+                                   for mtype in (1, 2, 3)]
+                    else:
+                        aim *= grid.weights
+                        if wcor is not None:
+                            aim *= wcor
+                        moments = [np.dot(template.get_moment_table(self.lmax, mtype), aim)
+                                   for mtype in (1, 2, 3)]
+
+                    # 5) Cartesian multipole moments
+                    # The minus sign is present to account for the negative electron
+                    # charge.
+                    cartesian_multipoles[i] = -moments[0]
+                    cartesian_multipoles[i, 0] += self.pseudo_numbers[i]
+
+                    # 6) Pure multipole moments
+                    # The minus sign is present to account for the negative electron
+                    # charge.
+                    pure_multipoles[i] = -moments[1]
+                    pure_multipoles[i, 0] += self.pseudo_numbers[i]
+
+                    # 7) Radial moments
+                    # For the radial moments, it is not common to put a minus sign
+                    # for the negative electron charge.
+                    radial_moments[i] = moments[2]
 
     def do_all(self):
         """Computes all properties and return a list of their keys."""
@@ -365,10 +484,10 @@ class WPart(Part):
                       grid, moldens, spindens, local, lmax)
 
     def _init_log_base(self):
-        print('5:Performing a density-based AIM analysis with a wavefunction as input.')
-        print([
-            ('5: Molecular grid', self._grid),
-            ('5: Using local grids', self._local),
+        log.info('Performing a density-based AIM analysis with a wavefunction as input.')
+        log_table([
+            ('Molecular grid', self._grid),
+            ('Using local grids', self._local),
         ])
 
     def _init_subgrids(self):
@@ -377,6 +496,16 @@ class WPart(Part):
     def get_wcor(self, index):
         return None
 
+    def get_template(self, index):
+        # The template is not stored in the cache of this object, such that it
+        # is released when template_cache discards it.
+        if not self.local:
+            return None
+        atgrid = self.get_grid(index)
+        if not isinstance(atgrid, AtomicGrid) or (atgrid.center != self.coordinates[index]).any():
+            return None
+        return template_cache.get(atgrid)
+
     def to_atomic_grid(self, index, data):
         if index is None or not self.local:
             return data
@@ -387,7 +516,7 @@ class WPart(Part):
     @just_once
     def do_density_decomposition(self):
         if not self.local:
-            print('5:!WARNING! Skip density decomposition because no local grids were found.')
+            log.warning('Skip density decomposition because no local grids were found.')
             return
 
         for index in range(self.natom):
@@ -397,28 +526,38 @@ class WPart(Part):
             if key not in self.cache:
                 moldens = self.get_moldens(index)
                 self.do_partitioning()
-                print('5:Computing density decomposition for atom %i' % index)
+                log.info('Computing density decomposition for atom %i', index)
                 at_weights = self.cache.load('at_weights', index)
-                splines = atgrid.get_spherical_decomposition(moldens, at_weights, lmax=self.lmax)
+                with self.timer.section('density_decomposition'):
+                    splines = atgrid.get_spherical_decomposition(moldens, at_weights, lmax=self.lmax)
                 density_decomp = dict(('spline_%05i' % j, spl) for j, spl in enumerate(splines))
                 self.cache.dump(key, density_decomp, tags='o')
 
     @just_once
     def do_hartree_decomposition(self):
         if not self.local:
-            print('5:!WARNING! Skip hartree decomposition because no local grids were found.')
+            log.warning('Skip hartree decomposition because no local grids were found.')
             return
 
-        for index in range(self.natom):
-            key = ('hartree_decomposition', index)
-            if key not in self.cache:
-                self.do_density_decomposition()
-                print('5:Computing hartree decomposition for atom %i' % index)
-                density_decomposition = self.cache.load('density_decomposition', index)
-                rho_splines = [spline for foo, spline in sorted(density_decomposition.items())]
-                splines = solve_poisson_becke(rho_splines)
-                hartree_decomp = dict(('spline_%05i' % j, spl) for j, spl in enumerate(splines))
-                self.cache.dump(key, hartree_decomp, tags='o')
+        indexes = [index for index in range(self.natom)
+                   if ('hartree_decomposition', index) not in self.cache]
+        if len(indexes) == 0:
+            return
+        self.do_density_decomposition()
+        log.info('Computing hartree decomposition for %i atoms', len(indexes))
+        # All Poisson solves are done at once, such that identical density
+        # decompositions are only solved once.
+        decompositions = []
+        for index in indexes:
+            density_decomposition = self.cache.load('density_decomposition', index)
+            decompositions.append([spline for foo, spline in sorted(density_decomposition.items())])
+        nsolve = poisson_cache.nsolve
+        with self.timer.section('hartree_decomposition'):
+            hartree_splines = poisson_cache.solve_many(decompositions)
+        self.timer.count('poisson_solves', poisson_cache.nsolve - nsolve)
+        for index, splines in zip(indexes, hartree_splines):
+            hartree_decomp = dict(('spline_%05i' % j, spl) for j, spl in enumerate(splines))
+            self.cache.dump('hartree_decomposition', index, hartree_decomp, tags='o')
 
 
 def get_ncart_cumul(lmax):
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Command-line driver to partition many molecular densities in parallel
+
+   Every input is an NPZ file with the arrays ``points``, ``dens``,
+   ``numbers``, ``coordinates`` and ``pseudo_numbers``, like the files loaded
+   by ``denspart.test.common.load_molecule_npz``. The densities must be given
+   on the points of a Becke-Lebedev grid, which is reconstructed from the
+   ``--grid`` option. The inputs are processed by a pool of worker processes
+   and all results are written to one HDF5 file with two tables of columns:
+
+   * ``molecules``: one row per input, with the filename, the error message
+     (empty when the partitioning succeeded), the number of atoms, the number
+     of iterations (-1 for non-iterative schemes), the wall time and the index
+     of the first atom in the ``atoms`` table.
+
+   * ``atoms``: one row per atom of all successful inputs, with the index of
+     the molecule, the atomic number and every per-atom output of the scheme,
+     e.g. ``charges`` and ``pure_multipoles``, see ``Part.atom_outputs``.
+
+   The filenames and error messages are stored as UTF-8 encoded strings.
+
+   Inputs that fail are reported and skipped.
+"""
+
+
+from __future__ import print_function
+
+import argparse
+import glob
+import multiprocessing
+import sys
+import time
+import traceback
+
+import h5py as h5
+import numpy as np
+
+from .utils import wpart_schemes
+
+
+__all__ = ['parse_grid', 'partition_file', 'write_results', 'main']
+
+
+# Schemes that need a proatom database.
+padb_schemes = ['h', 'hi']
+
+# Schemes that accept the threshold and maxiter options.
+iterative_schemes = ['hi', 'is', 'gisa', 'mbis']
+
+# Schemes that accept the local argument. The other ones always use local grids.
+local_schemes = ['b', 'h', 'hi']
+
+# Radial transformations that can be used in the grid and proatom options.
+rtf_types = ['exp', 'lin', 'pow']
+
+# The proatom database of a worker process, see _init_worker.
+_proatomdb = None
+
+
+def _get_rtransform(rtf_type, *args):
+    from .proatomdb import rtf_classes
+    return rtf_classes[rtf_type](*args)
+
+
+def parse_grid(spec):
+    """Parse a grid specification ``rtf:rmin:rmax:nrad:nang``, e.g. ``exp:5e-4:2e1:120:110``.
+
+       **Returns:** a tuple with the type of radial transformation, rmin, rmax,
+       the number of radial points and the number of angular points.
+    """
+    words = spec.split(':')
+    if len(words) != 5 or words[0] not in rtf_types:
+        raise ValueError('Invalid grid specification: %s' % spec)
+    return words[0], float(words[1]), float(words[2]), int(words[3]), int(words[4])
+
+
+def partition_file(filename, scheme, grid_spec, local=True, proatomdb=None, **kwargs):
+    """Partition the density in one NPZ file.
+
+       **Arguments:**
+
+       filename
+            The NPZ file with the density.
+
+       scheme
+            The partitioning scheme, see ``wpart_schemes``.
+
+       grid_spec
+            The grid on which the density is given, see ``parse_grid``.
+
+       **Optional arguments:**
+
+       local
+            Whether local atomic grids are used. Only the schemes in
+            ``local_schemes`` support global grids.
+
+       proatomdb
+            A proatom database, needed by the Hirshfeld schemes.
+
+       All other keyword arguments are passed on to the partitioning scheme.
+
+       **Returns:** a dictionary with the results.
+    """
+    from horton.grid import RadialGrid, BeckeMolGrid
+    if not local and scheme not in local_schemes:
+        raise ValueError('The scheme %s only works with local grids.' % scheme)
+    time0 = time.time()
+    with np.load(filename) as npz:
+        coordinates = npz['coordinates']
+        numbers = npz['numbers']
+        pseudo_numbers = npz['pseudo_numbers']
+        moldens = npz['dens']
+        points = npz['points']
+    rtf_type, rmin, rmax, nrad, nang = parse_grid(grid_spec)
+    rgrid = RadialGrid(_get_rtransform(rtf_type, rmin, rmax, nrad))
+    grid = BeckeMolGrid(coordinates, numbers, pseudo_numbers, (rgrid, nang),
+                        random_rotate=False, mode='only' if local else 'discard')
+    if grid.points.shape != points.shape or abs(grid.points - points).max() > 1e-6:
+        raise ValueError('The points in %s do not match the grid %s.' % (filename, grid_spec))
+    if scheme in padb_schemes:
+        kwargs['proatomdb'] = proatomdb
+    if scheme in local_schemes:
+        kwargs['local'] = local
+    wpart = wpart_schemes(scheme)(coordinates, numbers, pseudo_numbers, grid, moldens, **kwargs)
+    natom = wpart.natom
+    atoms = {}
+    for key in wpart.do_all():
+        if key in wpart.atom_outputs:
+            atoms[key] = wpart[key]
+    return {
+        'natom': natom,
+        'numbers': numbers,
+        'niter': int(wpart['niter']) if 'niter' in wpart.cache else -1,
+        'time': time.time() - time0,
+        'atoms': atoms,
+    }
+
+
+def _init_worker(proatom_filenames, rtf_type):
+    """Load the proatom database once per worker process.
+
+       The proatoms are loaded from files in every worker because horton's
+       radial grids cannot be sent to other processes.
+    """
+    global _proatomdb
+    from .proatomdb import load_proatomdb
+    if len(proatom_filenames) > 0:
+        _proatomdb = load_proatomdb(proatom_filenames, rtf_type)
+
+
+def _partition_task(task):
+    """Run partition_file in a worker and turn exceptions into an error message."""
+    filename, scheme, grid_spec, local, kwargs = task
+    try:
+        result = partition_file(filename, scheme, grid_spec, local, _proatomdb, **kwargs)
+        result['error'] = ''
+    except Exception:
+        result = {'error': traceback.format_exc().strip().split('\n')[-1]}
+    result['filename'] = filename
+    return result
+
+
+def _encode(text):
+    """Encode a string as UTF-8, unless it is already encoded."""
+    if isinstance(text, bytes):
+        return text
+    return text.encode('utf-8')
+
+
+def write_results(filename, results, attrs=None):
+    """Write the results of ``partition_file`` for all inputs to an HDF5 file.
+
+       Per-atom outputs that are not present in all successful results, or
+       that do not have the same shape per atom, are not written.
+
+       **Arguments:**
+
+       filename
+            The HDF5 output file.
+
+       results
+            A list of dictionaries returned by ``_partition_task``.
+
+       **Optional arguments:**
+
+       attrs
+            A dictionary with attributes of the file, e.g. the options.
+    """
+    good = [result for result in results if result['error'] == '']
+    begins = []
+    natom_total = 0
+    for result in results:
+        begins.append(natom_total)
+        natom_total += len(result.get('numbers', ()))
+    with h5.File(filename, 'w') as f:
+        for key, value in (attrs or {}).items():
+            f.attrs[key] = value
+        molecules = f.create_group('molecules')
+        molecules['filename'] = np.array([_encode(result['filename']) for result in results], dtype='S')
+        molecules['error'] = np.array([_encode(result['error']) for result in results], dtype='S')
+        molecules['natom'] = np.array([result.get('natom', 0) for result in results], dtype=int)
+        molecules['niter'] = np.array([result.get('niter', -1) for result in results], dtype=int)
+        molecules['time'] = np.array([result.get('time', np.nan) for result in results])
+        molecules['begin'] = np.array(begins, dtype=int)
+        atoms = f.create_group('atoms')
+        atoms['molecule'] = np.array([
+            imol for imol, result in enumerate(results)
+            for iatom in range(len(result.get('numbers', ())))], dtype=int)
+        atoms['number'] = np.concatenate(
+            [result['numbers'] for result in good] + [np.zeros(0, int)]).astype(int)
+        if len(good) > 0:
+            for key in sorted(good[0]['atoms']):
+                columns = [result['atoms'].get(key) for result in good]
+                if any(column is None or column.shape[1:] != columns[0].shape[1:]
+                       for column in columns):
+                    continue
+                atoms[key] = np.concatenate(columns)
+
+
+def main(argv=None):
+    """Entry point of the ``denspart-batch`` command."""
+    parser = argparse.ArgumentParser(
+        prog='denspart-batch', description=__doc__.split('\n')[0])
+    parser.add_argument('inputs', nargs='+',
+                        help='NPZ files with molecular densities. Glob patterns are expanded.')
+    parser.add_argument('-s', '--scheme', required=True, choices=['b', 'h', 'hi', 'is', 'gisa', 'mbis'],
+                        help='The partitioning scheme.')
+    parser.add_argument('-o', '--output', default='denspart.h5',
+                        help='The HDF5 file for the results. [default=%(default)s]')
+    parser.add_argument('-j', '--nproc', type=int, default=1,
+                        help='The number of worker processes. [default=%(default)s]')
+    parser.add_argument('-g', '--grid', default='exp:5e-4:2e1:120:110',
+                        help='The grid of the densities: rtf:rmin:rmax:nrad:nang, where rtf is '
+                             'lin, exp or pow. [default=%(default)s]')
+    parser.add_argument('--global', dest='local', default=True, action='store_false',
+                        help='Use the full molecular grid for every atom instead of local atomic '
+                             'grids. Only supported by the schemes %s.' % ', '.join(local_schemes))
+    parser.add_argument('-p', '--proatoms', nargs='+', default=[],
+                        help='NPZ files with proatoms, needed by the Hirshfeld schemes. Glob '
+                             'patterns are expanded.')
+    parser.add_argument('--proatoms-rtf', default='pow', choices=rtf_types,
+                        help='The radial transformation of the proatoms. [default=%(default)s]')
+    parser.add_argument('--lmax', type=int, default=3,
+                        help='The maximum angular momentum of the multipoles. [default=%(default)s]')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help='The convergence threshold of the iterative schemes.')
+    parser.add_argument('--maxiter', type=int, default=None,
+                        help='The maximum number of iterations of the iterative schemes.')
+    args = parser.parse_args(argv)
+
+    parse_grid(args.grid)
+    if not args.local and args.scheme not in local_schemes:
+        parser.error('The scheme %s only works with local grids, see --global.' % args.scheme)
+    filenames = []
+    for pattern in args.inputs:
+        # Patterns without matches are kept, such that they are reported as failed.
+        filenames.extend(sorted(glob.glob(pattern)) or [pattern])
+    proatom_filenames = []
+    if args.scheme in padb_schemes:
+        for pattern in args.proatoms:
+            proatom_filenames.extend(sorted(glob.glob(pattern)))
+        if len(proatom_filenames) == 0:
+            parser.error('The scheme %s needs proatoms, see --proatoms.' % args.scheme)
+
+    kwargs = {'lmax': args.lmax}
+    if args.scheme in iterative_schemes:
+        for name in 'threshold', 'maxiter':
+            if getattr(args, name) is not None:
+                kwargs[name] = getattr(args, name)
+    tasks = [(filename, args.scheme, args.grid, args.local, kwargs) for filename in filenames]
+    initargs = (proatom_filenames, args.proatoms_rtf)
+
+    results = []
+    if args.nproc > 1:
+        pool = multiprocessing.Pool(args.nproc, _init_worker, initargs)
+        try:
+            for result in pool.imap(_partition_task, tasks):
+                results.append(result)
+                _report(result, len(results), len(tasks))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        _init_worker(*initargs)
+        for task in tasks:
+            results.append(_partition_task(task))
+            _report(results[-1], len(results), len(tasks))
+
+    attrs = dict(('option_%s' % key, value) for key, value in kwargs.items())
+    attrs.update(scheme=args.scheme, grid=args.grid, local=args.local)
+    write_results(args.output, results, attrs)
+    nfail = sum(result['error'] != '' for result in results)
+    print('Partitioned %i of %i inputs, results written to %s.' % (
+        len(results) - nfail, len(results), args.output))
+    return 1 if nfail > 0 else 0
+
+
+def _report(result, ifile, nfile):
+    if result['error'] == '':
+        print('[%i/%i] %s: %i atoms, %.2fs' % (
+            ifile, nfile, result['filename'], result['natom'], result['time']))
+    else:
+        print('[%i/%i] %s FAILED: %s' % (
+            ifile, nfile, result['filename'], result['error']), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -21,70 +21,410 @@
 """Becke partitioning"""
 
 
-from __future__ import print_function
-
 import numpy as np
 
 from .base import WPart
+from .log import log, log_table
 from .utils import angstrom, radius_becke, radius_covalent
-from horton.grid import becke_helper_atom
 
 
-__all__ = ['BeckeWPart']
+__all__ = ['BeckeWPart', 'get_becke_radii', 'get_becke_neighbors']
+
+
+def get_becke_radii(numbers):
+    """Return the atomic radii used in the Becke partitioning.
+
+       **Arguments:**
+
+       numbers
+            An array (natom,) with atomic numbers.
+
+       The list of radii is constructed to be as close as possible to the
+       original values used by Becke.
+    """
+    radii = []
+    for number in numbers:
+        if number == 1:
+            # exception defined in Becke's paper
+            radius = 0.35 * angstrom
+        else:
+            radius = radius_becke[number]
+            if radius is None:
+                # for cases not covered by Brag-Slater
+                radius = radius_covalent[number]
+        radii.append(radius)
+    return np.array(radii)
+
+
+def _get_becke_alphas(radii):
+    """Return the (antisymmetric) matrix of atomic size adjustments, Eqs. (A3)-(A6).
+
+       **Arguments:**
+
+       radii
+            An array (natom,) with the atomic radii, see ``get_becke_radii``.
+    """
+    u = (radii[:, None] - radii) / (radii[:, None] + radii)
+    alphas = u / (u * u - 1)
+    # Eq. (A3), with some safety margin (0.45 instead of 0.5) to stay away from a
+    # ridiculous imbalance.
+    np.clip(alphas, -0.45, 0.45, out=alphas)
+    return alphas
+
+
+def _becke_switch(nu, k):
+    """Return Becke's switching function, Eqs. (18) and (19), for the given nu."""
+    for irep in range(k):
+        nu = 0.5 * nu * (3 - nu * nu)
+    return 0.5 * (1 - nu)
+
+
+def _spread_bits(ints):
+    """Insert two zero bits after each of the lowest ten bits of the integers."""
+    ints = ints & 0x3ff
+    ints = (ints | (ints << 16)) & 0x030000ff
+    ints = (ints | (ints << 8)) & 0x0300f00f
+    ints = (ints | (ints << 4)) & 0x030c30c3
+    ints = (ints | (ints << 2)) & 0x09249249
+    return ints
+
+
+def _get_morton_order(points):
+    """Return the order of the points along a Morton (Z-order) curve.
+
+       Consecutive points in this order are mostly close in space.
+    """
+    lower = points.min(axis=0)
+    extent = np.maximum(points.max(axis=0) - lower, 1e-10)
+    ints = ((points - lower) / extent * 1023).astype(np.int64)
+    codes = _spread_bits(ints[:, 0]) | (_spread_bits(ints[:, 1]) << 1) | \
+        (_spread_bits(ints[:, 2]) << 2)
+    return codes.argsort(kind='mergesort')
+
+
+def _get_blocks(points, blocksize, maxradius=1.0, minsize=16):
+    """Return blocks of points that are close in space.
+
+       **Arguments:**
+
+       points
+            An array (npoint, 3) with grid points.
+
+       blocksize
+            The maximum number of points in a block.
+
+       **Optional arguments:**
+
+       maxradius
+            Blocks whose points do not fit in a sphere with this radius are
+            split in two, unless they have fewer than ``minsize`` points.
+
+       minsize
+            See maxradius.
+
+       **Returns:** a list of index arrays.
+
+       The points are sorted along a Morton curve and cut in blocks of
+       ``blocksize`` points, which are split further in the sparse regions of
+       the grid. The neighbor lists of compact blocks are short, see
+       ``get_becke_neighbors``.
+    """
+    order = _get_morton_order(points)
+    todo = [order[begin:begin + blocksize] for begin in range(0, len(order), blocksize)]
+    blocks = []
+    while len(todo) > 0:
+        block = todo.pop()
+        if len(block) >= 2 * minsize and _get_block_sphere(points[block])[1] > maxradius:
+            half = len(block) // 2
+            todo.extend([block[half:], block[:half]])
+        else:
+            blocks.append(block)
+    return blocks
+
+
+def _get_block_sphere(points):
+    """Return the center and the radius of a sphere that contains the points."""
+    center = 0.5 * (points.min(axis=0) + points.max(axis=0))
+    return center, np.sqrt(((points - center)**2).sum(axis=1)).max()
+
+
+def _get_switch_bounds(rmin, rmax, distances, alphas, k, rows, cols):
+    """Return upper bounds of the switching factors s(nu_BA) on a block of points.
+
+       **Arguments:**
+
+       rmin, rmax
+            Arrays (natom,) with lower and upper bounds of the distances
+            between the points in the block and the atoms.
+
+       distances, alphas
+            The interatomic distances and the atomic size adjustments.
+
+       k
+            The order of the polynomials used in the Becke partitioning.
+
+       rows, cols
+            The indexes of the atoms B and A, respectively.
+
+       **Returns:** an array (len(rows), len(cols)). Factors of an atom with
+       itself are set to one.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mu = (rmin[rows, None] - rmax[cols]) / distances[rows][:, cols]
+    mu[rows[:, None] == cols] = -1.0
+    np.clip(mu, -1, 1, out=mu)
+    # nu increases monotonously with mu and the switching function decreases
+    # monotonously with nu, so the lower bound of mu gives an upper bound.
+    return _becke_switch(mu + alphas[rows][:, cols] * (1 - mu * mu), k)
+
+
+def get_becke_neighbors(points, coordinates, distances, alphas, k, threshold, nblocker=4):
+    """Return the atoms that contribute to the Becke weights on a block of points.
+
+       **Arguments:**
+
+       points
+            An array (npoint, 3) with grid points.
+
+       coordinates
+            An array (natom, 3) with the positions of the atoms.
+
+       distances
+            An array (natom, natom) with the interatomic distances.
+
+       alphas
+            An array (natom, natom) with the atomic size adjustments.
+
+       k
+            The order of the polynomials used in the Becke partitioning.
+
+       threshold
+            Switching factors and cell functions below this threshold are
+            neglected.
+
+       **Optional arguments:**
+
+       nblocker
+            The number of atoms closest to the block used to bound the cell
+            functions of all other atoms.
+
+       **Returns:** a sorted array with atom indexes.
+
+       All points lie within a sphere with radius rho around a center, so the
+       distance between a point and an atom X lies between d_X - rho and
+       d_X + rho, where d_X is the distance between the center and atom X.
+       This gives an upper bound of every switching factor on the block.
+       The cell function P_A of each atom is bounded by the product of its
+       switching factors with the ``nblocker`` atoms closest to the block.
+       Atoms for which this bound exceeds the threshold are significant. An
+       atom B is included when it is significant, when it is one of the
+       closest atoms, or when P_A s(nu_BA) may exceed the threshold for a
+       significant atom A. Atoms that are left out thus have a negligible
+       cell function and change the cell functions of the other atoms by
+       less than the threshold times the number of atoms left out.
+    """
+    center, rho = _get_block_sphere(points)
+    dcenter = np.sqrt(((coordinates - center)**2).sum(axis=1))
+    rmin = np.maximum(dcenter - rho, 0.0)
+    rmax = dcenter + rho
+    atoms = np.arange(len(coordinates))
+    blockers = dcenter.argsort()[:nblocker]
+    bounds = _get_switch_bounds(rmin, rmax, distances, alphas, k, atoms, blockers)
+    cell_bounds = bounds.prod(axis=1)
+    significant = (cell_bounds >= threshold).nonzero()[0]
+    # The blockers are always included, such that the cell functions of the
+    # atoms that are not significant remain below the threshold.
+    neighbors = np.zeros(len(coordinates), bool)
+    neighbors[significant] = True
+    neighbors[blockers] = True
+    bounds = _get_switch_bounds(rmin, rmax, distances, alphas, k, atoms, significant)
+    bounds *= cell_bounds[significant]
+    neighbors |= (bounds >= threshold).any(axis=1)
+    return neighbors.nonzero()[0]
+
+
+def _compute_becke_cell_functions(radii, distances, alphas, k):
+    """Return the (unnormalized) Becke cell functions, Eq. (13), of a set of atoms.
+
+       **Arguments:**
+
+       radii
+            An array (npoint, ncenter) with the distances between the grid
+            points and the atoms.
+
+       distances
+            An array (ncenter, ncenter) with the interatomic distances.
+
+       alphas
+            An array (ncenter, ncenter) with the atomic size adjustments.
+
+       k
+            The order of the polynomials used in the Becke partitioning.
+
+       **Returns:** an array (npoint, ncenter).
+
+       Each pair of atoms is only visited once, making use of s(-nu) = 1 - s(nu).
+    """
+    npoint, ncenter = radii.shape
+    cell = np.ones((npoint, ncenter), float)
+    for i in range(ncenter - 1):
+        mu = (radii[:, i:i + 1] - radii[:, i + 1:]) / distances[i, i + 1:]
+        nu = mu + alphas[i, i + 1:] * (1 - mu * mu)
+        s = _becke_switch(nu, k)
+        cell[:, i] *= s.prod(axis=1)
+        cell[:, i + 1:] *= 1 - s
+    return cell
 
 
 class BeckeWPart(WPart):
     """Becke partitioning with Becke-Lebedev grids"""
 
     name = 'b'
-    options = ['lmax', 'k']
+    options = ['lmax', 'k', 'threshold', 'onepass']
     linear = True
 
     def __init__(self, coordinates, numbers, pseudo_numbers, grid, moldens,
-                 spindens=None, local=True, lmax=3, k=3):
+                 spindens=None, local=True, lmax=3, k=3, threshold=1e-12,
+                 blocksize=1024, onepass=False):
         """
            **Optional arguments:** (that are not defined in ``WPart``)
 
            k
                 The order of the polynomials used in the Becke partitioning.
+
+           threshold
+                Atoms whose contributions to the cell functions are below
+                this threshold are left out of the neighbor lists, see
+                ``get_becke_neighbors``. When set to None, all atom pairs are
+                included.
+
+           blocksize
+                The maximum number of grid points processed at once. The points
+                are grouped in compact blocks, see ``_get_blocks``.
+
+           onepass
+                When True and local=False, the weights of all atoms are
+                computed in a single pass over the molecular grid, see
+                ``update_at_weights_onepass``. With local=True, every atom has
+                its own points, so the weights are always computed per atom.
         """
         self._k = k
+        self._threshold = threshold
+        self._blocksize = blocksize
+        self._onepass = onepass
         WPart.__init__(self, coordinates, numbers, pseudo_numbers, grid,
                        moldens, spindens, local, lmax)
+        # Everything that only depends on the geometry is computed once.
+        self._radii = get_becke_radii(self.numbers)
+        self._alphas = _get_becke_alphas(self._radii)
+        deltas = self.coordinates[:, None, :] - self.coordinates
+        self._distances = np.sqrt((deltas**2).sum(axis=2))
+        if onepass and local:
+            log.warning('The one-pass Becke weights require local=False. '
+                        'Computing the weights per atom.')
 
     def _init_log_scheme(self):
-        print('5: Initialized: %s' % self)
-        print([
-            ('5: Scheme', 'Becke'),
-            ('5: Switching function', 'k=%i' % self._k),
+        log.info('Initialized: %s', self)
+        log_table([
+            ('Scheme', 'Becke'),
+            ('Switching function', 'k=%i' % self._k),
+            ('Screening threshold', self._threshold),
         ])
         self.biblio.append(['becke1988_multicenter', 'the use of Becke partitioning'])
         self.biblio.append(['slater1964', 'the Brag-Slater radii used in the Becke partitioning'])
 
     def update_at_weights(self):
-        print('5:Computing Becke weights.')
-
-        # The list of radii is constructed to be as close as possible to
-        # the original values used by Becke.
-        radii = []
-        for number in self.numbers:
-            if number == 1:
-                # exception defined in Becke's paper
-                radius = 0.35 * angstrom
-            else:
-                radius = radius_becke[number]
-                if radius is None:
-                    # for cases not covered by Brag-Slater
-                    radius = radius_covalent[number]
-            radii.append(radius)
-        radii = np.array(radii)
-
-        # Actual work
+        log.info('Computing Becke weights.')
+        if self._onepass and not self.local:
+            self.update_at_weights_onepass()
+            return
         for index in range(self.natom):
             grid = self.get_grid(index)
             at_weights = self.cache.load('at_weights', index, alloc=grid.shape)[0]
-            at_weights[:] = 1
-            becke_helper_atom(grid.points, at_weights, radii, self.coordinates, index, self._k)
+            self.compute_at_weights(index, grid.points, at_weights)
+
+    def compute_at_weights(self, index, points, output):
+        """Compute the Becke weights of one atom.
+
+           **Arguments:**
+
+           index
+                The index of the atom.
+
+           points
+                An array (npoint, 3) with grid points.
+
+           output
+                An array (npoint,) to which the weights are written.
+
+           The points are processed in compact blocks. For each block, only
+           the atoms returned by ``get_becke_neighbors`` contribute, which are
+           few for the many blocks close to a nucleus.
+        """
+        for block in self._iter_blocks(points):
+            neighbors = self._get_neighbors(points[block])
+            neighbors = np.union1d(neighbors, [index])
+            select = neighbors.searchsorted(index)
+            cell = self._compute_cell_functions(points[block], neighbors)
+            output[block] = cell[:, select] / cell.sum(axis=1)
+
+    def _iter_blocks(self, points):
+        """Iterate over blocks of point indexes, see ``_get_blocks``."""
+        if self._threshold is None:
+            for begin in range(0, len(points), self._blocksize):
+                yield np.arange(begin, min(begin + self._blocksize, len(points)))
+        else:
+            for block in _get_blocks(points, self._blocksize):
+                yield block
+
+    def _get_neighbors(self, points):
+        """Return the atoms that contribute to the weights on a block of points."""
+        if self._threshold is None:
+            return np.arange(self.natom)
+        return get_becke_neighbors(points, self.coordinates, self._distances,
+                                   self._alphas, self._k, self._threshold)
+
+    def _compute_cell_functions(self, points, neighbors):
+        """Return the cell functions of the given atoms on a block of points.
+
+           **Arguments:**
+
+           points
+                An array (npoint, 3) with grid points.
+
+           neighbors
+                The indexes of the atoms included in the cell functions.
+        """
+        deltas = points[:, None, :] - self.coordinates[neighbors]
+        radii = np.sqrt((deltas**2).sum(axis=2))
+        return _compute_becke_cell_functions(
+            radii, self._distances[neighbors][:, neighbors],
+            self._alphas[neighbors][:, neighbors], self._k)
+
+    def update_at_weights_onepass(self):
+        """Compute the Becke weights of all atoms in one pass over the molecular grid.
+
+           This is only used with local=False, when all atoms share the
+           points of the molecular grid. The cell functions at each point are
+           computed once and the normalized weights are written into the
+           ``at_weights`` arrays of all atoms. For each block of points, the
+           atoms returned by ``get_becke_neighbors`` are included.
+        """
+        # Allocate (or reset) all arrays first, so they can be filled in block by
+        # block. Atoms outside the neighbor list of a block get a zero weight.
+        all_at_weights = []
+        for index in range(self.natom):
+            at_weights = self.cache.load('at_weights', index, alloc=self.grid.shape)[0]
+            at_weights[:] = 0.0
+            all_at_weights.append(at_weights)
+
+        points = self.grid.points
+        for block in self._iter_blocks(points):
+            neighbors = self._get_neighbors(points[block])
+            cell = self._compute_cell_functions(points[block], neighbors)
+            cell /= cell.sum(axis=1)[:, None]
+            for ineighbor, index in enumerate(neighbors):
+                all_at_weights[index][block] = cell[:, ineighbor]
 
     def _get_k(self):
         """The order of the Becke switching function."""
@@ -26,10 +26,12 @@
 """
 
 
+from collections import OrderedDict
+
 import numpy as np
 
 
-__all__ = ["JustOnceClass", "just_once", "Cache"]
+__all__ = ["JustOnceClass", "just_once", "ArrayPool", "Cache"]
 
 
 class JustOnceClass(object):
@@ -90,9 +92,77 @@ def _normalize_tags(tags):
         return set(tags)
 
 
+class ArrayPool(object):
+    """Arrays that are no longer used by a Cache, kept for reuse.
+
+       A pool can be shared by the caches of several objects, e.g. the ``Part``
+       instances of subsequent frames of a trajectory. The arrays released by
+       one cache are then used for the equally shaped arrays allocated by the
+       next, such that a long series of computations reaches a steady state
+       without new large allocations.
+    """
+    def __init__(self, maxbytes=2**30):
+        """
+           **Optional arguments:**
+
+           maxbytes
+                The maximum number of bytes kept in the pool. When an array
+                does not fit, the arrays with the least recently used shapes
+                are discarded. When None, the pool is unbounded.
+        """
+        self._maxbytes = maxbytes
+        self._store = OrderedDict()
+        self.nbyte = 0
+        self.ntake = 0
+        self.nreuse = 0
+
+    def __len__(self):
+        return sum(len(arrays) for arrays in self._store.values())
+
+    def clear(self):
+        """Discard all arrays in the pool."""
+        self._store.clear()
+        self.nbyte = 0
+
+    def _get_arrays(self, key):
+        """Return the list of arrays for a key and mark it as recently used."""
+        arrays = self._store.pop(key, [])
+        self._store[key] = arrays
+        return arrays
+
+    def take(self, shape, dtype=float):
+        """Return an array filled with zeros, reused from the pool if possible."""
+        key = tuple(_normalize_alloc(shape)), np.dtype(dtype).str
+        self.ntake += 1
+        arrays = self._get_arrays(key)
+        if len(arrays) > 0:
+            array = arrays.pop()
+            self.nbyte -= array.nbytes
+            self.nreuse += 1
+            array[:] = 0
+            return array
+        return np.zeros(shape, dtype)
+
+    def give(self, array):
+        """Put an array in the pool. It must no longer be used elsewhere."""
+        if self._maxbytes is not None:
+            if array.nbytes > self._maxbytes:
+                return
+            # discard the arrays of the least recently used shapes
+            while self.nbyte + array.nbytes > self._maxbytes:
+                oldest = next(iter(self._store))
+                arrays = self._store[oldest]
+                if len(arrays) == 0:
+                    del self._store[oldest]
+                else:
+                    self.nbyte -= arrays.pop(0).nbytes
+        self._get_arrays((array.shape, array.dtype.str)).append(array)
+        self.nbyte += array.nbytes
+
+
 class CacheItem(object):
     """A container for an object stored in a Cache instance"""
-    def __init__(self, value, tags=None):
+    def __init__(self, value, tags=None, pooled=False):
         """
            **Arguments:**
 
@@ -103,17 +173,22 @@ class CacheItem(object):
 
            tags
                 Tags to be associated with the object
+
+           pooled
+                Whether the value is an array taken from an ``ArrayPool``.
         """
         self._value = value
         self._valid = True
         self._tags = _normalize_tags(tags)
+        self._pooled = pooled
 
     @classmethod
-    def from_alloc(cls, alloc, tags):
+    def from_alloc(cls, alloc, tags, pool=None):
         alloc = _normalize_alloc(alloc)
         # initialize a floating point array
-        array = np.zeros(alloc, float)
-        return cls(array, tags=tags)
+        if pool is None:
+            return cls(np.zeros(alloc, float), tags=tags)
+        return cls(pool.take(alloc, float), tags=tags, pooled=True)
 
     def check_alloc(self, alloc):
         alloc = _normalize_alloc(alloc)
@@ -177,14 +252,146 @@ def _normalize_key(key):
     return key
 
 
+def _get_family(key):
+    """Return the first part of a key, used to group items in memory reports"""
+    if isinstance(key, tuple):
+        return key[0]
+    return key
+
+
+def _get_nbyte(value):
+    """Return the number of bytes of a cached value, only counting arrays"""
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 0
+
+
 class Cache(object):
     """Object that stores previously computed results.
 
        The cache behaves like a dictionary with some extra features that can be
        used to avoid recomputation or reallocation.
+
+       The memory occupied by arrays in the cache is traced, see
+       ``get_memory_report``.
+
+       When the cache has an ``ArrayPool``, new arrays are taken from the pool.
+       They are only given back to the pool by ``release``, when the owner of
+       the cache knows that they are no longer used.
     """
-    def __init__(self):
+    def __init__(self, pool=None):
+        """
+           **Optional arguments:**
+
+           pool
+                An ``ArrayPool``, possibly shared with other caches.
+        """
+        self._pool = pool
         self._store = {}
+        # Memory tracing
+        self._families = {}
+        self._nbyte = 0
+        self._peak = 0
+
+    def _trace_add(self, key, value, counter):
+        """Account for a new value in the cache
+
+           **Arguments:**
+
+           key
+                The (normalized) key of the value.
+
+           value
+                The new value.
+
+           counter
+                The counter to increment: 'nalloc', 'nreuse' or 'ndump'.
+        """
+        family = _get_family(key)
+        record = self._families.get(family)
+        if record is None:
+            record = {'nbyte': 0, 'peak': 0, 'nalloc': 0, 'nreuse': 0, 'ndump': 0}
+            self._families[family] = record
+        record[counter] += 1
+        nbyte = _get_nbyte(value)
+        if nbyte > 0:
+            record['nbyte'] += nbyte
+            record['peak'] = max(record['peak'], record['nbyte'])
+            self._nbyte += nbyte
+            self._peak = max(self._peak, self._nbyte)
+
+    def _trace_remove(self, key, value):
+        """Account for a value that is removed from the cache"""
+        nbyte = _get_nbyte(value)
+        if nbyte > 0:
+            self._families[_get_family(key)]['nbyte'] -= nbyte
+            self._nbyte -= nbyte
+
+    def _get_pool(self):
+        return self._pool
+
+    pool = property(_get_pool)
+
+    def release(self):
+        """Remove all items and give their arrays back to the pool.
+
+           Only the arrays allocated by ``load`` are given back. The pool hands
+           them out again and overwrites them, so the caller must make sure
+           that these arrays, or views of them, are no longer used after this
+           call. Results that are needed later must be copied first. Without a
+           pool, this is equivalent to ``clear(dealloc=True)``.
+        """
+        items = list(self._store.values())
+        self.clear(dealloc=True)
+        if self._pool is not None:
+            for item in items:
+                if item._pooled:
+                    self._pool.give(item._value)
+
+    def get_memory_report(self):
+        """Return a report of the memory used by the arrays in the cache.
+
+           Items are grouped in families by the first part of their key, e.g.
+           all ``('at_weights', index)`` items belong to the ``at_weights``
+           family. Invalidated items that are not deallocated still count,
+           because they keep their memory for later reuse.
+
+           **Returns:** a dictionary with the following items:
+
+           nbyte
+                The number of bytes currently used.
+
+           peak
+                The high-water mark of the number of bytes.
+
+           families
+                A dictionary with a dictionary for each family with the
+                following items: ``nbyte`` and ``peak`` (as above, but for the
+                family), ``nalloc`` (the number of arrays allocated by
+                ``load``), ``nreuse`` (the number of times the memory of an
+                invalidated item was reused by ``load``) and ``ndump`` (the
+                number of values stored with ``dump``).
+
+           pool
+                Only present when the cache has an ``ArrayPool``. A dictionary
+                with the following items: ``nbyte`` (the number of bytes kept
+                in the pool), ``narray`` (the number of arrays in the pool),
+                ``ntake`` (the number of arrays taken from the pool) and
+                ``nreuse`` (how many of these were recycled).
+        """
+        result = {
+            'nbyte': self._nbyte,
+            'peak': self._peak,
+            'families': dict((family, record.copy()) for family, record in self._families.items()),
+        }
+        if self._pool is not None:
+            result['pool'] = {
+                'nbyte': self._pool.nbyte,
+                'narray': len(self._pool),
+                'ntake': self._pool.ntake,
+                'nreuse': self._pool.nreuse,
+            }
+        return result
 
     def clear(self, **kwargs):
         """Clear all items in the cache
@@ -232,6 +439,7 @@ class Cache(object):
             cleared = item.clear()
         if not cleared:
             del self._store[key]
+            self._trace_remove(key, item._value)
 
     def load(self, *key, **kwargs):
         """Get a value from the cache
@@ -286,8 +494,9 @@ class Cache(object):
             # alloc is given. hence two return values: value, new
             if item is None:
                 # allocate a new item and store it
-                item = CacheItem.from_alloc(alloc, tags)
+                item = CacheItem.from_alloc(alloc, tags, self._pool)
                 self._store[key] = item
+                self._trace_add(key, item._value, 'nalloc')
                 return item.value, True
             elif not item.valid:
                 try:
@@ -295,10 +504,13 @@ class Cache(object):
                     item.check_alloc(alloc)
                     item._valid = True  # as if it is newly allocated
                     item.check_tags(tags)
+                    self._trace_add(key, None, 'nreuse')
                 except TypeError:
                     # if reuse fails, reallocate
-                    item = CacheItem.from_alloc(alloc, tags)
+                    self._trace_remove(key, item._value)
+                    item = CacheItem.from_alloc(alloc, tags, self._pool)
                     self._store[key] = item
+                    self._trace_add(key, item._value, 'nalloc')
                 return item.value, True
             else:
                 item.check_alloc(alloc)
@@ -349,8 +561,12 @@ class Cache(object):
             raise TypeError("At least two arguments are required: key1 and value.")
         key = _normalize_key(args[:-1])
         value = args[-1]
+        old_item = self._store.get(key)
+        if old_item is not None:
+            self._trace_remove(key, old_item._value)
         item = CacheItem(value, tags)
         self._store[key] = item
+        self._trace_add(key, value, 'ndump')
 
     def __len__(self):
         return sum(item.valid for item in self._store.values())
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Gaussian Iterative Stockholder Analysis (GISA) partitioning"""
+
+
+import numpy as np
+from scipy.optimize import nnls
+
+from .stockholder import StockholderWPart
+from .iterstock import IterativeProatomMixin
+from .log import log, log_table
+
+
+__all__ = ['GaussianIterativeStockholderWPart']
+
+
+def _get_gisa_exponents(number, ratio=2.5):
+    """Return the exponents of the s-type Gaussians for an element.
+
+       The exponents form an even-tempered series, from 0.1 to about 10 Z^2,
+       which covers the valence and the core density.
+    """
+    alpha_min = 0.1
+    alpha_max = 10.0 * number**2
+    nbasis = int(np.ceil(np.log(alpha_max / alpha_min) / np.log(ratio))) + 1
+    return alpha_min * ratio**np.arange(nbasis)
+
+
+def _eval_gisa_proatom(distances, propars, alphas, output, deriv=None, work=None):
+    """Evaluate a GISA proatom, a sum of normalized s-type Gaussians.
+
+       **Arguments:**
+
+       distances
+            An array with the distances of the points to the nucleus.
+
+       propars
+            The populations of the Gaussians.
+
+       alphas
+            The exponents of the Gaussians.
+
+       output
+            An array with the same shape as distances for the density.
+
+       **Optional arguments:**
+
+       deriv
+            An array with the same shape as distances for the radial derivative
+            of the density.
+
+       work
+            A work array with the same shape as distances. When not given, it
+            is allocated.
+    """
+    if work is None:
+        work = np.empty(distances.shape)
+    output[:] = 0.0
+    if deriv is not None:
+        deriv[:] = 0.0
+    for population, alpha in zip(propars, alphas):
+        np.multiply(distances, distances, out=work)
+        work *= -alpha
+        np.exp(work, out=work)
+        work *= population * (alpha / np.pi)**1.5
+        output += work
+        if deriv is not None:
+            work *= distances
+            work *= -2 * alpha
+            deriv += work
+
+
+def _opt_gisa_propars(rho, basis, weights, population=None):
+    """Fit the populations of the Gaussians to a spherically averaged density.
+
+       The populations minimize the integral of the squared difference between
+       the proatom and the spherically averaged density, subject to the
+       constraints that all populations are non-negative and that they add up
+       to the population of the atom.
+
+       **Arguments:**
+
+       rho
+            The spherically averaged density on the radial grid.
+
+       basis
+            An array with shape (nbasis, nrad) with the normalized Gaussians
+            on the radial grid.
+
+       weights
+            The integration weights of the radial grid.
+
+       **Optional arguments:**
+
+       population
+            The population of the atom. When not given, it is the integral of
+            rho.
+
+       **Returns:** the optimized populations.
+    """
+    if population is None:
+        population = np.dot(weights, rho)
+    sqrt_weights = np.sqrt(weights)
+    a = basis.T * sqrt_weights[:, None]
+    b = rho * sqrt_weights
+    # The equality constraint is added as an extra row with a large weight,
+    # such that it is satisfied to nearly machine precision by NNLS.
+    scale = 1e3 * np.sqrt((a * a).sum(axis=0)).max()
+    a = np.vstack([a, np.full(len(basis), scale)])
+    b = np.append(b, scale * population)
+    return nnls(a, b)[0]
+
+
+class GaussianIterativeStockholderWPart(IterativeProatomMixin, StockholderWPart):
+    """Gaussian Iterative Stockholder Partitioning with Becke-Lebedev grids
+
+       The proatoms are expansions in a fixed set of normalized s-type
+       Gaussians with non-negative populations, which are fitted to the spherically
+       averaged atomic densities in every iteration. Compared to Iterative
+       Stockholder partitioning, the proatoms have only a few parameters and
+       the iterations converge faster.
+    """
+    name = 'gisa'
+    options = ['lmax', 'threshold', 'maxiter', 'freeze_threshold']
+    linear = False
+    atom_outputs = StockholderWPart.atom_outputs + ['atom_changes']
+
+    def __init__(self, coordinates, numbers, pseudo_numbers, grid, moldens,
+                 spindens=None, lmax=3, threshold=1e-6, maxiter=500,
+                 freeze_threshold=None, freeze_count=3, freeze_recheck=10, history=100,
+                 callbacks=None):
+        """
+           **Optional arguments:** (that are not defined in ``WPart``)
+
+           threshold
+                The procedure is considered to be converged when the maximum
+                change of the charges between two iterations drops below this
+                threshold.
+
+           maxiter
+                The maximum number of iterations. If no convergence is reached
+                in the end, no warning is given.
+
+           freeze_threshold, freeze_count, freeze_recheck
+                See ``IterativeProatomMixin._init_freeze``.
+
+           history
+                How the history of the proatom parameters and charges is kept.
+                See ``IterationHistory``.
+
+           callbacks
+                A list of functions called after every iteration, which can
+                stop the iterations. See ``IterativeProatomMixin.do_partitioning``.
+        """
+        self._threshold = threshold
+        self._maxiter = maxiter
+        self._history_spec = history
+        self._callbacks = [] if callbacks is None else list(callbacks)
+        self._init_freeze(freeze_threshold, freeze_count, freeze_recheck)
+        StockholderWPart.__init__(self, coordinates, numbers, pseudo_numbers,
+                                  grid, moldens, spindens, True, lmax)
+
+    def _init_log_scheme(self):
+        log.info('Initialized: %s', self)
+        log_table([
+            ('Scheme', 'Gaussian Iterative Stockholder (GISA)'),
+            ('Convergence threshold', '%.1e' % self._threshold),
+            ('Maximum iterations', self._maxiter),
+        ])
+        self.biblio.append(['verstraelen2012', 'the use of Gaussian Iterative Stockholder partitioning'])
+
+    def get_memory_estimates(self):
+        return StockholderWPart.get_memory_estimates(self) + [
+            ('Distances', np.zeros(self.natom), self.natom),
+        ]
+
+    def get_rgrid(self, iatom):
+        return self.get_grid(iatom).rgrid
+
+    def get_proatom_rho(self, iatom, propars=None):
+        if propars is None:
+            propars = self.cache.load('propars')
+        r = self.get_rgrid(iatom).radii
+        y = np.zeros(len(r), float)
+        d = np.zeros(len(r), float)
+        my_propars = self._get_atom_propars(iatom, propars)
+        _eval_gisa_proatom(r, my_propars, self._alphas[iatom], y, d)
+        return y, d
+
+    def eval_proatom(self, iatom, output, grid):
+        # The proatom is evaluated analytically.
+        with self.timer.section('eval_proatom'):
+            my_propars = self._get_atom_propars(iatom, self.cache.load('propars'))
+            if grid is self.grid:
+                distances = self.get_distances(iatom)
+                work = self.cache.load('work_proatom', alloc=grid.shape)[0]
+            else:
+                deltas = grid.points - self.coordinates[iatom]
+                distances = np.sqrt((deltas**2).sum(axis=1))
+                work = None
+            _eval_gisa_proatom(distances, my_propars, self._alphas[iatom], output, work=work)
+        output += 1e-100
+        assert np.isfinite(output).all()
+
+    def _get_atom_propars(self, iatom, propars):
+        return propars[self._ranges[iatom]:self._ranges[iatom + 1]]
+
+    def _init_propars(self):
+        IterativeProatomMixin._init_propars(self)
+        self._ranges = [0]
+        self._alphas = []
+        self._bases = []
+        for iatom in range(self.natom):
+            alphas = _get_gisa_exponents(self.numbers[iatom])
+            self._ranges.append(self._ranges[-1] + len(alphas))
+            self._alphas.append(alphas)
+            # The Gaussians on the radial grid, used in every iteration.
+            r = self.get_rgrid(iatom).radii
+            self._bases.append((alphas[:, None] / np.pi)**1.5 * np.exp(-alphas[:, None] * r**2))
+        ntotal = self._ranges[-1]
+        propars = self.cache.load('propars', alloc=ntotal, tags='o')[0]
+        for iatom in range(self.natom):
+            # Start with equal populations.
+            nbasis = len(self._alphas[iatom])
+            propars[self._ranges[iatom]:self._ranges[iatom + 1]] = self.pseudo_numbers[iatom] / nbasis
+        return propars
+
+    def _prepare_update_propars(self, iatoms):
+        self._compute_spherical_averages(iatoms)
+
+    def _update_propars_atom(self, iatom):
+        # spherical average, see _prepare_update_propars
+        rgrid = self.get_rgrid(iatom)
+        spherical_average = self.cache.load('spherical_average', iatom)
+
+        pseudo_population = rgrid.integrate(spherical_average)
+
+        # assign as new propars
+        my_propars = self._get_atom_propars(iatom, self.cache.load('propars'))
+        with self.timer.section('gisa_inner_solve'):
+            my_propars[:] = _opt_gisa_propars(spherical_average, self._bases[iatom], rgrid.weights,
+                                              pseudo_population)
+
+        # compute the new charge
+        charges = self.cache.load('charges', alloc=self.natom, tags='o')[0]
+        charges[iatom] = self.pseudo_numbers[iatom] - pseudo_population
@@ -20,9 +20,8 @@
 # --
 """Hirshfeld partitioning"""
 
-from __future__ import print_function
-
 from .cache import just_once
+from .log import log, log_table
 from .stockholder import StockholderWPart
 
 
@@ -45,16 +44,17 @@ class HirshfeldMixin(object):
     name = 'h'
     options = ['lmax']
     linear = True
+    atom_outputs = StockholderWPart.atom_outputs + ['volumes', 'volume_ratios', 'c6s']
 
     def __init__(self, numbers, pseudo_numbers, proatomdb):
         check_proatomdb(numbers, pseudo_numbers, proatomdb)
         self._proatomdb = proatomdb
 
     def _init_log_scheme(self):
-        print('5: Initialized: %s' % self)
-        print([
-            ('5: Scheme', 'Hirshfeld'),
-            ('5: Proatomic DB', self.proatomdb),
+        log.info('Initialized: %s', self)
+        log_table([
+            ('Scheme', 'Hirshfeld'),
+            ('Proatomic DB', self.proatomdb),
         ])
         self.biblio.append(['hirshfeld1977', 'the use of Hirshfeld partitioning'])
 
@@ -70,10 +70,32 @@ class HirshfeldMixin(object):
     def get_proatom_rho(self, index):
         return self.proatomdb.get_rho(self.numbers[index], do_deriv=True)
 
+    def get_somefn(self, index, spline, key, label, grid):
+        key = key + (index, id(grid))
+        result, new = self.cache.load(*key, alloc=grid.shape)
+        if new:
+            self.eval_spline(index, spline, result, grid, label)
+        return result
+
+    def get_isolated(self, index, charge, grid):
+        number = self.numbers[index]
+        spline = self.proatomdb.get_spline(number, charge)
+        return self.get_somefn(index, spline, ('isolated', charge), 'isolated q=%+i' % charge, grid)
+
+    def eval_proatom(self, index, output, grid):
+        # Reuse the neutral isolated atom if it is present in the cache, e.g.
+        # when it is shared with Hirshfeld-I by a MultiWPart.
+        key = ('isolated', 0, index, id(grid))
+        if key in self.cache:
+            output[:] = self.cache.load(*key)
+            output += 1e-100
+        else:
+            StockholderWPart.eval_proatom(self, index, output, grid)
+
     @just_once
     def do_dispersion(self):
         if self.lmax < 3:
-            print('5:!WARNING! Skip computing dispersion coefficients because lmax=%i<3' % self.lmax)
+            log.warning('Skip computing dispersion coefficients because lmax=%i<3', self.lmax)
             return
 
             self.biblio.append(['tkatchenko2009', 'the method to evaluate atoms-in-molecules C6 parameters'])
@@ -99,7 +121,7 @@ class HirshfeldMixin(object):
             self.do_moments()
             radial_moments = self._cache.load('radial_moments')
 
-            print('5:Computing atomic dispersion coefficients.')
+            log.info('Computing atomic dispersion coefficients.')
 
             for i in range(self.natom):
                 n = self.numbers[i]
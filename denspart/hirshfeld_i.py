@@ -21,12 +21,11 @@
 """Iterative Hirshfeld (HI) partitioning"""
 
 
-from __future__ import print_function
-
 import numpy as np
 
 from .hirshfeld import HirshfeldWPart
 from .iterstock import IterativeProatomMixin
+from .log import log, log_table
 
 
 __all__ = ["HirshfeldIWPart"]
@@ -34,20 +33,25 @@ __all__ = ["HirshfeldIWPart"]
 
 class HirshfeldIMixin(IterativeProatomMixin):
     name = 'hi'
-    options = ['lmax', 'threshold', 'maxiter']
+    options = ['lmax', 'threshold', 'maxiter', 'freeze_threshold']
     linear = False
+    atom_outputs = HirshfeldWPart.atom_outputs + ['atom_changes']
 
-    def __init__(self, threshold=1e-6, maxiter=500):
+    def __init__(self, threshold=1e-6, maxiter=500, freeze_threshold=None, freeze_count=3,
+                 freeze_recheck=10, history=100, callbacks=None):
         self._threshold = threshold
         self._maxiter = maxiter
+        self._history_spec = history
+        self._callbacks = [] if callbacks is None else list(callbacks)
+        self._init_freeze(freeze_threshold, freeze_count, freeze_recheck)
 
     def _init_log_scheme(self):
-        print('5: Initialized: %s' % self)
-        print([
-            ('5: Scheme', 'Hirshfeld-I'),
-            ('5: Convergence threshold', '%.1e' % self._threshold),
-            ('5: Maximum iterations', self._maxiter),
-            ('5: Proatomic DB', self._proatomdb),
+        log.info('Initialized: %s', self)
+        log_table([
+            ('Scheme', 'Hirshfeld-I'),
+            ('Convergence threshold', '%.1e' % self._threshold),
+            ('Maximum iterations', self._maxiter),
+            ('Proatomic DB', self._proatomdb),
         ])
         self.biblio.append(['bultinck2007', 'the use of Hirshfeld-I partitioning'])
 
@@ -75,17 +79,8 @@ class HirshfeldIMixin(IterativeProatomMixin):
         elif pseudo_pop <= 0:
             raise ValueError('Requesting a pro-atom with a negative (pseudo) population')
 
-    def get_somefn(self, index, spline, key, label, grid):
-        key = key + (index, id(grid))
-        result, new = self.cache.load(*key, alloc=grid.shape)
-        if new:
-            self.eval_spline(index, spline, result, grid, label)
-        return result
-
-    def get_isolated(self, index, charge, grid):
-        number = self.numbers[index]
-        spline = self.proatomdb.get_spline(number, charge)
-        return self.get_somefn(index, spline, ('isolated', charge), 'isolated q=%+i' % charge, grid)
+    def _get_atom_propars(self, index, propars):
+        return propars[index:index + 1]
 
     def eval_proatom(self, index, output, grid):
         # Greedy version of eval_proatom
@@ -105,9 +100,14 @@ class HirshfeldIMixin(IterativeProatomMixin):
         self.cache.dump('propars', charges, tags='o')
         return charges
 
+    def _prepare_update_propars(self, indexes):
+        # The populations of all atoms are computed at once.
+        pseudo_populations = self.cache.load('work_pseudo_populations', alloc=self.natom)[0]
+        pseudo_populations[indexes] = self.compute_pseudo_populations(indexes)
+
     def _update_propars_atom(self, index):
-        # Compute population
-        pseudo_population = self.compute_pseudo_population(index)
+        # Population, see _prepare_update_propars
+        pseudo_population = self.cache.load('work_pseudo_populations')[index]
 
         # Store charge
         charges = self.cache.load('charges')
@@ -119,7 +119,8 @@ class HirshfeldIWPart(HirshfeldIMixin, HirshfeldWPart):
 
     def __init__(self, coordinates, numbers, pseudo_numbers, grid, moldens,
                  proatomdb, spindens=None, local=True, lmax=3, threshold=1e-6,
-                 maxiter=500):
+                 maxiter=500, freeze_threshold=None, freeze_count=3, freeze_recheck=10,
+                 history=100, callbacks=None):
         """
            **Arguments:** (that are not defined in ``WPart``)
 
@@ -137,8 +138,20 @@ class HirshfeldIWPart(HirshfeldIMixin, HirshfeldWPart):
            maxiter
                 The maximum number of iterations. If no convergence is reached
                 in the end, no warning is given.
+
+           freeze_threshold, freeze_count, freeze_recheck
+                See ``IterativeProatomMixin._init_freeze``.
+
+           history
+                How the history of the proatom parameters and charges is kept.
+                See ``IterationHistory``.
+
+           callbacks
+                A list of functions called after every iteration, which can
+                stop the iterations. See ``IterativeProatomMixin.do_partitioning``.
         """
-        HirshfeldIMixin.__init__(self, threshold, maxiter)
+        HirshfeldIMixin.__init__(self, threshold, maxiter, freeze_threshold, freeze_count,
+                                 freeze_recheck, history, callbacks)
         HirshfeldWPart.__init__(self, coordinates, numbers, pseudo_numbers,
                                 grid, moldens, proatomdb, spindens, local, lmax)
 
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Bounded storage for the history of iterative partitioning schemes"""
+
+
+import numbers
+
+import h5py as h5
+import numpy as np
+
+
+__all__ = ['IterationHistory']
+
+
+class IterationHistory(object):
+    """Keeps arrays of past iterations, e.g. the proatom parameters and charges.
+
+       Three modes are supported, depending on the ``spec`` argument of the
+       constructor:
+
+       * ``None`` or ``0``: no history is kept.
+
+       * A positive integer K: a ring buffer with the last K iterations.
+
+       * An h5py group or a filename: all iterations are written to HDF5
+         datasets, one row per iteration. A file opened from a filename is
+         owned by the history and must be closed with ``close``. A group
+         passed by the caller is left open.
+
+       In all modes, the memory usage does not grow with the number of
+       iterations.
+    """
+    def __init__(self, spec):
+        """
+           **Arguments:**
+
+           spec
+                The mode, see class docstring.
+        """
+        self._size = None
+        self._group = None
+        self._owns_file = False
+        self._buffers = {}
+        self._counts = {}
+        if spec is None or (isinstance(spec, numbers.Integral) and spec == 0):
+            self._mode = 'off'
+        elif isinstance(spec, numbers.Integral):
+            if spec < 0:
+                raise ValueError('The size of the history must be positive.')
+            self._mode = 'ring'
+            self._size = spec
+        elif hasattr(spec, 'create_dataset'):
+            self._mode = 'hdf5'
+            self._group = spec
+        else:
+            self._mode = 'hdf5'
+            self._group = h5.File(spec, 'a')
+            self._owns_file = True
+
+    def _get_mode(self):
+        return self._mode
+
+    mode = property(_get_mode)
+
+    def _get_owns_file(self):
+        return self._owns_file
+
+    owns_file = property(_get_owns_file)
+
+    def __len__(self):
+        """The number of iterations that were appended, including discarded ones."""
+        return max(list(self._counts.values()) + [0])
+
+    def append(self, key, array):
+        """Add the array of one iteration.
+
+           **Arguments:**
+
+           key
+                The name of the history, e.g. 'history_propars'.
+
+           array
+                The array of the current iteration. It is copied.
+        """
+        if self._mode == 'off':
+            return
+        if self._group is None and self._mode == 'hdf5':
+            raise RuntimeError('The history is closed.')
+        array = np.asarray(array)
+        count = self._counts.get(key, 0)
+        if self._mode == 'ring':
+            buf = self._buffers.get(key)
+            if buf is None:
+                buf = np.zeros((self._size,) + array.shape, array.dtype)
+                self._buffers[key] = buf
+            buf[count % self._size] = array
+        else:
+            dataset = self._buffers.get(key)
+            if dataset is None:
+                # Start from scratch, also when the dataset exists from an earlier run.
+                if key in self._group:
+                    del self._group[key]
+                dataset = self._group.create_dataset(
+                    key, (0,) + array.shape, array.dtype, maxshape=(None,) + array.shape,
+                    chunks=(1,) + array.shape)
+                self._buffers[key] = dataset
+            dataset.resize(count + 1, axis=0)
+            dataset[count] = array
+        self._counts[key] = count + 1
+
+    def get(self, key):
+        """Return the stored iterations, oldest first.
+
+           In the 'ring' mode, a new array is returned. In the 'hdf5' mode,
+           the HDF5 dataset is returned, such that it is not loaded into
+           memory. In the 'off' mode, None is returned.
+        """
+        if self._mode == 'off' or key not in self._buffers:
+            return None
+        if self._mode == 'ring':
+            count = self._counts[key]
+            buf = self._buffers[key]
+            if count <= self._size:
+                return buf[:count].copy()
+            begin = count % self._size
+            return np.concatenate([buf[begin:], buf[:begin]])
+        return self._buffers[key]
+
+    def close(self):
+        """Flush and close the HDF5 file, if it is owned by the history.
+
+           Afterwards, nothing can be appended and ``get`` returns None. A
+           group passed by the caller is not closed. Closing twice is allowed.
+        """
+        if self._owns_file and self._group is not None:
+            self._group.flush()
+            self._group.close()
+            self._group = None
+            self._buffers = {}
@@ -21,67 +21,288 @@
 """Iterative Stockholder Analysis (ISA) partitioning"""
 
 
-from __future__ import print_function
-
 import numpy as np
 
 from .cache import just_once
+from .history import IterationHistory
+from .log import log, log_table
+from .spherical import SphericalAverager
 from .stockholder import StockholderWPart
 
 
-__all__ = ["IterativeProatomMixin", "IterativeStockholderWPart"]
+__all__ = ["ChargesConvergedCallback", "IterativeProatomMixin", "IterativeStockholderWPart"]
+
+
+class ChargesConvergedCallback(object):
+    """Iteration callback that stops when the charges are stable.
+
+       This is useful when only the charges are needed, which usually converge
+       well before the proatoms.
+    """
+    def __init__(self, threshold=1e-4):
+        """
+           **Optional arguments:**
+
+           threshold
+                The iterations are stopped when the maximum change of the charges
+                between two iterations drops below this threshold.
+        """
+        self.threshold = threshold
+        self._last_charges = None
+
+    def __call__(self, part, info):
+        charges = info['charges']
+        last_charges = self._last_charges
+        self._last_charges = charges.copy()
+        if last_charges is None:
+            return False
+        return abs(charges - last_charges).max() < self.threshold
 
 
 class IterativeProatomMixin():
+    # Freezing of converged atoms is disabled unless _init_freeze is called.
+    _freeze_threshold = None
+    _frozen = None
+    # By default, a ring buffer with the last 100 iterations is kept.
+    _history_spec = 100
+    # Functions called after every iteration, see do_partitioning.
+    _callbacks = ()
+    # Created when the first spherical averages are computed.
+    _spherical_averager = None
+    # Initial proatom parameters, see seed_propars.
+    _seed_propars = None
+
     def compute_change(self, propars1, propars2):
-        """Compute the difference between an old and a new proatoms"""
-        # Compute mean-square deviation
-        msd = 0.0
+        """Compute the difference between an old and a new proatoms
+
+           The radial density of the last proatom of each atom is kept, such
+           that, in a regular iteration, only the new proatom densities are
+           constructed. The contributions of the individual atoms are stored
+           in the cache as ``atom_changes``.
+        """
+        atom_changes = self.cache.load('atom_changes', alloc=self.natom, tags='o')[0]
         for index in range(self.natom):
             rgrid = self.get_rgrid(index)
-            rho1, deriv1 = self.get_proatom_rho(index, propars1)
-            rho2, deriv2 = self.get_proatom_rho(index, propars2)
+            rho2 = self._get_proatom_rho_cached(index, propars2)
+            rho1 = self._get_proatom_rho_cached(index, propars1)
             delta = rho1 - rho2
-            msd += rgrid.integrate(delta, delta)
-        return np.sqrt(msd)
+            atom_changes[index] = np.sqrt(rgrid.integrate(delta, delta))
+        # Root of the total mean-square deviation
+        return np.sqrt((atom_changes**2).sum())
+
+    def _get_atom_propars(self, index, propars):
+        """Return the part of propars that determines the proatom of one atom."""
+        return propars
+
+    def _get_proatom_rho_cached(self, index, propars):
+        """Return the radial proatom density, reusing the last one if possible."""
+        atom_propars = self._get_atom_propars(index, propars)
+        last = self._last_proatom_rhos.get(index)
+        if last is not None and np.array_equal(last[0], atom_propars):
+            return last[1]
+        rho = self.get_proatom_rho(index, propars)[0]
+        # Copies are needed because propars may be modified in place later.
+        self._last_proatom_rhos[index] = (atom_propars.copy(), rho.copy())
+        return rho
+
+    def seed_propars(self, propars):
+        """Start the iterations from given proatom parameters.
+
+           **Arguments:**
+
+           propars
+                An array with the same layout as the ``propars`` item in the
+                cache, e.g. the converged parameters of a related scheme. It is
+                copied and used instead of the default initial guess.
+        """
+        self._seed_propars = np.array(propars, float)
+
+    def _init_freeze(self, freeze_threshold=None, freeze_count=3, freeze_recheck=10):
+        """Configure the freezing of converged atoms.
+
+           **Optional arguments:**
+
+           freeze_threshold
+                When given, an atom is frozen once the change of its proatom
+                stayed below this threshold for ``freeze_count`` consecutive
+                iterations. Frozen atoms are not updated and their contribution
+                to the promolecule is not re-evaluated.
+
+           freeze_count
+                The number of consecutive iterations below freeze_threshold
+                needed to freeze an atom.
+
+           freeze_recheck
+                All atoms are unfrozen every ``freeze_recheck`` iterations and
+                before the iterations are considered to be converged. Atoms
+                whose change remains below freeze_threshold are frozen again
+                right away.
+        """
+        self._freeze_threshold = freeze_threshold
+        self._freeze_count = freeze_count
+        self._freeze_recheck = freeze_recheck
+        self._frozen = None
 
     def _init_propars(self):
-        self.history_propars = []
-        self.history_charges = []
+        # A file left open by an earlier run is closed before it is reopened.
+        if getattr(self, 'history', None) is not None:
+            self.history.close()
+        self.history = IterationHistory(self._history_spec)
+        self._last_proatom_rhos = {}
+        if self._freeze_threshold is not None:
+            self._frozen = np.zeros(self.natom, bool)
+            self._nconverged = np.zeros(self.natom, int)
+            self.cache.load('promoldens_frozen', alloc=self.grid.shape)[0][:] = 0.0
+
+    def _update_frozen(self, counter):
+        """Freeze and unfreeze atoms after an iteration.
+
+           **Returns:** True when atoms were unfrozen.
+        """
+        atom_changes = self.cache.load('atom_changes')
+        converged = atom_changes < self._freeze_threshold
+        self._nconverged[converged] += 1
+        self._nconverged[~converged] = 0
+        if counter % self._freeze_recheck == 0:
+            return self._unfreeze_all()
+        promoldens_frozen = self.cache.load('promoldens_frozen')
+        for index in range(self.natom):
+            if not self._frozen[index] and self._nconverged[index] >= self._freeze_count:
+                # Store the contributions of the proatom to the promolecule
+                # for later iterations.
+                work = self.grid.zeros()
+                self.eval_proatom(index, work, self.grid)
+                promoldens_frozen += work
+                self.cache.dump('proatdens_frozen', index, self.to_atomic_grid(index, work).copy())
+                self._frozen[index] = True
+        return False
+
+    def _unfreeze_all(self):
+        """Unfreeze all atoms. Returns True when some atoms were frozen."""
+        if not self._frozen.any():
+            return False
+        self._frozen[:] = False
+        self.cache.load('promoldens_frozen')[:] = 0.0
+        for index in range(self.natom):
+            self.cache.clear_item('proatdens_frozen', index, dealloc=True)
+        return True
+
+    def update_at_weights(self):
+        if self._frozen is None or not self._frozen.any():
+            StockholderWPart.update_at_weights(self)
+            return
+        # Same as in the StockholderWPart, except that the frozen proatoms are
+        # taken from the cache.
+        promoldens = self.cache.load('promoldens', alloc=self.grid.shape)[0]
+        promoldens[:] = self.cache.load('promoldens_frozen')
+        for index in range(self.natom):
+            grid = self.get_grid(index)
+            at_weights = self.cache.load('at_weights', index, alloc=grid.shape)[0]
+            if self._frozen[index]:
+                at_weights[:] = self.cache.load('proatdens_frozen', index)
+            else:
+                self.update_pro(index, at_weights, promoldens)
+        for index in range(self.natom):
+            at_weights = self.cache.load('at_weights', index)
+            at_weights /= self.to_atomic_grid(index, promoldens)
+            np.clip(at_weights, 0, 1, out=at_weights)
 
     def _update_propars(self):
         # Keep track of history
-        self.history_propars.append(self.cache.load('propars').copy())
+        self.history.append('history_propars', self.cache.load('propars'))
 
         # Update the partitioning based on the latest proatoms
-        self.update_at_weights()
-
-        # Update the proatoms
-        for index in range(self.natom):
+        with self.timer.section('update_at_weights'):
+            self.update_at_weights()
+
+        # Update the proatoms, except for the frozen ones
+        indexes = [index for index in range(self.natom)
+                   if self._frozen is None or not self._frozen[index]]
+        self._prepare_update_propars(indexes)
+        for index in indexes:
             self._update_propars_atom(index)
 
         # Keep track of history
-        self.history_charges.append(self.cache.load('charges').copy())
+        self.history.append('history_charges', self.cache.load('charges'))
+
+    def _prepare_update_propars(self, indexes):
+        """Do the work for all atoms that can be done at once, before the
+           proatoms of the given atoms are updated one by one."""
+        pass
 
     def _update_propars_atom(self, index):
         raise NotImplementedError
 
+    def _compute_spherical_averages(self, indexes):
+        """Compute the spherical averages of the atomic densities.
+
+           The results are stored in the cache as ``('spherical_average',
+           index)``. All atoms are treated at once, see ``SphericalAverager``.
+        """
+        if self._spherical_averager is None:
+            self._spherical_averager = SphericalAverager(
+                [self.get_grid(index) for index in range(self.natom)])
+        outputs = [self.cache.load('spherical_average', index, alloc=self.get_rgrid(index).size)[0]
+                   for index in indexes]
+        with self.timer.section('spherical_average'):
+            self._spherical_averager.compute(
+                indexes, lambda index: (self.cache.load('at_weights', index), self.get_moldens(index)),
+                outputs)
+        for output in outputs:
+            np.clip(output, 1e-100, np.inf, out=output)
+
     def _finalize_propars(self):
         charges = self._cache.load('charges')
-        self.cache.dump('history_propars', np.array(self.history_propars), tags='o')
-        self.cache.dump('history_charges', np.array(self.history_charges), tags='o')
+        if self.history.owns_file:
+            # The datasets can not be used after the file is closed. The
+            # history can be read from the file instead.
+            self.history.close()
+        elif self.history.mode != 'off':
+            self.cache.dump('history_propars', self.history.get('history_propars'), tags='o')
+            self.cache.dump('history_charges', self.history.get('history_charges'), tags='o')
         self.cache.dump('populations', self.numbers - charges, tags='o')
         self.cache.dump('pseudo_populations', self.pseudo_numbers - charges, tags='o')
 
+    def _call_callbacks(self, counter, change):
+        """Call the iteration callbacks.
+
+           **Returns:** True when one of the callbacks requests to stop.
+        """
+        if len(self._callbacks) == 0:
+            return False
+        info = {
+            'iteration': counter,
+            'change': change,
+            'charges': self.cache.load('charges'),
+            'timings': self.timer.report,
+        }
+        stop = False
+        for callback in self._callbacks:
+            # All callbacks are called, also when an earlier one requests to stop.
+            stop |= bool(callback(self, info))
+        return stop
+
     @just_once
     def do_partitioning(self):
+        """Iterate until the proatoms are converged.
+
+           After every iteration, each function in the ``callbacks`` argument
+           of the constructor is called as ``callback(part, info)``, where
+           ``info`` is a dictionary with the items ``iteration``, ``change``,
+           ``charges`` and ``timings``. When a callback returns True, the
+           iterations are stopped, as if they were converged.
+        """
         # Perform one general check in the beginning to avoid recomputation
         new = any(('at_weights', i) not in self.cache for i in range(self.natom))
         new |= 'niter' not in self.cache
         new |= 'change'not in self.cache
         if new:
             propars = self._init_propars()
-            print('5:Iteration       Change')
+            if self._seed_propars is not None:
+                if self._seed_propars.shape != propars.shape:
+                    raise TypeError('The seeded proatom parameters have the wrong shape.')
+                propars[:] = self._seed_propars
+            log.debug('Iteration       Change')
 
             counter = 0
             change = 1e100
@@ -91,14 +312,27 @@ class IterativeProatomMixin():
 
                 # Update the parameters that determine the pro-atoms.
                 old_propars = propars.copy()
-                self._update_propars()
+                with self.timer.section('iterations'):
+                    self._update_propars()
 
                 # Check for convergence
                 change = self.compute_change(propars, old_propars)
-                print('5:%9i   %10.5e' % (counter, change))
-                if change < self._threshold or counter >= self._maxiter:
+                log.debug('%9i   %10.5e', counter, change)
+                if self._call_callbacks(counter, change):
+                    log.info('Iterations stopped by a callback.')
                     break
-            print()
+                if counter >= self._maxiter:
+                    break
+                if self._frozen is None:
+                    if change < self._threshold:
+                        break
+                elif change < self._threshold:
+                    # Convergence also requires an iteration without frozen atoms.
+                    if not self._unfreeze_all():
+                        break
+                else:
+                    self._update_frozen(counter)
+            log.info('Iterations finished after %i iterations, change=%.5e', counter, change)
 
             self._finalize_propars()
             self.cache.dump('niter', counter, tags='o')
@@ -108,11 +342,14 @@ class IterativeProatomMixin():
 class IterativeStockholderWPart(IterativeProatomMixin, StockholderWPart):
     """Iterative Stockholder Partitioning with Becke-Lebedev grids"""
     name = 'is'
-    options = ['lmax', 'threshold', 'maxiter']
+    options = ['lmax', 'threshold', 'maxiter', 'freeze_threshold']
     linear = False
+    atom_outputs = StockholderWPart.atom_outputs + ['atom_changes']
 
     def __init__(self, coordinates, numbers, pseudo_numbers, grid, moldens,
-                 spindens=None, lmax=3, threshold=1e-6, maxiter=500):
+                 spindens=None, lmax=3, threshold=1e-6, maxiter=500,
+                 freeze_threshold=None, freeze_count=3, freeze_recheck=10, history=100,
+                 callbacks=None):
         """
            **Optional arguments:** (that are not defined in ``WPart``)
 
@@ -125,18 +362,37 @@ class IterativeStockholderWPart(IterativeProatomMixin, StockholderWPart):
                 The maximum number of iterations. If no convergence is reached
                 in the end, no warning is given.
                 Reduce the CPU cost at the expense of more memory consumption.
+
+           freeze_threshold, freeze_count, freeze_recheck
+                See ``IterativeProatomMixin._init_freeze``.
+
+           history
+                How the history of the proatom parameters and charges is kept.
+                None: not at all. An integer K: the last K iterations in memory.
+                An h5py group or a filename: all iterations in HDF5 datasets.
+                A file opened from a filename is closed after the iterations
+                and its datasets are not added to the cache. See
+                ``IterationHistory``.
+
+           callbacks
+                A list of functions called after every iteration, which can
+                stop the iterations. See ``IterativeProatomMixin.do_partitioning``
+                and ``ChargesConvergedCallback``.
         """
         self._threshold = threshold
         self._maxiter = maxiter
+        self._history_spec = history
+        self._callbacks = [] if callbacks is None else list(callbacks)
+        self._init_freeze(freeze_threshold, freeze_count, freeze_recheck)
         StockholderWPart.__init__(self, coordinates, numbers, pseudo_numbers,
                                   grid, moldens, spindens, True, lmax)
 
     def _init_log_scheme(self):
-        print('5: Initialized: %s' % self)
-        print([
-            ('5: Scheme', 'Iterative Stockholder'),
-            ('5: Convergence threshold', '%.1e' % self._threshold),
-            ('5: Maximum iterations', self._maxiter),
+        log.info('Initialized: %s', self)
+        log_table([
+            ('Scheme', 'Iterative Stockholder'),
+            ('Convergence threshold', '%.1e' % self._threshold),
+            ('Maximum iterations', self._maxiter),
         ])
         self.biblio.append(['lillestolen2008', 'the use of Iterative Stockholder partitioning'])
 
@@ -148,6 +404,9 @@ class IterativeStockholderWPart(IterativeProatomMixin, StockholderWPart):
             propars = self.cache.load('propars')
         return propars[self._ranges[index]:self._ranges[index + 1]], None
 
+    def _get_atom_propars(self, index, propars):
+        return propars[self._ranges[index]:self._ranges[index + 1]]
+
     def _init_propars(self):
         IterativeProatomMixin._init_propars(self)
         self._ranges = [0]
@@ -157,12 +416,13 @@ class IterativeStockholderWPart(IterativeProatomMixin, StockholderWPart):
         ntotal = self._ranges[-1]
         return self.cache.load('propars', alloc=ntotal, tags='o')[0]
 
+    def _prepare_update_propars(self, indexes):
+        self._compute_spherical_averages(indexes)
+
     def _update_propars_atom(self, index):
-        # compute spherical average
+        # spherical average, see _prepare_update_propars
         atgrid = self.get_grid(index)
-        dens = self.get_moldens(index)
-        at_weights = self.cache.load('at_weights', index)
-        spherical_average = np.clip(atgrid.get_spherical_average(at_weights, dens), 1e-100, np.inf)
+        spherical_average = self.cache.load('spherical_average', index)
 
         # assign as new propars
         propars = self.cache.load('propars')
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Logging, timing and counters
+
+   All screen output goes through the ``denspart`` logger of the standard
+   ``logging`` module. General progress is reported at the INFO level and the
+   output of every iteration at the DEBUG level, e.g. ::
+
+       import logging
+       logging.basicConfig()
+       logging.getLogger('denspart').setLevel(logging.INFO)
+
+   shows the progress without the output of each iteration.
+"""
+
+
+import logging
+import time
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+__all__ = ["log", "Timer"]
+
+
+log = logging.getLogger('denspart')
+
+
+def log_table(rows, level=logging.INFO):
+    """Log a list of (label, value) pairs as a two-column table."""
+    if log.isEnabledFor(level):
+        for label, value in rows:
+            log.log(level, '%-30s  %s', label, value)
+
+
+# Use the most accurate wall-clock timer available.
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+class Timer(object):
+    """Accumulates the wall time and the number of calls of labeled sections.
+
+       The report is a dictionary that is updated in place. Each label is
+       mapped to a dictionary with the number of calls (``count``) and, for
+       timed sections, the total wall time in seconds (``time``). The times of
+       nested sections are inclusive, i.e. the time of an inner section is
+       also included in the time of the outer section.
+    """
+    def __init__(self):
+        self._report = OrderedDict()
+
+    def _get_report(self):
+        return self._report
+
+    report = property(_get_report)
+
+    def _get_record(self, label, timed):
+        record = self._report.get(label)
+        if record is None:
+            record = {'count': 0}
+            self._report[label] = record
+        if timed and 'time' not in record:
+            record['time'] = 0.0
+        return record
+
+    @contextmanager
+    def section(self, label):
+        """Time a section of code, to be used in a with statement."""
+        record = self._get_record(label, True)
+        time0 = _timer()
+        try:
+            yield
+        finally:
+            record['time'] += _timer() - time0
+            record['count'] += 1
+
+    def count(self, label, increment=1):
+        """Increment a counter without measuring time."""
+        self._get_record(label, False)['count'] += increment
+
+    def reset(self):
+        """Forget all timings and counts."""
+        self._report.clear()
+
+    def format(self):
+        """Return a list of lines with a human-readable version of the report."""
+        lines = ['%30s  %8s  %10s' % ('Label', 'Count', 'Time[s]')]
+        for label, record in self._report.items():
+            if 'time' in record:
+                lines.append('%30s  %8i  %10.3f' % (label, record['count'], record['time']))
+            else:
+                lines.append('%30s  %8i' % (label, record['count']))
+        return lines
@@ -21,12 +21,11 @@
 """Minimal Basis Iterative Stockholder (MBIS) partitioning"""
 
 
-from __future__ import print_function
-
 import numpy as np
 
 from .stockholder import StockholderWPart
 from .iterstock import IterativeProatomMixin
+from .log import log, log_table
 
 
 __all__ = ['MBISWPart']
@@ -54,9 +53,49 @@ def _get_initial_mbis_propars(number):
     return propars
 
 
+def _eval_mbis_proatom(distances, propars, output, deriv=None, work=None):
+    """Evaluate an MBIS proatom, a sum of Slater functions.
+
+       **Arguments:**
+
+       distances
+            An array with the distances of the points to the nucleus.
+
+       propars
+            The populations and exponents of the shells, alternating.
+
+       output
+            An array with the same shape as distances for the density.
+
+       **Optional arguments:**
+
+       deriv
+            An array with the same shape as distances for the radial derivative
+            of the density.
+
+       work
+            A work array with the same shape as distances. When not given, it
+            is allocated.
+    """
+    if work is None:
+        work = np.empty(distances.shape)
+    output[:] = 0.0
+    if deriv is not None:
+        deriv[:] = 0.0
+    for ishell in range(len(propars) // 2):
+        N, S = propars[2 * ishell:2 * ishell + 2]
+        np.multiply(distances, -S, out=work)
+        np.exp(work, out=work)
+        work *= N * S**3 / (8 * np.pi)
+        output += work
+        if deriv is not None:
+            work *= S
+            deriv -= work
+
+
 def _opt_mbis_propars(rho, propars, rgrid, threshold):
     assert len(propars) % 2 == 0
-    nshell = len(propars) / 2
+    nshell = len(propars) // 2
     r = rgrid.radii
     terms = np.zeros((nshell, len(r)), float)
     oldpro = None
@@ -90,11 +129,15 @@ def _opt_mbis_propars(rho, propars, rgrid, threshold):
 class MBISWPart(IterativeProatomMixin, StockholderWPart):
     """Iterative Stockholder Partitioning with Becke-Lebedev grids"""
     name = 'mbis'
-    options = ['lmax', 'threshold', 'maxiter']
+    options = ['lmax', 'threshold', 'maxiter', 'freeze_threshold']
     linear = False
+    atom_outputs = StockholderWPart.atom_outputs + [
+        'atom_changes', 'core_charges', 'valence_charges', 'valence_widths']
 
     def __init__(self, coordinates, numbers, pseudo_numbers, grid, moldens,
-                 spindens=None, lmax=3, threshold=1e-6, maxiter=500):
+                 spindens=None, lmax=3, threshold=1e-6, maxiter=500,
+                 freeze_threshold=None, freeze_count=3, freeze_recheck=10, history=100,
+                 callbacks=None):
         """
            **Optional arguments:** (that are not defined in ``WPart``)
 
@@ -107,39 +150,77 @@ class MBISWPart(IterativeProatomMixin, StockholderWPart):
                 The maximum number of iterations. If no convergence is reached
                 in the end, no warning is given.
                 Reduce the CPU cost at the expense of more memory consumption.
+
+           freeze_threshold, freeze_count, freeze_recheck
+                See ``IterativeProatomMixin._init_freeze``.
+
+           history
+                How the history of the proatom parameters and charges is kept.
+                None: not at all. An integer K: the last K iterations in memory.
+                An h5py group or a filename: all iterations in HDF5 datasets.
+                A file opened from a filename is closed after the iterations
+                and its datasets are not added to the cache. See
+                ``IterationHistory``.
+
+           callbacks
+                A list of functions called after every iteration, which can
+                stop the iterations. See ``IterativeProatomMixin.do_partitioning``
+                and ``ChargesConvergedCallback``.
         """
         self._threshold = threshold
         self._maxiter = maxiter
+        self._history_spec = history
+        self._callbacks = [] if callbacks is None else list(callbacks)
+        self._init_freeze(freeze_threshold, freeze_count, freeze_recheck)
         StockholderWPart.__init__(self, coordinates, numbers, pseudo_numbers,
                                   grid, moldens, spindens, True, lmax)
 
     def _init_log_scheme(self):
-        print('5: Initialized: %s' % self)
-        print([
-            ('5: Scheme', 'Minimal Basis Iterative Stockholder (MBIS)'),
-            ('5: Convergence threshold', '%.1e' % self._threshold),
-            ('5: Maximum iterations', self._maxiter),
+        log.info('Initialized: %s', self)
+        log_table([
+            ('Scheme', 'Minimal Basis Iterative Stockholder (MBIS)'),
+            ('Convergence threshold', '%.1e' % self._threshold),
+            ('Maximum iterations', self._maxiter),
         ])
         self.biblio.append(['verstraelen2016', 'the use of MBIS partitioning'])
 
     def get_rgrid(self, iatom):
         return self.get_grid(iatom).rgrid
 
+    def get_memory_estimates(self):
+        return StockholderWPart.get_memory_estimates(self) + [
+            ('Distances', np.zeros(self.natom), self.natom),
+        ]
+
     def get_proatom_rho(self, iatom, propars=None):
         if propars is None:
             propars = self.cache.load('propars')
-        rgrid = self.get_rgrid(iatom)
-        r = rgrid.radii
+        r = self.get_rgrid(iatom).radii
         y = np.zeros(len(r), float)
         d = np.zeros(len(r), float)
         my_propars = propars[self._ranges[iatom]: self._ranges[iatom + 1]]
-        for ishell in range(self._nshells[iatom]):
-            N, S = my_propars[2 * ishell:2 * ishell + 2]
-            f = N * S**3 * np.exp(-S * r) / (8 * np.pi)
-            y += f
-            d -= S * f
+        _eval_mbis_proatom(r, my_propars, y, d)
         return y, d
 
+    def eval_proatom(self, iatom, output, grid):
+        # The proatom is evaluated analytically, which is cheaper and more
+        # accurate than the evaluation of a spline.
+        with self.timer.section('eval_proatom'):
+            my_propars = self._get_atom_propars(iatom, self.cache.load('propars'))
+            if grid is self.grid:
+                distances = self.get_distances(iatom)
+                work = self.cache.load('work_proatom', alloc=grid.shape)[0]
+            else:
+                deltas = grid.points - self.coordinates[iatom]
+                distances = np.sqrt((deltas**2).sum(axis=1))
+                work = None
+            _eval_mbis_proatom(distances, my_propars, output, work=work)
+        output += 1e-100
+        assert np.isfinite(output).all()
+
+    def _get_atom_propars(self, iatom, propars):
+        return propars[self._ranges[iatom]:self._ranges[iatom + 1]]
+
     def _init_propars(self):
         IterativeProatomMixin._init_propars(self)
         self._ranges = [0]
@@ -155,17 +236,18 @@ class MBISWPart(IterativeProatomMixin, StockholderWPart):
                     ] = _get_initial_mbis_propars(self.numbers[iatom])
         return propars
 
+    def _prepare_update_propars(self, iatoms):
+        self._compute_spherical_averages(iatoms)
+
     def _update_propars_atom(self, iatom):
-        # compute spherical average
-        atgrid = self.get_grid(iatom)
-        rgrid = atgrid.rgrid
-        dens = self.get_moldens(iatom)
-        at_weights = self.cache.load('at_weights', iatom)
-        spherical_average = np.clip(atgrid.get_spherical_average(at_weights, dens), 1e-100, np.inf)
+        # spherical average, see _prepare_update_propars
+        rgrid = self.get_rgrid(iatom)
+        spherical_average = self.cache.load('spherical_average', iatom)
 
         # assign as new propars
         my_propars = self.cache.load('propars')[self._ranges[iatom]:self._ranges[iatom + 1]]
-        my_propars[:] = _opt_mbis_propars(spherical_average, my_propars.copy(), rgrid, self._threshold)
+        with self.timer.section('mbis_inner_solve'):
+            my_propars[:] = _opt_mbis_propars(spherical_average, my_propars.copy(), rgrid, self._threshold)
 
         # compute the new charge
         pseudo_population = rgrid.integrate(spherical_average)
@@ -22,9 +22,13 @@
 
 
 import numpy as np
+from scipy import sparse
 
 
-__all__ = ["partition_mulliken", "get_mulliken_operators"]
+__all__ = [
+    "partition_mulliken", "get_mulliken_operators", "get_mulliken_populations",
+    "get_mulliken_pair_populations", "get_basis_centers", "BasisCenterIndex",
+]
 
 
 def get_shell_nbasis(shell_type):
@@ -37,7 +41,7 @@ def get_shell_nbasis(shell_type):
     """
     if shell_type > 0:
         # cartesian
-        return (shell_type + 1) * (shell_type + 2) / 2
+        return (shell_type + 1) * (shell_type + 2) // 2
     elif shell_type == -1:
         # should not happen
         return -1
@@ -46,6 +50,249 @@ def get_shell_nbasis(shell_type):
         return -2 * shell_type + 1
 
 
+def get_basis_centers(shell_types, shell_maps):
+    """Return the index of the center of each basis function.
+
+    Parameters
+    ----------
+    shell_types : list
+        Sequence of integers representing the basis shell types.
+    shell_maps : list
+        Sequence of integers representing the center each shell belongs to.
+    """
+    shell_types = np.asarray(shell_types, dtype=int)
+    if (shell_types == -1).any():
+        raise ValueError('Shell type -1 is not supported.')
+    # Same as get_shell_nbasis, for all shells at once.
+    shell_nbasis = np.where(shell_types > 0, (shell_types + 1) * (shell_types + 2) // 2,
+                            -2 * shell_types + 1)
+    return np.repeat(np.asarray(shell_maps, dtype=int), shell_nbasis)
+
+
+class BasisCenterIndex(object):
+    """Precomputed mapping of basis functions to centers.
+
+    This mapping only depends on the basis set. When many calculations with the same
+    basis are post-processed, it should be constructed once and reused.
+    """
+
+    def __init__(self, ncenter, shell_types, shell_maps):
+        """
+        Parameters
+        ----------
+        ncenter : int
+            Number of basis centers.
+        shell_types : list
+            Sequence of integers representing the basis shell types.
+        shell_maps : list
+            Sequence of integers representing the center each shell belongs to.
+        """
+        self._ncenter = ncenter
+        self._centers = get_basis_centers(shell_types, shell_maps)
+        # Basis functions of each center. These are slices (block views) when the
+        # basis functions of a center are contiguous, which is the usual case, and
+        # index arrays otherwise.
+        order = np.argsort(self._centers, kind='mergesort')
+        bounds = self._centers[order].searchsorted(np.arange(ncenter + 1))
+        self._selections = []
+        for icenter in range(ncenter):
+            indexes = order[bounds[icenter]:bounds[icenter + 1]]
+            if len(indexes) > 0 and indexes[-1] - indexes[0] == len(indexes) - 1:
+                self._selections.append(slice(int(indexes[0]), int(indexes[-1]) + 1))
+            else:
+                self._selections.append(indexes)
+
+    @property
+    def ncenter(self):
+        """The number of basis centers."""
+        return self._ncenter
+
+    @property
+    def nbasis(self):
+        """The number of basis functions."""
+        return len(self._centers)
+
+    @property
+    def centers(self):
+        """The index of the center of each basis function."""
+        return self._centers
+
+    @property
+    def selections(self):
+        """The basis functions of each center, as slices or index arrays."""
+        return self._selections
+
+    def get_operator(self, overlap, index):
+        """Return the Mulliken operator of one center.
+
+        Parameters
+        ----------
+        overlap : np.ndarray or scipy.sparse matrix, shape=(nbasis, nbasis), dtype=float
+            The overlap matrix in a given basis.
+        index : int
+            The index of the center.
+
+        Returns
+        -------
+        operator : np.ndarray or scipy.sparse.csr_matrix, shape=(nbasis, nbasis)
+            The operator is sparse when the overlap matrix is sparse.
+        """
+        selection = self._selections[index]
+        if sparse.issparse(overlap):
+            mask = np.zeros(self.nbasis)
+            mask[selection] = 0.5
+            half = sparse.diags(mask).dot(overlap)
+            return (half + half.T).tocsr()
+        operator = np.zeros(overlap.shape)
+        operator[selection] = 0.5 * overlap[selection]
+        operator[:, selection] += 0.5 * overlap[selection].T
+        return operator
+
+    def get_operators(self, overlap):
+        """Return a list of Mulliken operators for all centers.
+
+        Parameters
+        ----------
+        overlap : np.ndarray or scipy.sparse matrix, shape=(nbasis, nbasis), dtype=float
+            The overlap matrix in a given basis.
+        """
+        return [self.get_operator(overlap, icenter) for icenter in range(self._ncenter)]
+
+    def get_pair_blocks(self, matrix, threshold=0.0, row=None):
+        """Return the non-negligible blocks of a matrix, keyed by pairs of centers.
+
+        Parameters
+        ----------
+        matrix : np.ndarray or scipy.sparse matrix, shape=(nbasis, nbasis), dtype=float
+            A two-index operator in the given basis.
+        threshold : float, default=0.0
+            Blocks whose elements are all (in absolute value) below or equal to this
+            threshold are left out.
+        row : int, default=None
+            When given, only the blocks ``(row, j)`` are returned.
+
+        Returns
+        -------
+        blocks : dict
+            Dense blocks ``matrix[selections[i]][:, selections[j]]`` with keys ``(i, j)``.
+
+        For sparse matrices, only the pairs of centers with stored elements are visited.
+        """
+        if sparse.issparse(matrix):
+            matrix = matrix.tocsr()
+            coo = matrix.tocoo()
+            mask = abs(coo.data) > threshold
+            rows = self._centers[coo.row[mask]]
+            cols = self._centers[coo.col[mask]]
+            valid = (rows < self._ncenter) & (cols < self._ncenter)
+            if row is not None:
+                valid &= rows == row
+            keys = np.unique(rows[valid] * self._ncenter + cols[valid])
+            pairs = zip(keys // self._ncenter, keys % self._ncenter)
+        else:
+            if row is None:
+                icenters = range(self._ncenter)
+            else:
+                icenters = [row]
+            pairs = ((i, j) for i in icenters for j in range(self._ncenter))
+        blocks = {}
+        for icenter, jcenter in pairs:
+            block = matrix[self._selections[icenter]][:, self._selections[jcenter]]
+            if sparse.issparse(block):
+                block = block.toarray()
+            if block.size > 0 and abs(block).max() > threshold:
+                blocks[int(icenter), int(jcenter)] = block
+        return blocks
+
+    def get_operator_blocks(self, overlap, index, threshold=0.0):
+        """Return the Mulliken operator of one center in block-sparse form.
+
+        Parameters
+        ----------
+        overlap : np.ndarray or scipy.sparse matrix, shape=(nbasis, nbasis), dtype=float
+            The overlap matrix in a given basis.
+        index : int
+            The index of the center.
+        threshold : float, default=0.0
+            See ``get_pair_blocks``.
+
+        Returns
+        -------
+        blocks : dict
+            The non-zero blocks of the operator, keyed by pairs of centers. Only the row
+            and column of blocks of center ``index`` can be present.
+        """
+        blocks = {}
+        for (icenter, jcenter), block in self.get_pair_blocks(overlap, threshold, index).items():
+            if jcenter == index:
+                blocks[index, index] = 0.5 * (block + block.T)
+            else:
+                blocks[index, jcenter] = 0.5 * block
+                blocks[jcenter, index] = 0.5 * block.T
+        return blocks
+
+    def get_populations(self, dm, overlap):
+        """Return the Mulliken populations for one or more density matrices.
+
+        See ``get_mulliken_populations`` for the meaning of the arguments.
+        """
+        if isinstance(dm, (list, tuple)):
+            return np.array([self.get_populations(item, overlap) for item in dm])
+        nbasis = self.nbasis
+        if overlap.shape != (nbasis, nbasis) or dm.shape[-2:] != (nbasis, nbasis):
+            raise TypeError('The density and overlap matrices do not match the basis.')
+        # Gross populations of the basis functions. (The transpose takes care of
+        # density matrices that are not symmetric, e.g. transition densities.)
+        if sparse.issparse(dm) or sparse.issparse(overlap):
+            if not sparse.issparse(dm) and np.ndim(dm) > 2:
+                # A stack of dense density matrices, one at a time, because
+                # sparse matrices are two-dimensional.
+                dm = np.asarray(dm)
+                populations = [self.get_populations(item, overlap)
+                               for item in dm.reshape((-1, nbasis, nbasis))]
+                return np.array(populations).reshape(dm.shape[:-2] + (self._ncenter,))
+            overlap = sparse.csr_matrix(overlap)
+            gross = overlap.multiply(dm).sum(axis=1) + overlap.multiply(dm.T).sum(axis=1)
+            gross = 0.5 * np.asarray(gross).ravel()
+        else:
+            dm = np.asarray(dm)
+            gross = np.einsum('...ij,ij->...i', dm, overlap)
+            gross += np.einsum('...ji,ij->...i', dm, overlap)
+            gross *= 0.5
+        # Sum the gross populations per center, for all density matrices at once.
+        mask = self._centers < self._ncenter
+        gross = gross.reshape(-1, nbasis)[:, mask]
+        nbatch = len(gross)
+        indexes = self._centers[mask] + self._ncenter * np.arange(nbatch)[:, None]
+        populations = np.bincount(indexes.ravel(), gross.ravel(), minlength=nbatch * self._ncenter)
+        return populations.reshape(dm.shape[:-2] + (self._ncenter,))
+
+    def get_pair_populations(self, dm, overlap, threshold=0.0):
+        """Return the Mulliken populations split over pairs of centers.
+
+        See ``get_mulliken_pair_populations`` for the meaning of the arguments.
+        """
+        nbasis = self.nbasis
+        if overlap.shape != (nbasis, nbasis) or dm.shape != (nbasis, nbasis):
+            raise TypeError('The density and overlap matrices do not match the basis.')
+        # Only the elements that are stored in both sparse matrices contribute.
+        product = sparse.csr_matrix(overlap).multiply(dm) + sparse.csr_matrix(overlap).multiply(dm.T)
+        product = sparse.coo_matrix(product)
+        rows = self._centers[product.row]
+        cols = self._centers[product.col]
+        valid = rows < self._ncenter
+        # Columns of centers beyond ncenter (e.g. ghost centers) are kept, such that
+        # the sum over all pairs (i, j) for a given i is the population of i.
+        nkey = max(self._ncenter, self._centers.max() + 1)
+        keys, inverse = np.unique(rows[valid] * nkey + cols[valid], return_inverse=True)
+        values = 0.5 * np.bincount(inverse.ravel(), product.data[valid], minlength=len(keys))
+        result = {}
+        for key, value in zip(keys, values):
+            if abs(value) > threshold:
+                result[int(key // nkey), int(key % nkey)] = value
+        return result
+
+
 def partition_mulliken(operator, nbasis, shell_types, shell_maps, index):
     """Fill in the mulliken operator in the first argument.
 
@@ -66,24 +313,45 @@ def partition_mulliken(operator, nbasis, shell_types, shell_maps, index):
     This routine implies that the first ``natom`` centers in the obasis corresponds to the
     atoms in the system.
     """
-    mask = np.zeros(nbasis, dtype=bool)
-    begin = 0
-    for ishell, shell_type in enumerate(shell_types):
-        end = begin + get_shell_nbasis(shell_type)
-        # check whether shell belongs to center denoted by index
-        if shell_maps[ishell] != index:
-            mask[begin:end] = True
-        begin = end
-    operator[mask] = 0.0
+    centers = get_basis_centers(shell_types, shell_maps)
+    if len(centers) != nbasis:
+        raise TypeError('The shells do not match the number of basis functions.')
+    operator[centers != index] = 0.0
     operator[:] = 0.5 * (operator + operator.T)
 
 
-def get_mulliken_operators(overlap, ncenter, shell_types, shell_maps):
+def get_mulliken_operators(overlap, ncenter, shell_types, shell_maps, basis_index=None):
     """Return a list of Mulliken operators for the given basis.
 
     Parameters
     ----------
-    overlap : np.ndarray, shape=(nbasis, nbasis), dtype=float
+    overlap : np.ndarray or scipy.sparse matrix, shape=(nbasis, nbasis), dtype=float
+        The overlap matrix in a given basis. When sparse, sparse operators are returned.
+    ncenter : int
+        Number of basis centers.
+    shell_types : list
+        Sequence of integers representing the basis shell types.
+    shell_maps : list
+        Sequence of integers representing the center each shell belongs to.
+    basis_index : BasisCenterIndex, default=None
+        A precomputed mapping of basis functions to centers. When given, the
+        arguments ncenter, shell_types and shell_maps are ignored.
+    """
+    if basis_index is None:
+        basis_index = BasisCenterIndex(ncenter, shell_types, shell_maps)
+    return basis_index.get_operators(overlap)
+
+
+def get_mulliken_populations(dm, overlap, ncenter, shell_types, shell_maps, basis_index=None):
+    """Return the Mulliken populations for one or more density matrices.
+
+    Parameters
+    ----------
+    dm : np.ndarray, shape=(..., nbasis, nbasis), dtype=float
+        A density matrix or a stack of density matrices, e.g. for different spin
+        channels, excited states or frames of a trajectory. A scipy.sparse matrix
+        or a list of them is also accepted.
+    overlap : np.ndarray or scipy.sparse matrix, shape=(nbasis, nbasis), dtype=float
         The overlap matrix in a given basis.
     ncenter : int
         Number of basis centers.
@@ -91,11 +359,57 @@ def get_mulliken_operators(overlap, ncenter, shell_types, shell_maps):
         Sequence of integers representing the basis shell types.
     shell_maps : list
         Sequence of integers representing the center each shell belongs to.
+    basis_index : BasisCenterIndex, default=None
+        A precomputed mapping of basis functions to centers. When given, the
+        arguments ncenter, shell_types and shell_maps are ignored.
+
+    Returns
+    -------
+    populations : np.ndarray, shape=(..., ncenter), dtype=float
+        The Mulliken populations, i.e. the expectation values of the operators returned
+        by ``get_mulliken_operators``.
+
+    The Mulliken operators are never constructed. Instead, the gross populations of the
+    basis functions, ``0.5 * (S * (D + D.T)).sum(axis=1)``, are summed per center.
+    """
+    if basis_index is None:
+        basis_index = BasisCenterIndex(ncenter, shell_types, shell_maps)
+    return basis_index.get_populations(dm, overlap)
+
+
+def get_mulliken_pair_populations(dm, overlap, ncenter, shell_types, shell_maps, threshold=0.0,
+                                  basis_index=None):
+    """Return the Mulliken populations split over pairs of centers.
+
+    Parameters
+    ----------
+    dm : np.ndarray or scipy.sparse matrix, shape=(nbasis, nbasis), dtype=float
+        The density matrix.
+    overlap : np.ndarray or scipy.sparse matrix, shape=(nbasis, nbasis), dtype=float
+        The overlap matrix in a given basis.
+    ncenter : int
+        Number of basis centers.
+    shell_types : list
+        Sequence of integers representing the basis shell types.
+    shell_maps : list
+        Sequence of integers representing the center each shell belongs to.
+    threshold : float, default=0.0
+        Pair populations below or equal to this threshold (in absolute value) are left
+        out.
+    basis_index : BasisCenterIndex, default=None
+        A precomputed mapping of basis functions to centers. When given, the
+        arguments ncenter, shell_types and shell_maps are ignored.
+
+    Returns
+    -------
+    pair_populations : dict
+        The (overlap) populations with keys ``(i, j)``, i.e. the sum of
+        ``0.5 * S * (D + D.T)`` over the basis functions of centers i and j. Summing over
+        ``j`` gives the Mulliken populations. (The index ``j`` may refer to centers
+        beyond ``ncenter``, e.g. ghost centers.) Only pairs with non-zero elements in both
+        (sparse) matrices are present, so the cost grows with the number of
+        non-negligible pairs of shells instead of ``nbasis**2``.
     """
-    nbasis = len(overlap)
-    operators = []
-    for icenter in range(ncenter):
-        operator = overlap.copy()
-        partition_mulliken(operator, nbasis, shell_types, shell_maps, icenter)
-        operators.append(operator)
-    return operators
+    if basis_index is None:
+        basis_index = BasisCenterIndex(ncenter, shell_types, shell_maps)
+    return basis_index.get_pair_populations(dm, overlap, threshold)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Several partitioning schemes applied to the same density"""
+
+
+import numpy as np
+
+from .cache import Cache
+from .log import log
+from .utils import wpart_schemes
+
+
+__all__ = ['MultiWPart']
+
+
+# The schemes are executed in this order, such that the Hirshfeld results are
+# available to seed the iterative schemes.
+scheme_order = ['b', 'h', 'hi', 'is', 'mbis', 'gisa']
+
+# Schemes that need a proatom database.
+padb_schemes = ['h', 'hi']
+
+# Schemes that accept the local argument. The other ones always use local grids.
+local_schemes = ['b', 'h', 'hi']
+
+# Families of cache items that only depend on the grid and the proatom
+# database. They are computed by one scheme and reused by the others.
+shared_families = ['distances', 'isolated']
+
+
+class MultiWPart(object):
+    """Apply several partitioning schemes to the same density
+
+       The schemes share all data that does not depend on the scheme: the
+       molecular density and its atomic slices, the distances of the grid
+       points to the atoms, the isolated proatoms evaluated on the grid and
+       the work arrays for spherical averages. Furthermore, the iterative
+       schemes start from the Hirshfeld results, when Hirshfeld is one of the
+       schemes:
+
+       * Hirshfeld-I starts from the converged Hirshfeld charges.
+
+       * Iterative Stockholder starts from the Hirshfeld proatoms.
+
+       The partitioning objects are available as ``multi[scheme]`` and are
+       created when first needed.
+    """
+
+    def __init__(self, coordinates, numbers, pseudo_numbers, grid, moldens,
+                 schemes=('b', 'h', 'hi', 'mbis'), proatomdb=None, spindens=None,
+                 local=True, lmax=3, options=None):
+        """
+           **Arguments:**
+
+           coordinates, numbers, pseudo_numbers, grid, moldens
+                See ``WPart``.
+
+           **Optional arguments:**
+
+           schemes
+                The names of the schemes, see ``wpart_schemes``.
+
+           proatomdb
+                A proatom database, needed by the Hirshfeld schemes.
+
+           spindens, local, lmax
+                See ``WPart``. The iterative schemes other than Hirshfeld-I
+                always use local grids.
+
+           options
+                A dictionary with, for every scheme, a dictionary with extra
+                keyword arguments of its constructor.
+        """
+        for scheme in schemes:
+            if scheme not in scheme_order:
+                raise ValueError('Unknown partitioning scheme: %s' % scheme)
+            if scheme in padb_schemes and proatomdb is None:
+                raise ValueError('The scheme %s needs a proatom database.' % scheme)
+        self._schemes = sorted(set(schemes), key=scheme_order.index)
+        self._args = (coordinates, numbers, pseudo_numbers, grid, moldens)
+        self._proatomdb = proatomdb
+        self._spindens = spindens
+        self._local = local
+        self._lmax = lmax
+        self._options = {} if options is None else options
+        self._parts = {}
+        # The cache items that are shared between the schemes.
+        self._shared = Cache()
+        self._spherical_averager = None
+
+    def _get_schemes(self):
+        return self._schemes
+
+    schemes = property(_get_schemes)
+
+    def _get_shared(self):
+        return self._shared
+
+    shared = property(_get_shared)
+
+    def __getitem__(self, scheme):
+        return self.get_part(scheme)
+
+    def get_part(self, scheme):
+        """Return the partitioning object of a scheme, created when needed."""
+        part = self._parts.get(scheme)
+        if part is None:
+            if scheme not in self._schemes:
+                raise KeyError(scheme)
+            kwargs = dict(self._options.get(scheme, {}))
+            if scheme in padb_schemes:
+                kwargs['proatomdb'] = self._proatomdb
+            if scheme in local_schemes:
+                kwargs['local'] = self._local
+            kwargs['spindens'] = self._spindens
+            kwargs['lmax'] = self._lmax
+            part = wpart_schemes(scheme)(*self._args, **kwargs)
+            self._parts[scheme] = part
+        return part
+
+    def _share_with(self, part):
+        """Make the shared data available to a partitioning object."""
+        for key, value in self._shared.iteritems():
+            if key not in part.cache:
+                part.cache.dump(key, value)
+        if hasattr(part, '_spherical_averager'):
+            if self._spherical_averager is None:
+                self._spherical_averager = part._spherical_averager
+            else:
+                part._spherical_averager = self._spherical_averager
+
+    def _collect_from(self, part):
+        """Store the shareable data of a partitioning object."""
+        for key, value in part.cache.iteritems():
+            if isinstance(key, tuple) and key[0] in shared_families and key not in self._shared:
+                self._shared.dump(key, value)
+        if self._spherical_averager is None:
+            self._spherical_averager = getattr(part, '_spherical_averager', None)
+
+    def _seed(self, scheme, part):
+        """Start an iterative scheme from the Hirshfeld results, if available."""
+        if 'h' not in self._schemes or scheme not in ['hi', 'is']:
+            return
+        hpart = self.get_part('h')
+        hpart.do_charges()
+        if scheme == 'hi':
+            log.info('Seeding Hirshfeld-I with the Hirshfeld charges.')
+            part.seed_propars(hpart['charges'])
+        else:
+            log.info('Seeding Iterative Stockholder with the Hirshfeld proatoms.')
+            part.seed_propars(np.concatenate([
+                hpart.get_proatom_spline(index)(part.get_rgrid(index).radii)
+                for index in range(part.natom)]))
+
+    def _prepare_isolated(self):
+        """Evaluate the neutral isolated atoms, used by Hirshfeld and Hirshfeld-I."""
+        if 'h' not in self._schemes or 'hi' not in self._schemes:
+            return
+        hpart = self.get_part('h')
+        for index in range(hpart.natom):
+            hpart.get_isolated(index, 0, hpart.grid)
+        self._collect_from(hpart)
+
+    def do_all(self):
+        """Run all schemes.
+
+           **Returns:** a dictionary with, for every scheme, the list of keys
+           of the results in the cache of the partitioning object.
+        """
+        self._prepare_isolated()
+        result = {}
+        for scheme in self._schemes:
+            part = self.get_part(scheme)
+            self._share_with(part)
+            self._seed(scheme, part)
+            log.info('Running partitioning scheme %s.', scheme)
+            result[scheme] = part.do_all()
+            self._collect_from(part)
+        return result
+
+    def get_charges(self):
+        """Return a dictionary with the charges of all schemes."""
+        result = {}
+        for scheme in self._schemes:
+            part = self.get_part(scheme)
+            self._share_with(part)
+            self._seed(scheme, part)
+            part.do_charges()
+            self._collect_from(part)
+            result[scheme] = part['charges']
+        return result
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Cached solutions of the radial Poisson equation"""
+
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+from horton.grid import solve_poisson_becke
+
+
+__all__ = ['get_spline_key', 'PoissonCache', 'poisson_cache']
+
+
+def get_spline_key(spline):
+    """Return a key that identifies a radial spline by its content.
+
+    Parameters
+    ----------
+    spline : CubicSpline
+        A radial spline.
+
+    Two splines with the same radial grid, values and derivatives get the same key,
+    even when they are different objects.
+    """
+    digest = hashlib.sha1()
+    digest.update(spline.rtransform.to_string().encode('ascii'))
+    digest.update(np.ascontiguousarray(spline.y).tobytes())
+    if spline.dx is not None:
+        digest.update(np.ascontiguousarray(spline.dx).tobytes())
+    return digest.hexdigest()
+
+
+class PoissonCache(object):
+    """Solutions of the Poisson equation, keyed by the content of the density splines.
+
+    Identical densities, e.g. the pro-atoms of all atoms of one element in Hirshfeld
+    partitioning, only need one Poisson solve. The cache is not tied to one ``Part``
+    instance, such that different partitionings can share solutions.
+    """
+
+    def __init__(self, maxsize=1000):
+        """
+        Parameters
+        ----------
+        maxsize : int, default=1000
+            The maximum number of solutions kept. When the cache is full, the least
+            recently used solution is discarded. When None, the cache is unbounded.
+        """
+        self._maxsize = maxsize
+        self._store = OrderedDict()
+        self.nsolve = 0
+
+    def __len__(self):
+        return len(self._store)
+
+    def clear(self):
+        """Discard all solutions."""
+        self._store.clear()
+
+    def solve(self, rho_splines):
+        """Return the potential splines for one density decomposition.
+
+        Parameters
+        ----------
+        rho_splines : list of CubicSpline
+            The density splines, one for each angular momentum, as for
+            ``solve_poisson_becke``.
+        """
+        return self.solve_many([rho_splines])[0]
+
+    def solve_many(self, decompositions):
+        """Return the potential splines for several density decompositions.
+
+        Parameters
+        ----------
+        decompositions : list of lists of CubicSpline
+            A list of arguments for ``solve_poisson_becke``.
+
+        All decompositions are first reduced to the unique ones that are not in the
+        cache yet. Only those are solved, each exactly once.
+        """
+        keys = [tuple(get_spline_key(spline) for spline in rho_splines)
+                for rho_splines in decompositions]
+        for key, rho_splines in zip(keys, decompositions):
+            if key in self._store:
+                # mark as recently used
+                self._store[key] = self._store.pop(key)
+            else:
+                self._store[key] = solve_poisson_becke(rho_splines)
+                self.nsolve += 1
+        results = [self._store[key] for key in keys]
+        if self._maxsize is not None:
+            while len(self._store) > self._maxsize:
+                self._store.popitem(last=False)
+        return results
+
+
+# The default cache, shared by all Part instances.
+poisson_cache = PoissonCache()
@@ -21,16 +21,20 @@
 """Pro-atom databases"""
 
 
-from __future__ import print_function
-
 import os
 import h5py as h5
 import numpy as np
 
-from horton.grid import RTransform, CubicSpline
+from .log import log, log_table
+from horton.grid import RTransform, CubicSpline, RadialGrid, LinearRTransform, ExpRTransform, \
+    PowerRTransform
+
 
+__all__ = ['ProAtomRecord', 'ProAtomDB', 'load_proatom_records', 'load_proatomdb']
 
-__all__ = ['ProAtomRecord', 'ProAtomDB']
+
+# The radial transformations of proatoms stored in NPZ files.
+rtf_classes = {'lin': LinearRTransform, 'exp': ExpRTransform, 'pow': PowerRTransform}
 
 
 class ProAtomRecord(object):
@@ -247,12 +251,11 @@ class ProAtomDB(object):
         self._log_init()
 
     def _log_init(self):
-        print('5: Initialized: %s' % self)
-        print([
-            ('5: Numbers', list(self._rgrid_map.keys())),
-            ('5: Records', list(self._map.keys())),
+        log.info('Initialized: %s', self)
+        log_table([
+            ('Numbers', list(self._rgrid_map.keys())),
+            ('Records', list(self._map.keys())),
         ])
-        print()
 
     def get_record(self, number, charge):
         return self._map[(number, charge)]
@@ -372,8 +375,8 @@ class ProAtomDB(object):
            Note that only 'safe' atoms are considered to determine the cutoff
            radius.
         """
-        print('5:Reducing extents of the pro-atoms')
-        print('5:   Z     npiont           radius')
+        log.info('Reducing extents of the pro-atoms')
+        log.info('   Z     npiont           radius')
         for number in self.get_numbers():
             rgrid = self.get_rgrid(number)
             npoint = 0
@@ -386,14 +389,12 @@ class ProAtomDB(object):
                 r.chop(npoint)
             new_rgrid = self._rgrid_map[number].chop(npoint)
             self._rgrid_map[number] = new_rgrid
-            print('5:%4i   %5i -> %5i    %10.3e -> %10.3e' % (
-                number, rgrid.size, new_rgrid.size, rgrid.radii[-1], new_rgrid.radii[-1]))
-        print()
+            log.info('%4i   %5i -> %5i    %10.3e -> %10.3e',
+                     number, rgrid.size, new_rgrid.size, rgrid.radii[-1], new_rgrid.radii[-1])
 
     def normalize(self):
-        print('5:Normalizing proatoms to integer populations')
-        print('5:   Z  charge             before             after')
-        print()
+        log.info('Normalizing proatoms to integer populations')
+        log.info('   Z  charge             before             after')
         for number in self.get_numbers():
             rgrid = self.get_rgrid(number)
             for charge in self.get_charges(number):
@@ -402,4 +403,43 @@ class ProAtomDB(object):
                 nel_integer = r.pseudo_number - charge
                 r.rho[:] *= nel_integer / nel_before
                 nel_after = rgrid.integrate(r.rho)
-                print('5:%4i     %+3i    %15.8e   %15.8e' % (number, charge, nel_before, nel_after))
+                log.info('%4i     %+3i    %15.8e   %15.8e', number, charge, nel_before, nel_after)
+
+
+def load_proatom_records(filenames, rtf_type='pow'):
+    """Load proatom records from NPZ files with one atom each.
+
+    Parameters
+    ----------
+    filenames : sequence of str
+        NPZ files with the arrays ``number``, ``charge``, ``energy``, ``dens``,
+        ``deriv``, ``rgrid`` (the arguments of the radial transformation) and
+        optionally ``pseudo_number``.
+    rtf_type : str
+        The type of radial transformation: 'lin', 'exp' or 'pow'.
+
+    Returns
+    -------
+    records : list of ProAtomRecord instances
+    """
+    rtf_class = rtf_classes[rtf_type]
+    records = []
+    for filename in filenames:
+        with np.load(filename) as npz:
+            rgrid = RadialGrid(rtf_class(*npz['rgrid']))
+            if 'pseudo_number' in list(npz.keys()):
+                pseudo_number = npz['pseudo_number']
+            else:
+                pseudo_number = None
+            records.append(ProAtomRecord(
+                int(npz['number']), int(npz['charge']), float(npz['energy']),
+                rgrid, npz['dens'], npz['deriv'], pseudo_number=pseudo_number))
+    return records
+
+
+def load_proatomdb(filenames, rtf_type='pow'):
+    """Load a proatom database from NPZ files with one atom each.
+
+    The arguments are the same as for ``load_proatom_records``.
+    """
+    return ProAtomDB(load_proatom_records(filenames, rtf_type))
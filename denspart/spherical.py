@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Spherical averages on atomic grids with a fixed angular grid per shell
+
+   The points of an atomic grid are ordered shell by shell. When all shells
+   have the same number of angular points, a function on the atomic grid can be
+   reshaped into an array with shape ``(nrad, nang)`` without copying and its
+   spherical average becomes a matrix-vector product with the angular weights.
+"""
+
+
+import numpy as np
+
+
+__all__ = ["get_shell_shape", "get_angular_weights", "SphericalAverager"]
+
+
+def get_shell_shape(atgrid):
+    """Return the shape (nrad, nang) of an atomic grid.
+
+       **Arguments:**
+
+       atgrid
+            An atomic integration grid.
+
+       **Returns:** the number of radial shells and angular points per shell,
+       or None when not all shells have the same number of angular points.
+    """
+    nlls = np.asarray(atgrid.nlls)
+    if (nlls != nlls[0]).any():
+        return None
+    return len(nlls), int(nlls[0])
+
+
+def get_angular_weights(atgrid):
+    """Return the normalized angular weights of an atomic grid.
+
+       **Arguments:**
+
+       atgrid
+            An atomic integration grid for which ``get_shell_shape`` is not
+            None.
+
+       **Returns:** an array (nang,) with angular weights that sum to one.
+
+       The integration weight of a point is the product of a radial and an
+       angular weight. The angular weights are therefore obtained by
+       normalizing the weights of one shell. The shell with the largest
+       weights is used to avoid round-off errors.
+    """
+    nrad, nang = get_shell_shape(atgrid)
+    weights = atgrid.weights.reshape(nrad, nang)
+    sums = weights.sum(axis=1)
+    irad = sums.argmax()
+    return weights[irad] / sums[irad]
+
+
+class SphericalAverager(object):
+    """Compute spherical averages of products of functions on atomic grids.
+
+       Atoms whose grids have the same shape and angular weights are handled
+       together. For such a group, the products are written into one
+       preallocated array with shape ``(natom, nrad, nang)`` and all spherical
+       averages are obtained with a single matrix-vector product. Grids whose
+       shells have different numbers of angular points fall back to
+       ``AtomicGrid.get_spherical_average``.
+    """
+
+    def __init__(self, atgrids):
+        """
+           **Arguments:**
+
+           atgrids
+                The atomic grids, one for each atom.
+        """
+        self._atgrids = atgrids
+        # Group the atoms by the shape of their grids and angular weights.
+        self._groups = []
+        self._locations = {}
+        for index, atgrid in enumerate(atgrids):
+            shape = get_shell_shape(atgrid)
+            if shape is None:
+                continue
+            weights = get_angular_weights(atgrid)
+            for igroup, (group_shape, group_weights, indexes) in enumerate(self._groups):
+                if group_shape == shape and abs(group_weights - weights).max() < 1e-13:
+                    break
+            else:
+                igroup = len(self._groups)
+                self._groups.append((shape, weights, []))
+            indexes = self._groups[igroup][2]
+            self._locations[index] = (igroup, len(indexes))
+            indexes.append(index)
+        # Work arrays, allocated when first needed.
+        self._products = [None] * len(self._groups)
+        self._averages = [None] * len(self._groups)
+
+    def _get_work(self, igroup):
+        if self._products[igroup] is None:
+            (nrad, nang), weights, indexes = self._groups[igroup]
+            self._products[igroup] = np.zeros((len(indexes), nrad, nang))
+            self._averages[igroup] = np.zeros((len(indexes), nrad))
+        return self._products[igroup], self._averages[igroup]
+
+    def compute(self, indexes, get_factors, outputs):
+        """Compute the spherical averages for a set of atoms.
+
+           **Arguments:**
+
+           indexes
+                The atoms for which the spherical averages are needed.
+
+           get_factors
+                A function that is called with an atom index and returns a
+                tuple of arrays on the atomic grid of that atom. The spherical
+                average of their product is computed.
+
+           outputs
+                Arrays (nrad,), one for each atom in indexes, in which the
+                results are written.
+        """
+        todo = {}
+        for index, output in zip(indexes, outputs):
+            location = self._locations.get(index)
+            if location is None:
+                output[:] = self._atgrids[index].get_spherical_average(*get_factors(index))
+                continue
+            igroup, irow = location
+            products = self._get_work(igroup)[0]
+            # Write the product in the row of this atom, without temporaries.
+            row = products[irow].reshape(-1)
+            factors = get_factors(index)
+            if len(factors) == 1:
+                row[:] = factors[0]
+            else:
+                np.multiply(factors[0], factors[1], out=row)
+                for factor in factors[2:]:
+                    row *= factor
+            todo.setdefault(igroup, []).append((irow, output))
+        for igroup, rows in todo.items():
+            products, averages = self._get_work(igroup)
+            weights = self._groups[igroup][1]
+            if len(rows) == len(self._groups[igroup][2]):
+                # All atoms of the group, one matrix-vector product
+                np.dot(products, weights, out=averages)
+                for irow, output in rows:
+                    output[:] = averages[irow]
+            else:
+                for irow, output in rows:
+                    np.dot(products[irow], weights, out=output)
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Vectorized cubic splines on radial grids
+
+   The splines are cubic Hermite splines in the variable t of the radial
+   transformation, r = r(t), with knots at the integer values of t, like
+   horton's ``CubicSpline``. A ``RadialSplines`` object holds any number of
+   splines on the same radial grid and evaluates them with NumPy for many
+   points and centers in one call.
+"""
+
+
+import numpy as np
+from scipy.linalg import solve_banded
+
+
+__all__ = ['RadialMap', 'RadialSplines']
+
+
+class RadialMap(object):
+    """The mapping between the radius r and the grid variable t
+
+       The type of the mapping (linear, exponential or power) is recognized
+       from the radii at the integer values of t, so it works for horton's
+       ``LinearRTransform``, ``ExpRTransform`` and ``PowerRTransform``.
+    """
+
+    def __init__(self, radii):
+        """
+           **Arguments:**
+
+           radii
+                The radii at t = 0, 1, ..., npoint - 1.
+        """
+        radii = np.asarray(radii, float)
+        npoint = len(radii)
+        t = np.arange(npoint, dtype=float)
+        r0, r1 = radii[0], radii[1]
+        candidates = [('linear', (r0, r1 - r0))]
+        if r0 > 0:
+            candidates.append(('exp', (r0, np.log(r1 / r0))))
+            candidates.append(('power', (r0, np.log(r1 / r0) / np.log(2.0))))
+        for kind, params in candidates:
+            self.kind, self.params = kind, params
+            if abs(self.radius(t) - radii).max() <= 1e-10 * abs(radii).max():
+                break
+        else:
+            raise ValueError('The radial grid is not linear, exponential or a power law.')
+        self.npoint = npoint
+        self.radii = radii
+
+    def radius(self, t):
+        """Return the radius for given values of t."""
+        a, b = self.params
+        if self.kind == 'linear':
+            return a + b * t
+        elif self.kind == 'exp':
+            return a * np.exp(b * t)
+        else:
+            return a * (t + 1)**b
+
+    def deriv(self, t):
+        """Return the derivative of the radius towards t."""
+        a, b = self.params
+        if self.kind == 'linear':
+            return np.full(np.shape(t), b)
+        elif self.kind == 'exp':
+            return a * b * np.exp(b * t)
+        else:
+            return a * b * (t + 1)**(b - 1)
+
+    def inv(self, r):
+        """Return the values of t for given radii."""
+        a, b = self.params
+        if self.kind == 'linear':
+            return (r - a) / b
+        elif self.kind == 'exp':
+            return np.log(r / a) / b
+        else:
+            return (r / a)**(1.0 / b) - 1
+
+
+def _get_natural_derivs(ys):
+    """Return the derivatives towards t of natural cubic splines through ys."""
+    nspline, npoint = ys.shape
+    # Tridiagonal system for the first derivatives at the knots.
+    banded = np.zeros((3, npoint))
+    banded[0, 1:] = 1.0
+    banded[1, :] = 4.0
+    banded[1, 0] = 2.0
+    banded[1, -1] = 2.0
+    banded[2, :-1] = 1.0
+    rhs = np.zeros((npoint, nspline))
+    rhs[1:-1] = 3 * (ys[:, 2:] - ys[:, :-2]).T
+    rhs[0] = 3 * (ys[:, 1] - ys[:, 0])
+    rhs[-1] = 3 * (ys[:, -1] - ys[:, -2])
+    return solve_banded((1, 1), banded, rhs).T
+
+
+class RadialSplines(object):
+    """A set of cubic splines on the same radial grid
+
+       Beyond the last grid point, the splines are zero. Below the first grid
+       point, they are extrapolated with an exponential function that matches
+       the value and the derivative at the first grid point, like the cusp
+       extrapolation of horton's ``CubicSpline``.
+    """
+
+    def __init__(self, radii, ys, dxs=None):
+        """
+           **Arguments:**
+
+           radii
+                The radii of the grid points, see ``RadialMap``.
+
+           ys
+                An array with shape (nspline, npoint) with the values of the
+                splines at the grid points.
+
+           **Optional arguments:**
+
+           dxs
+                An array with shape (nspline, npoint) with the derivatives of
+                the splines towards r at the grid points. When not given, the
+                derivatives of natural cubic splines are used.
+        """
+        self._map = RadialMap(radii)
+        ys = np.array(ys, float, ndmin=2)
+        if ys.shape[1] != self._map.npoint:
+            raise TypeError('The values of the splines do not match the radial grid.')
+        self._ys = ys
+        # Derivatives towards t, used for the interpolation.
+        if dxs is None:
+            self._dts = _get_natural_derivs(ys)
+        else:
+            self._dts = np.array(dxs, float, ndmin=2) * self._map.deriv(np.arange(self._map.npoint))
+
+    @classmethod
+    def from_cubic_splines(cls, splines):
+        """Construct from horton ``CubicSpline`` objects on the same radial grid."""
+        rtf = splines[0].rtransform
+        for spline in splines[1:]:
+            if spline.rtransform.to_string() != rtf.to_string():
+                raise TypeError('All splines must use the same radial grid.')
+        return cls(rtf.get_radii(), [spline.y for spline in splines],
+                   [spline.dx for spline in splines])
+
+    def _get_nspline(self):
+        return self._ys.shape[0]
+
+    nspline = property(_get_nspline)
+
+    def _get_radii(self):
+        return self._map.radii
+
+    radii = property(_get_radii)
+
+    def __call__(self, ispline, r, output=None, deriv=None):
+        """Evaluate one spline.
+
+           **Arguments:**
+
+           ispline
+                The index of the spline.
+
+           r
+                An array with radii.
+
+           **Optional arguments:**
+
+           output
+                An array with the same shape as r for the result. When not
+                given, it is allocated.
+
+           deriv
+                An array with the same shape as r for the derivative towards r.
+
+           **Returns:** output
+        """
+        r = np.asarray(r, float)
+        if output is None:
+            output = np.zeros(r.shape)
+        ys = self._ys[ispline]
+        dts = self._dts[ispline]
+        npoint = self._map.npoint
+        rmin = self._map.radii[0]
+        rmax = self._map.radii[-1]
+        # interpolation
+        inside = (r >= rmin) & (r <= rmax)
+        t = self._map.inv(r[inside])
+        i = np.clip(t.astype(int), 0, npoint - 2)
+        u = t - i
+        u1 = 1 - u
+        y0, y1, d0, d1 = ys[i], ys[i + 1], dts[i], dts[i + 1]
+        output[inside] = (
+            (1 + 2 * u) * u1 * u1 * y0 + u * u1 * u1 * d0 +
+            u * u * (3 - 2 * u) * y1 - u * u * u1 * d1
+        )
+        if deriv is not None:
+            deriv_t = (
+                6 * u * u1 * (y1 - y0) + u1 * (1 - 3 * u) * d0 + u * (3 * u - 2) * d1
+            )
+            deriv[inside] = deriv_t / self._map.deriv(t)
+        # extrapolation
+        output[r > rmax] = 0.0
+        if deriv is not None:
+            deriv[r > rmax] = 0.0
+        below = r < rmin
+        if below.any():
+            if ys[0] == 0.0:
+                output[below] = 0.0
+                if deriv is not None:
+                    deriv[below] = 0.0
+            else:
+                slope = dts[0] / self._map.deriv(0.0) / ys[0]
+                output[below] = ys[0] * np.exp(slope * (r[below] - rmin))
+                if deriv is not None:
+                    deriv[below] = slope * output[below]
+        return output
+
+    def eval_points(self, points, centers, isplines, output, gradient=None, work=None):
+        """Add splines at several centers to a function on a set of points.
+
+           **Arguments:**
+
+           points
+                An array with shape (npoint, 3) with the points.
+
+           centers
+                An array with shape (ncenter, 3) with the centers.
+
+           isplines
+                The index of the spline at each center.
+
+           output
+                An array with shape (npoint,) to which the sum of all splines
+                is added, or with shape (ncenter, npoint) to which the spline of
+                each center is added separately.
+
+           **Optional arguments:**
+
+           gradient
+                An array with shape (npoint, 3) or (ncenter, npoint, 3) to which
+                the gradient of the splines is added.
+
+           work
+                A work array with shape (2, npoint). When not given, it is
+                allocated.
+        """
+        npoint = len(points)
+        if work is None:
+            work = np.zeros((2, npoint))
+        distances, values = work[0], work[1]
+        for icenter, (center, ispline) in enumerate(zip(centers, isplines)):
+            deltas = points - center
+            np.sqrt((deltas * deltas).sum(axis=1), out=distances)
+            if gradient is None:
+                self(ispline, distances, values)
+            else:
+                derivs = np.zeros(npoint)
+                self(ispline, distances, values, derivs)
+                # Avoid division by zero at the center, where the gradient of
+                # a radial function vanishes.
+                derivs /= np.where(distances > 0, distances, np.inf)
+                if gradient.ndim == 2:
+                    gradient += deltas * derivs[:, None]
+                else:
+                    gradient[icenter] += deltas * derivs[:, None]
+            if output.ndim == 1:
+                output += values
+            else:
+                output[icenter] += values
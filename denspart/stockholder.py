@@ -21,12 +21,13 @@
 """Base classes for all stockholder partitioning schemes"""
 
 
-from __future__ import print_function
-
 import numpy as np
 
 from .base import WPart
-from horton.grid import CubicSpline, solve_poisson_becke
+from .log import log
+from .poisson import poisson_cache
+from .spherical import get_shell_shape
+from horton.grid import CubicSpline
 
 
 __all__ = ["StockholderWPart"]
@@ -61,7 +62,7 @@ class StockHolderMixin(object):
             rho[rho < 0] = 0.0
             deriv = None
             error = rgrid.integrate(rho) - original
-            print('5:                Pro-atom not positive everywhere. Lost %.1e electrons' % error)
+            log.warning('Pro-atom not positive everywhere. Lost %.1e electrons', error)
         return rho, deriv
 
     def get_proatom_spline(self, index, *args, **kwargs):
@@ -75,17 +76,81 @@ class StockHolderMixin(object):
         rtf = self.get_rgrid(index).rtransform
         return CubicSpline(rho, deriv, rtf)
 
+    def get_distances(self, index):
+        """Return the distances of the molecular grid points to an atom.
+
+           The distances are computed once and stored in the cache. They are
+           used by schemes whose proatoms are evaluated analytically.
+        """
+        distances, new = self.cache.load('distances', index, alloc=self.grid.shape)
+        if new:
+            template = self.get_template(index)
+            if template is None:
+                deltas = self.grid.points - self.coordinates[index]
+                distances[:] = np.sqrt((deltas**2).sum(axis=1))
+            else:
+                # The distances to the points of the atom's own grid are
+                # taken from its template.
+                for other in range(self.natom):
+                    atgrid = self.get_grid(other)
+                    atdistances = distances[atgrid.begin:atgrid.end]
+                    if other == index:
+                        atdistances[:] = template.distances
+                    else:
+                        deltas = atgrid.points - self.coordinates[index]
+                        atdistances[:] = np.sqrt((deltas**2).sum(axis=1))
+        return distances
+
     def eval_spline(self, index, spline, output, grid, label='noname'):
         center = self.coordinates[index]
         grid.eval_spline(spline, center, output)
 
     def eval_proatom(self, index, output, grid):
-        spline = self.get_proatom_spline(index)
-        output[:] = 0.0
-        self.eval_spline(index, spline, output, grid, label='proatom')
+        with self.timer.section('eval_proatom'):
+            spline = self.get_proatom_spline(index)
+            output[:] = 0.0
+            if grid is self.grid and self.local:
+                self._eval_spline_own_radial(index, spline, output)
+            else:
+                self.eval_spline(index, spline, output, grid, label='proatom')
         output += 1e-100
         assert np.isfinite(output).all()
 
+    def _eval_spline_own_radial(self, index, spline, output):
+        """Evaluate a spline of one atom on the molecular grid.
+
+           On the atomic grid of the atom itself, the spline only depends on
+           the radial shell. It is therefore evaluated once for each radial
+           grid point and copied to all angular points. The spline is only
+           evaluated in 3D on the atomic grids of the other atoms.
+
+           **Arguments:**
+
+           index
+                The atom at the center of the spline.
+
+           spline
+                A CubicSpline instance.
+
+           output
+                An output array on the molecular grid, to which the spline is
+                added.
+        """
+        center = self.coordinates[index]
+        for other in range(self.natom):
+            atgrid = self.get_grid(other)
+            atoutput = output[atgrid.begin:atgrid.end]
+            if other != index or (atgrid.center != center).any():
+                atgrid.eval_spline(spline, center, atoutput)
+                continue
+            values = spline(atgrid.rgrid.radii)
+            shape = get_shell_shape(atgrid)
+            if shape is None:
+                atoutput += np.repeat(values, atgrid.nlls)
+            else:
+                atoutput = atoutput.reshape(shape)
+                atoutput += values[:, None]
+
     def update_at_weights(self):
         # This will reconstruct the promolecular density and atomic weights
         # based on the current proatomic splines.
@@ -114,16 +179,21 @@ class StockHolderMixin(object):
             # density
             key = ('spline_prodensity', index)
             if key not in self.cache:
-                print('5:Storing proatom density spline for atom %i.' % index)
+                log.info('Storing proatom density spline for atom %i.', index)
                 spline = self.get_proatom_spline(index)
                 self.cache.dump(key, spline, tags='o')
-            # hartree potential
-            key = ('spline_prohartree', index)
-            if key not in self.cache:
-                print('5:Computing proatom hartree potential spline for atom %i.' % index)
-                rho_spline = self.cache.load('spline_prodensity', index)
-                v_spline = solve_poisson_becke([rho_spline])[0]
-                self.cache.dump(key, v_spline, tags='o')
+        # hartree potential, one Poisson solve for each unique proatom density
+        indexes = [index for index in range(self.natom)
+                   if ('spline_prohartree', index) not in self.cache]
+        if len(indexes) > 0:
+            log.info('Computing proatom hartree potential splines for %i atoms.', len(indexes))
+            decompositions = [[self.cache.load('spline_prodensity', index)] for index in indexes]
+            nsolve = poisson_cache.nsolve
+            with self.timer.section('hartree_prosplines'):
+                v_splines = poisson_cache.solve_many(decompositions)
+            self.timer.count('poisson_solves', poisson_cache.nsolve - nsolve)
+            for index, (v_spline,) in zip(indexes, v_splines):
+                self.cache.dump('spline_prohartree', index, v_spline, tags='o')
 
 
 class StockholderWPart(StockHolderMixin, WPart):
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Templates of atomic grids shared by all atoms with the same grid
+
+   In a ``BeckeMolGrid`` without random rotations, the atomic grid of an atom
+   is a radial times angular template, translated to the atom. All data that
+   only depends on the positions of the points relative to the center, e.g.
+   the distances to the center and the polynomials in the multipole moments,
+   can therefore be computed once per template and reused for all atoms of
+   the same element and for all molecular geometries.
+"""
+
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+__all__ = [
+    'get_cartesian_powers', 'get_pure_polynomials', 'get_radial_powers',
+    'AtomicGridTemplate', 'TemplateCache', 'template_cache',
+]
+
+
+def get_cartesian_powers(deltas, lmax):
+    """Compute the Cartesian monomials up to a given order.
+
+       **Arguments:**
+
+       deltas
+            An array (npoint, 3) with the positions of the points relative to
+            the center.
+
+       lmax
+            The maximum order.
+
+       **Returns:** an array (ncart, npoint) with the monomials x^a y^b z^c,
+       ordered by a + b + c and then alphabetically, e.g. 1, x, y, z, xx, xy,
+       xz, yy, yz, zz for lmax=2, as in the Cartesian multipole moments of
+       horton.
+    """
+    x, y, z = deltas.T
+    result = []
+    for l in range(lmax + 1):
+        for nx in range(l, -1, -1):
+            for ny in range(l - nx, -1, -1):
+                result.append(x**nx * y**ny * z**(l - nx - ny))
+    return np.array(result)
+
+
+def get_pure_polynomials(deltas, lmax):
+    """Compute the regular solid harmonics up to a given order.
+
+       **Arguments:**
+
+       deltas
+            An array (npoint, 3) with the positions of the points relative to
+            the center.
+
+       lmax
+            The maximum order.
+
+       **Returns:** an array ((lmax + 1)**2, npoint) with the real regular
+       solid harmonics with Racah's normalization, ordered as C00, C10, C11,
+       S11, C20, C21, S21, C22, S22, ..., as in the pure multipole moments of
+       horton.
+    """
+    x, y, z = deltas.T
+    r2 = x * x + y * y + z * z
+    # cs[l][m] and ss[l][m] are the cosine and sine-like harmonics.
+    cs = [[np.ones(len(deltas))]]
+    ss = [[np.zeros(len(deltas))]]
+    for l in range(1, lmax + 1):
+        cl = []
+        sl = []
+        for m in range(l):
+            factor = np.sqrt((l + m) * (l - m))
+            c = (2 * l - 1) * z * cs[l - 1][m]
+            s = (2 * l - 1) * z * ss[l - 1][m]
+            if m < l - 1:
+                previous = np.sqrt((l + m - 1) * (l - m - 1)) * r2
+                c -= previous * cs[l - 2][m]
+                s -= previous * ss[l - 2][m]
+            cl.append(c / factor)
+            sl.append(s / factor)
+        # The real harmonics with m > 0 have an extra factor sqrt(2), which
+        # enters in the recursion from m = 0 to m = 1.
+        factor = 1.0 if l == 1 else np.sqrt((2 * l - 1) / (2.0 * l))
+        cl.append(factor * (x * cs[l - 1][l - 1] - y * ss[l - 1][l - 1]))
+        sl.append(factor * (x * ss[l - 1][l - 1] + y * cs[l - 1][l - 1]))
+        cs.append(cl)
+        ss.append(sl)
+    result = []
+    for l in range(lmax + 1):
+        result.append(cs[l][0])
+        for m in range(1, l + 1):
+            result.append(cs[l][m])
+            result.append(ss[l][m])
+    return np.array(result)
+
+
+def get_radial_powers(distances, lmax):
+    """Compute the powers of the distances, r^l for l=0..lmax.
+
+       **Arguments:**
+
+       distances
+            An array (npoint,) with the distances of the points to the center.
+
+       lmax
+            The maximum power.
+
+       **Returns:** an array (lmax + 1, npoint).
+    """
+    return np.array([distances**l for l in range(lmax + 1)])
+
+
+class AtomicGridTemplate(object):
+    """The data of an atomic grid that do not depend on its center."""
+
+    def __init__(self, atgrid):
+        """
+           **Arguments:**
+
+           atgrid
+                An atomic integration grid, whose points are a translation of
+                the template.
+        """
+        self._rtransform = atgrid.rgrid.rtransform.to_string()
+        self._nlls = np.array(atgrid.nlls)
+        self._deltas = atgrid.points - atgrid.center
+        self._distances = np.repeat(atgrid.rgrid.radii, self._nlls)
+        self._shell_indexes = np.repeat(np.arange(len(self._nlls)), self._nlls)
+        self._tables = {}
+
+    def _get_deltas(self):
+        return self._deltas
+
+    deltas = property(_get_deltas)
+
+    def _get_distances(self):
+        return self._distances
+
+    distances = property(_get_distances)
+
+    def _get_shell_indexes(self):
+        return self._shell_indexes
+
+    shell_indexes = property(_get_shell_indexes)
+
+    def get_key(self):
+        """Return a key that is shared by all templates that may be equal."""
+        return self._rtransform, tuple(self._nlls)
+
+    def matches(self, atgrid, eps=1e-10):
+        """Return True if the atomic grid is a translation of this template."""
+        if atgrid.size != len(self._deltas):
+            return False
+        if (self._rtransform, tuple(self._nlls)) != (atgrid.rgrid.rtransform.to_string(),
+                                                     tuple(atgrid.nlls)):
+            return False
+        return abs(atgrid.points - atgrid.center - self._deltas).max() < eps
+
+    def get_moment_table(self, lmax, mtype):
+        """Return the polynomials used in the multipole moments.
+
+           **Arguments:**
+
+           lmax
+                The maximum angular momentum.
+
+           mtype
+                The type of moments, as in ``IntGrid.integrate``: 1 for
+                Cartesian, 2 for pure and 3 for radial moments.
+
+           **Returns:** an array (nmoment, npoint) with the polynomials on the
+           grid points. The moments of a function are
+           ``np.dot(table, weights * function)``. The table is computed once.
+        """
+        key = (lmax, mtype)
+        table = self._tables.get(key)
+        if table is None:
+            if mtype == 1:
+                table = get_cartesian_powers(self._deltas, lmax)
+            elif mtype == 2:
+                table = get_pure_polynomials(self._deltas, lmax)
+            elif mtype == 3:
+                table = get_radial_powers(self._distances, lmax)
+            else:
+                raise ValueError('Unsupported type of moments: %s' % mtype)
+            self._tables[key] = table
+        return table
+
+
+class TemplateCache(object):
+    """Templates of atomic grids, shared by all atoms and molecular geometries.
+
+       The cache is not tied to one ``Part`` instance, such that the tables of
+       a template are reused when a trajectory is processed frame by frame.
+       Only grids without random rotation get a template.
+    """
+
+    def __init__(self, maxsize=100):
+        """
+           **Optional arguments:**
+
+           maxsize
+                The maximum number of templates kept. When the cache is full,
+                the least recently used template is discarded. When None, the
+                cache is unbounded.
+        """
+        self._maxsize = maxsize
+        self._store = OrderedDict()
+
+    def __len__(self):
+        return sum(len(templates) for templates in self._store.values())
+
+    def clear(self):
+        """Discard all templates."""
+        self._store.clear()
+
+    def get(self, atgrid):
+        """Return the template of an atomic grid, or None.
+
+           **Arguments:**
+
+           atgrid
+                An atomic integration grid.
+
+           A new template is only created for a grid without random rotation.
+           A randomly rotated grid is not a translation of any other grid, so
+           None is returned, unless it matches an existing template.
+        """
+        key = atgrid.rgrid.rtransform.to_string(), tuple(atgrid.nlls)
+        templates = self._store.get(key)
+        if templates is not None:
+            # mark as recently used
+            del self._store[key]
+            self._store[key] = templates
+            for template in templates:
+                if template.matches(atgrid):
+                    return template
+        # Without the flag, a rotation can not be excluded.
+        if getattr(atgrid, 'random_rotate', True):
+            return None
+        if templates is None:
+            templates = []
+            self._store[key] = templates
+        template = AtomicGridTemplate(atgrid)
+        templates.append(template)
+        if self._maxsize is not None:
+            while len(self) > self._maxsize:
+                oldest = next(iter(self._store))
+                self._store[oldest].pop(0)
+                if len(self._store[oldest]) == 0:
+                    del self._store[oldest]
+        return template
+
+
+# The default cache, shared by all Part instances.
+template_cache = TemplateCache()
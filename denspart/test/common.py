@@ -28,8 +28,7 @@ import numpy as np
 from glob import glob
 from contextlib import contextmanager
 
-from .. proatomdb import ProAtomDB, ProAtomRecord
-from horton.grid import LinearRTransform, PowerRTransform, ExpRTransform, RadialGrid
+from .. proatomdb import load_proatom_records
 
 
 __all__ = [
@@ -73,25 +72,9 @@ def get_atoms_npz(numbers, max_cation, max_anion, rtf_type, level):
 
 
 def load_atoms_npz(numbers, max_cation, max_anion, rtf_type='pow', level=None):
-    # radial transformation available
-    rtf_classes = {'lin': LinearRTransform, 'exp': ExpRTransform, 'pow': PowerRTransform}
-    # get filepath of atoms npz
+    # get filepath of atoms npz and load each file into a record
     filepaths = get_atoms_npz(numbers, max_cation, max_anion, rtf_type, level)
-    # load each file into a record
-    records = []
-    rtfclass = rtf_classes[rtf_type]
-    for filepath in filepaths:
-        with np.load(filepath, mmap_mode=None) as npz:
-            number, charge, energy = int(npz['number']), int(npz['charge']), float(npz['energy'])
-            dens, deriv = npz['dens'], npz['deriv']
-            rgrid = RadialGrid(rtfclass(*npz['rgrid']))
-            if 'pseudo_number' in list(npz.keys()):
-                pseudo_number = npz['pseudo_number']
-            else:
-                pseudo_number = None
-            record = ProAtomRecord(number, charge, energy, rgrid, dens, deriv, pseudo_number=pseudo_number)
-            records.append(record)
-    return records
+    return load_proatom_records(filepaths, rtf_type)
 
 
 @contextmanager
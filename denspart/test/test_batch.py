@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+# --
+
+
+import os
+import shutil
+
+import h5py as h5
+import numpy as np
+
+from nose.tools import assert_raises
+
+from .. batch import main
+from .common import get_fn, get_atoms_npz, tmpdir
+
+
+def test_batch_mbis():
+    fn_water = get_fn('water_sto3g_hf_g03_fchk_exp:5e-4:2e1:120:110.npz')
+    with tmpdir('denspart.test.test_batch.test_batch_mbis') as dn:
+        fn_output = os.path.join(dn, 'results.h5')
+        fn_missing = os.path.join(dn, 'missing.npz')
+        # The second input does not exist, which should not stop the third.
+        status = main([fn_water, fn_missing, fn_water, '-s', 'mbis', '-o', fn_output])
+        assert status == 1
+        with h5.File(fn_output, 'r') as f:
+            assert f.attrs['scheme'] == 'mbis'
+            assert (f['molecules/natom'][()] == [3, 0, 3]).all()
+            assert f['molecules/error'][0] == b''
+            assert f['molecules/error'][1] != b''
+            assert (f['molecules/begin'][()] == [0, 3, 3]).all()
+            assert (f['atoms/molecule'][()] == [0, 0, 0, 2, 2, 2]).all()
+            assert (f['atoms/number'][()] == [8, 1, 1, 8, 1, 1]).all()
+            charges = f['atoms/charges'][()]
+            assert abs(charges[:3] - charges[3:]).max() < 1e-10
+            assert abs(charges[:3].sum()) < 1e-3
+            assert f['atoms/pure_multipoles'].shape == (6, 16)
+            assert f['atoms/valence_charges'].shape == (6,)
+
+
+def test_batch_hirshfeld_nproc():
+    fn_water = get_fn('water_sto3g_hf_g03_fchk_exp:5e-4:2e1:120:110.npz')
+    fns_proatoms = get_atoms_npz([8, 6, 1], 1, -1, 'pow', 'hf_sto3g')
+    with tmpdir('denspart.test.test_batch.test_batch_hirshfeld_nproc') as dn:
+        fn_output = os.path.join(dn, 'results.h5')
+        status = main([fn_water, fn_water, '-s', 'h', '-j', '2', '-o', fn_output,
+                       '-p'] + fns_proatoms)
+        assert status == 0
+        with h5.File(fn_output, 'r') as f:
+            charges = f['atoms/charges'][()]
+    expecting = np.array([-0.246171541212, 0.123092011074, 0.123079530138]) # from HiPart
+    assert abs(charges[:3] - expecting).max() < 2e-3
+    assert abs(charges[3:] - expecting).max() < 2e-3
+
+
+def test_batch_is():
+    fn_water = get_fn('water_sto3g_hf_g03_fchk_exp:5e-4:2e1:120:110.npz')
+    with tmpdir('denspart.test.test_batch.test_batch_is') as dn:
+        fn_output = os.path.join(dn, 'results.h5')
+        status = main([fn_water, '-s', 'is', '-o', fn_output])
+        assert status == 0
+        with h5.File(fn_output, 'r') as f:
+            assert f['molecules/error'][0] == b''
+            assert f['molecules/niter'][0] > 0
+            charges = f['atoms/charges'][()]
+    expecting = np.array([-0.490017586929, 0.245018706885, 0.244998880045]) # From HiPart
+    assert abs(charges - expecting).max() < 2e-3
+
+
+def test_batch_global():
+    fn_water = get_fn('water_sto3g_hf_g03_fchk_exp:5e-4:2e1:120:110.npz')
+    fns_proatoms = get_atoms_npz([8, 6, 1], 1, -1, 'pow', 'hf_sto3g')
+    with tmpdir('denspart.test.test_batch.test_batch_global') as dn:
+        fn_output = os.path.join(dn, 'results.h5')
+        status = main([fn_water, '-s', 'h', '--global', '-o', fn_output, '-p'] + fns_proatoms)
+        assert status == 0
+        with h5.File(fn_output, 'r') as f:
+            assert not f.attrs['local']
+            charges = f['atoms/charges'][()]
+        expecting = np.array([-0.246171541212, 0.123092011074, 0.123079530138]) # from HiPart
+        assert abs(charges - expecting).max() < 2e-3
+        # Becke also accepts --global.
+        status = main([fn_water, '-s', 'b', '--global', '-o', fn_output])
+        assert status == 0
+        # The other schemes only work with local grids.
+        for scheme in 'is', 'mbis', 'gisa':
+            with assert_raises(SystemExit):
+                main([fn_water, '-s', scheme, '--global', '-o', fn_output])
+
+
+def test_batch_non_ascii():
+    fn_water = get_fn('water_sto3g_hf_g03_fchk_exp:5e-4:2e1:120:110.npz')
+    with tmpdir('denspart.test.test_batch.test_batch_non_ascii') as dn:
+        fn_output = os.path.join(dn, 'results.h5')
+        fn_copy = os.path.join(dn, u'w\xe4ter.npz')
+        shutil.copy(fn_water, fn_copy)
+        fn_missing = os.path.join(dn, u'\u6c34.npz')
+        # A few iterations only, such that the history of the charges has
+        # one row per atom. It is not a per-atom output.
+        status = main([fn_copy, fn_missing, '-s', 'mbis', '--maxiter', '3', '-o', fn_output])
+        assert status == 1
+        with h5.File(fn_output, 'r') as f:
+            filenames = [filename.decode('utf-8') for filename in f['molecules/filename'][()]]
+            assert filenames == [fn_copy, fn_missing]
+            assert f['molecules/error'][0] == b''
+            assert f['molecules/niter'][0] == 3
+            assert f['atoms/charges'].shape == (3,)
+            assert 'history_charges' not in f['atoms']
+            assert 'propars' not in f['atoms']
@@ -21,11 +21,13 @@
 # --
 
 
+import numpy as np
 from nose.tools import assert_raises
 
 from .common import load_molecule_npz, get_fn
-from .. becke import BeckeWPart
-from horton.grid import ExpRTransform, RadialGrid, BeckeMolGrid
+from .. becke import BeckeWPart, get_becke_neighbors, get_becke_radii, \
+    _get_becke_alphas, _get_blocks
+from horton.grid import AtomicGrid, ExpRTransform, RadialGrid, BeckeMolGrid
 
 
 def test_becke_n2_hfs_sto3g():
@@ -113,3 +115,64 @@ def test_becke_ch3_hf_sto3g():
     bp.do_all()
     sc = bp['spin_charges']
     assert abs(sc - [1.08458698, -0.02813376, -0.02813376, -0.02815979]).max() < 1e-3
+
+
+def test_becke_screening_azirine():
+    # load molecule data
+    coords, nums, pseudo_nums, dens, points = load_molecule_npz('2h-azirine-cc-fchk-medium.npz')
+    grid = BeckeMolGrid(coords, nums, pseudo_nums, random_rotate=False, mode='only', agspec='medium')
+    # Becke partitioning with and without neighbor lists
+    bp1 = BeckeWPart(coords, nums, pseudo_nums, grid, dens)
+    bp2 = BeckeWPart(coords, nums, pseudo_nums, grid, dens, threshold=None)
+    bp1.do_partitioning()
+    bp2.do_partitioning()
+    for index in range(bp1.natom):
+        assert abs(bp1['at_weights', index] - bp2['at_weights', index]).max() < 1e-10
+    # a looser threshold still gives accurate weights
+    bp3 = BeckeWPart(coords, nums, pseudo_nums, grid, dens, threshold=1e-8)
+    bp3.do_partitioning()
+    for index in range(bp1.natom):
+        assert abs(bp3['at_weights', index] - bp2['at_weights', index]).max() < 1e-7
+
+
+def test_becke_neighbors_chain():
+    # A long chain of carbon and hydrogen atoms
+    natom = 1000
+    coordinates = np.zeros((natom, 3))
+    coordinates[:, 0] = 2.6 * np.arange(natom)
+    numbers = np.where(np.arange(natom) % 3 == 0, 6, 1)
+    radii = get_becke_radii(numbers)
+    alphas = _get_becke_alphas(radii)
+    distances = np.sqrt(((coordinates[:, None, :] - coordinates)**2).sum(axis=2))
+    # The atomic grid of an atom in the middle
+    rgrid = RadialGrid(ExpRTransform(1e-3, 1e1, 100))
+    atgrid = AtomicGrid(6, 6, coordinates[natom // 2], (rgrid, 110))
+    points = atgrid.points
+    nneighbors = np.zeros(len(points), int)
+    for block in _get_blocks(points, 1024):
+        neighbors = get_becke_neighbors(points[block], coordinates, distances, alphas, 3, 1e-12)
+        assert (neighbors[1:] > neighbors[:-1]).all()
+        nneighbors[block] = len(neighbors)
+    # All points are covered once.
+    assert (nneighbors > 0).all()
+    # Close to the nucleus, only the nearest atoms are included, and on average
+    # the neighbor lists are much shorter than the number of atoms.
+    assert nneighbors.min() < 10
+    assert nneighbors.mean() < natom / 4
+
+
+def test_becke_onepass_lih_hf_321g():
+    # load molecule data
+    coords, nums, pnums, dens, points = load_molecule_npz('li_h_3-21G_hf_g09_fchk_exp:1e-3:1e1:100:110.npz')
+    rtf = ExpRTransform(1e-3, 1e1, 100)
+    rgrid = RadialGrid(rtf)
+    # With local=True, the one-pass option falls back to the weights per atom.
+    for mode, local in ('only', True), ('discard', False):
+        grid = BeckeMolGrid(coords, nums, pnums, (rgrid, 110), random_rotate=False, mode=mode)
+        bp1 = BeckeWPart(coords, nums, pnums, grid, dens, local=local)
+        bp2 = BeckeWPart(coords, nums, pnums, grid, dens, local=local, onepass=True)
+        bp1.do_charges()
+        bp2.do_charges()
+        for index in range(bp1.natom):
+            assert abs(bp1['at_weights', index] - bp2['at_weights', index]).max() < 1e-12
+        assert abs(bp1['charges'] - bp2['charges']).max() < 1e-10
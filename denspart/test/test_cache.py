@@ -23,7 +23,7 @@
 import numpy as np
 from nose.tools import assert_raises
 
-from .. cache import JustOnceClass, Cache, just_once
+from .. cache import JustOnceClass, ArrayPool, Cache, just_once
 
 
 class Example(JustOnceClass):
@@ -311,3 +311,110 @@ def test_tags():
         c.load('tmp', alloc=5, tags='aw')
     with assert_raises(ValueError):
         c.load('tmp', alloc=5, tags='ab')
+
+
+def test_memory_report():
+    c = Cache()
+    c.load('at_weights', 0, alloc=10)
+    c.load('at_weights', 1, alloc=20)
+    c.dump('promoldens', np.zeros(30))
+    c.dump('niter', 5)
+    report = c.get_memory_report()
+    assert report['nbyte'] == 480
+    assert report['peak'] == 480
+    assert report['families']['at_weights'] == {
+        'nbyte': 240, 'peak': 240, 'nalloc': 2, 'nreuse': 0, 'ndump': 0}
+    assert report['families']['promoldens']['ndump'] == 1
+    assert report['families']['niter']['nbyte'] == 0
+    # invalidated items keep their memory, which is reused
+    c.clear()
+    assert c.get_memory_report()['nbyte'] == 480
+    c.load('at_weights', 0, alloc=10)
+    report = c.get_memory_report()
+    assert report['families']['at_weights']['nreuse'] == 1
+    assert report['families']['at_weights']['nalloc'] == 2
+    # reallocation with a different shape
+    c.load('at_weights', 1, alloc=5)
+    report = c.get_memory_report()
+    assert report['families']['at_weights']['nalloc'] == 3
+    assert report['families']['at_weights']['nbyte'] == 120
+    assert report['nbyte'] == 360
+    # replacing and deallocating items
+    c.dump('promoldens', np.zeros(10))
+    assert c.get_memory_report()['nbyte'] == 200
+    c.clear(dealloc=True)
+    report = c.get_memory_report()
+    assert report['nbyte'] == 0
+    assert report['peak'] == 480
+    assert report['families']['at_weights']['peak'] == 240
+
+
+def test_array_pool():
+    pool = ArrayPool()
+    a = pool.take((4, 3))
+    assert a.shape == (4, 3)
+    assert pool.ntake == 1
+    assert pool.nreuse == 0
+    a[:] = 1.0
+    pool.give(a)
+    assert len(pool) == 1
+    assert pool.nbyte == 96
+    # a different shape gets a new array
+    b = pool.take(12)
+    assert b is not a
+    # the same shape is recycled and zeroed
+    c = pool.take((4, 3))
+    assert c is a
+    assert (c == 0).all()
+    assert pool.nreuse == 1
+    assert pool.nbyte == 0
+    pool.clear()
+    assert len(pool) == 0
+    assert pool.nbyte == 0
+
+
+def test_array_pool_maxbytes():
+    pool = ArrayPool(maxbytes=200)
+    a = np.zeros(10)
+    b = np.zeros(5)
+    pool.give(a)
+    pool.give(b)
+    assert pool.nbyte == 120
+    # arrays that do not fit at all are dropped
+    pool.give(np.zeros(30))
+    assert pool.nbyte == 120
+    # recently used shapes are kept
+    assert pool.take(10) is a
+    pool.give(a)
+    pool.give(np.zeros(12))
+    assert len(pool) == 2
+    assert pool.nbyte == 176
+    assert pool.take(10) is a
+    assert pool.take(5) is not b
+
+
+def test_cache_pool():
+    pool = ArrayPool()
+    c = Cache(pool=pool)
+    assert c.pool is pool
+    a = c.load('at_weights', 0, alloc=10)[0]
+    c.dump('promoldens', np.zeros(10))
+    # deallocated arrays are not given back, they may still be in use
+    c.clear(dealloc=True)
+    assert len(pool) == 0
+    assert c.load('at_weights', 0, alloc=10)[0] is not a
+    # release gives back the arrays allocated by load
+    c.dump('promoldens', np.zeros(10))
+    c.release()
+    assert len(pool) == 1
+    assert pool.nbyte == 80
+    assert ('at_weights', 0) not in c
+    assert 'promoldens' not in c
+    # the next cache reuses the array
+    c = Cache(pool=pool)
+    c.load('at_weights', 0, alloc=10)
+    assert pool.nreuse == 1
+    assert len(pool) == 0
+    report = c.get_memory_report()
+    assert report['pool'] == {'nbyte': 0, 'narray': 0, 'ntake': 3, 'nreuse': 1}
+    assert 'pool' not in Cache().get_memory_report()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import numpy as np
+
+from horton.grid import ExpRTransform, RadialGrid
+from .. gisa import _get_gisa_exponents, _eval_gisa_proatom, _opt_gisa_propars
+
+
+def test_get_gisa_exponents():
+    alphas = _get_gisa_exponents(1)
+    assert abs(alphas[0] - 0.1) < 1e-12
+    assert (alphas[1:] / alphas[:-1] - 2.5 < 1e-12).all()
+    assert alphas[-1] >= 10.0
+    assert len(_get_gisa_exponents(8)) > len(alphas)
+
+
+def test_eval_gisa_proatom():
+    propars = np.array([0.5, 1.5])
+    alphas = np.array([0.3, 4.0])
+    r = np.linspace(0.0, 5.0, 101)
+    rho = np.zeros(101)
+    deriv = np.zeros(101)
+    _eval_gisa_proatom(r, propars, alphas, rho, deriv)
+    expected = (0.5 * (0.3 / np.pi)**1.5 * np.exp(-0.3 * r**2) +
+                1.5 * (4.0 / np.pi)**1.5 * np.exp(-4.0 * r**2))
+    assert abs(rho - expected).max() < 1e-12
+    eps = 1e-6
+    rho_plus = np.zeros(101)
+    rho_min = np.zeros(101)
+    _eval_gisa_proatom(r + eps, propars, alphas, rho_plus)
+    _eval_gisa_proatom(r - eps, propars, alphas, rho_min)
+    assert abs(deriv - (rho_plus - rho_min) / (2 * eps)).max() < 1e-5
+
+
+def test_opt_gisa_propars():
+    rgrid = RadialGrid(ExpRTransform(1e-3, 2e1, 150))
+    r = rgrid.radii
+    alphas = _get_gisa_exponents(1)
+    basis = (alphas[:, None] / np.pi)**1.5 * np.exp(-alphas[:, None] * r**2)
+    # fit to a hydrogen 1s density
+    rho = np.exp(-2 * r) / np.pi
+    propars = _opt_gisa_propars(rho, basis, rgrid.weights)
+    assert (propars >= 0).all()
+    # the populations add up to the population of the atom
+    assert abs(propars.sum() - rgrid.integrate(rho)) < 1e-8
+    # the fit is reasonable
+    error = np.dot(propars, basis) - rho
+    assert np.sqrt(rgrid.integrate(error, error)) < 2e-3
+    # a different population is imposed
+    propars = _opt_gisa_propars(rho, basis, rgrid.weights, 0.9)
+    assert (propars >= 0).all()
+    assert abs(propars.sum() - 0.9) < 1e-8
+    # a density that can be represented exactly
+    expected = np.zeros(len(alphas))
+    expected[[1, 4]] = [0.7, 0.3]
+    propars = _opt_gisa_propars(np.dot(expected, basis), basis, rgrid.weights)
+    assert abs(propars - expected).max() < 1e-8
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import os
+
+import h5py as h5
+import numpy as np
+from nose.tools import assert_raises
+
+from .common import tmpdir
+from .. history import IterationHistory
+
+
+def test_history_off():
+    history = IterationHistory(None)
+    assert history.mode == 'off'
+    history.append('foo', np.ones(3))
+    assert history.get('foo') is None
+
+
+def test_history_ring():
+    history = IterationHistory(3)
+    assert history.mode == 'ring'
+    array = np.zeros(2)
+    for i in range(2):
+        array[:] = i
+        history.append('foo', array)
+    assert (history.get('foo') == [[0, 0], [1, 1]]).all()
+    for i in range(2, 5):
+        array[:] = i
+        history.append('foo', array)
+    assert len(history) == 5
+    assert (history.get('foo') == [[2, 2], [3, 3], [4, 4]]).all()
+    with assert_raises(ValueError):
+        IterationHistory(-1)
+
+
+def test_history_hdf5():
+    with tmpdir('denspart.test.test_history.test_history_hdf5') as dn:
+        fn = os.path.join(dn, 'history.h5')
+        history = IterationHistory(fn)
+        assert history.mode == 'hdf5'
+        for i in range(5):
+            history.append('foo', np.array([i, 2 * i]))
+        assert (history.get('foo')[:] == [[0, 0], [1, 2], [2, 4], [3, 6], [4, 8]]).all()
+        # an existing dataset is replaced
+        with h5.File(os.path.join(dn, 'other.h5'), 'w') as f:
+            f['foo'] = np.zeros(3)
+            history = IterationHistory(f)
+            history.append('foo', np.ones(2))
+            assert f['foo'].shape == (1, 2)
+
+
+def test_history_hdf5_close():
+    with tmpdir('denspart.test.test_history.test_history_hdf5_close') as dn:
+        fn = os.path.join(dn, 'history.h5')
+        history = IterationHistory(fn)
+        assert history.owns_file
+        history.append('foo', np.ones(2))
+        history.close()
+        history.close()
+        assert history.get('foo') is None
+        with assert_raises(RuntimeError):
+            history.append('foo', np.ones(2))
+        # The file is flushed and can be opened again.
+        with h5.File(fn, 'r') as f:
+            assert (f['foo'][:] == [[1, 1]]).all()
+        history = IterationHistory(fn)
+        history.append('foo', np.zeros(2))
+        history.close()
+        with h5.File(fn, 'r') as f:
+            assert (f['foo'][:] == [[0, 0]]).all()
+        # A group of the caller is not closed.
+        with h5.File(os.path.join(dn, 'other.h5'), 'w') as f:
+            history = IterationHistory(f)
+            assert not history.owns_file
+            history.append('foo', np.ones(2))
+            history.close()
+            assert f['foo'].shape == (1, 2)
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+from .. log import Timer
+
+
+def test_timer_sections():
+    timer = Timer()
+    report = timer.report
+    with timer.section('outer'):
+        for i in range(3):
+            with timer.section('inner'):
+                pass
+    assert list(report.keys()) == ['outer', 'inner']
+    assert report['outer']['count'] == 1
+    assert report['inner']['count'] == 3
+    assert report['outer']['time'] >= report['inner']['time'] >= 0.0
+    assert len(timer.format()) == 3
+
+
+def test_timer_exception():
+    timer = Timer()
+    try:
+        with timer.section('fail'):
+            raise ValueError
+    except ValueError:
+        pass
+    assert timer.report['fail']['count'] == 1
+
+
+def test_timer_count_reset():
+    timer = Timer()
+    report = timer.report
+    timer.count('poisson_solves')
+    timer.count('poisson_solves', 4)
+    assert report['poisson_solves'] == {'count': 5}
+    timer.reset()
+    # The report is updated in place.
+    assert timer.report is report
+    assert len(report) == 0
@@ -21,7 +21,9 @@
 # --
 
 
-from .. mbis import _get_nshell, _get_initial_mbis_propars
+import numpy as np
+
+from .. mbis import _get_nshell, _get_initial_mbis_propars, _eval_mbis_proatom
 
 
 def test_get_nshell():
@@ -34,3 +36,19 @@ def test_get_initial_mbis_propars():
     assert (_get_initial_mbis_propars(1) == [1.0, 2.0]).all()
     assert (_get_initial_mbis_propars(2) == [2.0, 4.0]).all()
     assert (_get_initial_mbis_propars(3) == [2.0, 6.0, 1.0, 2.0]).all()
+
+
+def test_eval_mbis_proatom():
+    propars = np.array([2.0, 12.0, 6.5, 2.5])
+    r = np.linspace(0.0, 5.0, 101)
+    rho = np.zeros(101)
+    deriv = np.zeros(101)
+    _eval_mbis_proatom(r, propars, rho, deriv)
+    expected = (2.0 * 12.0**3 * np.exp(-12.0 * r) + 6.5 * 2.5**3 * np.exp(-2.5 * r)) / (8 * np.pi)
+    assert abs(rho - expected).max() < 1e-12
+    eps = 1e-6
+    rho_plus = np.zeros(101)
+    rho_min = np.zeros(101)
+    _eval_mbis_proatom(r + eps, propars, rho_plus, work=np.zeros(101))
+    _eval_mbis_proatom(r - eps, propars, rho_min, work=np.zeros(101))
+    assert abs(deriv - (rho_plus - rho_min) / (2 * eps)).max() < 1e-5
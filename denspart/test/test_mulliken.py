@@ -21,13 +21,15 @@
 
 
 import numpy as np
+from scipy import sparse
 
 from numpy.testing import assert_almost_equal, assert_equal
 
-from .. mulliken import get_mulliken_operators
+from .. mulliken import (get_mulliken_operators, get_mulliken_populations, partition_mulliken,
+                         get_mulliken_pair_populations, get_basis_centers, BasisCenterIndex)
 
 
-def test_mulliken_operators_water_sto3g():
+def get_water_sto3g():
     # data from water_sto3g_hf_g03.fchk
     numbers = np.array([8, 1, 1])
     ncenter = 3
@@ -56,6 +58,11 @@ def test_mulliken_operators_water_sto3g():
                     [0., 0., 0., 0., 1., 0.39594342, -0.13197959],
                     [0.05490733, 0.47954331, 0., 0., 0.39594342, 1., 0.23846113],
                     [0.05490732, 0.47954323, 0.37329955, 0., -0.13197959, 0.23846113, 1.]])
+    return numbers, ncenter, shell_types, shell_maps, dm_full, olp
+
+
+def test_mulliken_operators_water_sto3g():
+    numbers, ncenter, shell_types, shell_maps, dm_full, olp = get_water_sto3g()
     # compute operators
     operators = get_mulliken_operators(olp, ncenter, shell_types, shell_maps)
     # check operators are symmetric
@@ -68,3 +75,91 @@ def test_mulliken_operators_water_sto3g():
     assert_almost_equal(charges.sum(), 0.0, decimal=6)
     expected = np.array([-3.81897766E-01, 1.90948904E-01, 1.90948861E-01])
     assert_almost_equal(charges, expected, decimal=6)
+
+
+def test_mulliken_populations_water_sto3g():
+    numbers, ncenter, shell_types, shell_maps, dm_full, olp = get_water_sto3g()
+    operators = get_mulliken_operators(olp, ncenter, shell_types, shell_maps)
+    # a single density matrix
+    populations = get_mulliken_populations(dm_full, olp, ncenter, shell_types, shell_maps)
+    expected = np.array([np.einsum('ab,ba', operator, dm_full) for operator in operators])
+    assert_almost_equal(populations, expected, decimal=10)
+    assert_almost_equal(numbers - populations, [-3.81897766E-01, 1.90948904E-01, 1.90948861E-01],
+                        decimal=6)
+    # a stack of density matrices, including a non-symmetric one
+    np.random.seed(1)
+    dm_other = np.random.uniform(-1, 1, dm_full.shape)
+    dms = np.array([[dm_full, 0.5 * dm_full], [dm_other, dm_other.T]])
+    populations = get_mulliken_populations(dms, olp, ncenter, shell_types, shell_maps)
+    assert populations.shape == (2, 2, ncenter)
+    for i in range(2):
+        for j in range(2):
+            expected = [np.einsum('ab,ba', operator, dms[i, j]) for operator in operators]
+            assert_almost_equal(populations[i, j], expected, decimal=10)
+
+
+def test_basis_center_index():
+    shell_types = [0, 1, -2, 2, 0, 0]
+    shell_maps = [0, 0, 2, 1, 0, 3]
+    assert_equal(get_basis_centers(shell_types, shell_maps),
+                 [0, 0, 0, 0, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 0, 3])
+    basis_index = BasisCenterIndex(3, shell_types, shell_maps)
+    assert basis_index.nbasis == 17
+    assert_equal(basis_index.selections[0], [0, 1, 2, 3, 15])
+    assert basis_index.selections[1] == slice(9, 15)
+    assert basis_index.selections[2] == slice(4, 9)
+    # operators from the index must match the original masking procedure
+    np.random.seed(2)
+    overlap = np.random.uniform(-1, 1, (17, 17))
+    dm = np.random.uniform(-1, 1, (17, 17))
+    operators = get_mulliken_operators(overlap, 3, None, None, basis_index=basis_index)
+    for icenter in range(3):
+        operator = overlap.copy()
+        partition_mulliken(operator, 17, shell_types, shell_maps, icenter)
+        assert_equal(operators[icenter], operator)
+    populations = get_mulliken_populations(dm, overlap, 3, None, None, basis_index=basis_index)
+    expected = [np.einsum('ab,ba', operator, dm) for operator in operators]
+    assert_almost_equal(populations, expected, decimal=10)
+
+
+def test_mulliken_sparse_water_sto3g():
+    numbers, ncenter, shell_types, shell_maps, dm_full, olp = get_water_sto3g()
+    basis_index = BasisCenterIndex(ncenter, shell_types, shell_maps)
+    expected = get_mulliken_populations(dm_full, olp, ncenter, shell_types, shell_maps)
+    olp_sparse = sparse.csr_matrix(olp)
+    dm_sparse = sparse.csr_matrix(dm_full)
+    # sparse operators
+    operators = get_mulliken_operators(olp, ncenter, shell_types, shell_maps)
+    operators_sparse = get_mulliken_operators(olp_sparse, ncenter, shell_types, shell_maps)
+    for operator, operator_sparse in zip(operators, operators_sparse):
+        assert sparse.issparse(operator_sparse)
+        assert_almost_equal(operator_sparse.toarray(), operator, decimal=12)
+    # block-sparse operators
+    for icenter, operator in enumerate(operators):
+        blocks = basis_index.get_operator_blocks(olp_sparse, icenter)
+        for (jcenter, kcenter), block in blocks.items():
+            assert icenter in (jcenter, kcenter)
+            selection_j = basis_index.selections[jcenter]
+            selection_k = basis_index.selections[kcenter]
+            assert_almost_equal(block, operator[selection_j][:, selection_k], decimal=12)
+    # populations
+    populations = get_mulliken_populations(dm_sparse, olp_sparse, ncenter, shell_types, shell_maps)
+    assert_almost_equal(populations, expected, decimal=10)
+    populations = get_mulliken_populations([dm_sparse, dm_sparse], olp_sparse, ncenter,
+                                           shell_types, shell_maps)
+    assert_almost_equal(populations, [expected, expected], decimal=10)
+    # a stack of dense density matrices with a sparse overlap matrix
+    dms = np.array([[dm_full, 2 * dm_full]] * 3)
+    populations = get_mulliken_populations(dms, olp_sparse, ncenter, shell_types, shell_maps)
+    assert populations.shape == (3, 2, ncenter)
+    assert_almost_equal(populations[:, 0], [expected] * 3, decimal=10)
+    assert_almost_equal(populations[:, 1], [2 * expected] * 3, decimal=10)
+    # pair populations
+    pair_populations = get_mulliken_pair_populations(dm_sparse, olp_sparse, ncenter, shell_types,
+                                                     shell_maps)
+    assert (0, 0) in pair_populations
+    assert_almost_equal(pair_populations[1, 2], pair_populations[2, 1], decimal=10)
+    populations = np.zeros(ncenter)
+    for (icenter, jcenter), value in pair_populations.items():
+        populations[icenter] += value
+    assert_almost_equal(populations, expected, decimal=10)
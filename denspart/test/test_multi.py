@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+# --
+
+
+import numpy as np
+from nose.tools import assert_raises
+
+from horton.grid import ExpRTransform, RadialGrid, BeckeMolGrid
+from .. multi import MultiWPart
+from .. proatomdb import ProAtomDB
+from .. utils import wpart_schemes
+from .common import load_molecule_npz, load_atoms_npz
+
+
+def get_water_hf_sto3g():
+    records = load_atoms_npz(numbers=[8, 6, 1], max_cation=1, max_anion=-1, level='hf_sto3g')
+    proatomdb = ProAtomDB(records)
+    coords, nums, pseudo_nums, dens, points = load_molecule_npz('water_sto3g_hf_g03_fchk_exp:5e-4:2e1:120:110.npz')
+    rgrid = RadialGrid(ExpRTransform(5e-4, 2e1, 120))
+    grid = BeckeMolGrid(coords, nums, pseudo_nums, (rgrid, 110), random_rotate=False, mode='only')
+    return coords, nums, pseudo_nums, grid, dens, proatomdb
+
+
+def test_multi_water_hf_sto3g():
+    coords, nums, pseudo_nums, grid, dens, proatomdb = get_water_hf_sto3g()
+    schemes = ['mbis', 'hi', 'is', 'h', 'b', 'gisa']
+    multi = MultiWPart(coords, nums, pseudo_nums, grid, dens, schemes, proatomdb)
+    assert multi.schemes == ['b', 'h', 'hi', 'is', 'mbis', 'gisa']
+    charges = multi.get_charges()
+    for scheme in schemes:
+        kwargs = {'proatomdb': proatomdb} if scheme in ['h', 'hi'] else {}
+        part = wpart_schemes(scheme)(coords, nums, pseudo_nums, grid, dens, **kwargs)
+        part.do_charges()
+        assert abs(charges[scheme] - part['charges']).max() < 1e-3
+        if scheme == 'hi':
+            # Seeded with the Hirshfeld charges, the first iteration is skipped.
+            assert multi[scheme]['niter'] < part['niter']
+        elif scheme == 'is':
+            # Seeded with the Hirshfeld proatoms
+            assert multi[scheme]['niter'] <= part['niter']
+    # The isolated neutral atoms are shared between Hirshfeld and Hirshfeld-I.
+    for index in range(3):
+        key = ('isolated', 0, index, id(grid))
+        assert multi['h'].cache.load(*key) is multi['hi'].cache.load(*key)
+        assert multi['mbis'].get_distances(index) is multi['gisa'].get_distances(index)
+    assert multi['mbis']._spherical_averager is multi['is']._spherical_averager
+
+
+def test_multi_seed_is():
+    coords, nums, pseudo_nums, grid, dens, proatomdb = get_water_hf_sto3g()
+    multi = MultiWPart(coords, nums, pseudo_nums, grid, dens, ('h', 'is'), proatomdb)
+    charges = multi.get_charges()
+    part = multi['is']
+    hpart = multi['h']
+    # The seeded parameters have the layout of the Iterative Stockholder
+    # parameters: the Hirshfeld proatom of each atom on its radial grid.
+    seed = part._seed_propars
+    assert seed.shape == part['propars'].shape
+    for index in range(part.natom):
+        radii = part.get_rgrid(index).radii
+        my_seed = part._get_atom_propars(index, seed)
+        assert my_seed.shape == radii.shape
+        assert abs(my_seed - hpart.get_proatom_spline(index)(radii)).max() < 1e-10
+    expecting = np.array([-0.490017586929, 0.245018706885, 0.244998880045]) # From HiPart
+    assert abs(charges['is'] - expecting).max() < 2e-3
+
+
+def test_multi_do_all():
+    coords, nums, pseudo_nums, grid, dens, proatomdb = get_water_hf_sto3g()
+    multi = MultiWPart(coords, nums, pseudo_nums, grid, dens, ['h', 'mbis'], proatomdb,
+                       options={'mbis': {'threshold': 1e-4}})
+    names = multi.do_all()
+    assert sorted(names) == ['h', 'mbis']
+    assert 'charges' in names['h']
+    assert 'valence_charges' in names['mbis']
+    # The shared items are not outputs.
+    assert not any(isinstance(name, tuple) and name[0] == 'distances' for name in names['mbis'])
+
+
+def test_multi_errors():
+    coords, nums, pseudo_nums, grid, dens, proatomdb = get_water_hf_sto3g()
+    with assert_raises(ValueError):
+        MultiWPart(coords, nums, pseudo_nums, grid, dens, ['foo'])
+    with assert_raises(ValueError):
+        MultiWPart(coords, nums, pseudo_nums, grid, dens, ['hi'])
+    multi = MultiWPart(coords, nums, pseudo_nums, grid, dens, ['b'])
+    with assert_raises(KeyError):
+        multi['h']
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+# --
+
+
+import importlib
+import os
+import subprocess
+import sys
+
+import denspart
+
+
+def test_public_names():
+    for submodule, names in denspart._submodule_names.items():
+        module = importlib.import_module('denspart.' + submodule)
+        assert sorted(names) == sorted(module.__all__)
+        for name in names:
+            assert getattr(denspart, name) is getattr(module, name)
+    assert denspart.log is importlib.import_module('denspart.log').log
+    assert set(denspart.__all__) <= set(dir(denspart))
+
+
+def test_lazy_import():
+    if sys.version_info < (3, 7):
+        # All submodules are imported eagerly.
+        return
+    # A fresh process is needed because the test suite imports everything.
+    script = (
+        'import sys, denspart\n'
+        'assert "h5py" not in sys.modules\n'
+        'assert "denspart.cache" not in sys.modules\n'
+        'denspart.Cache\n'
+        'assert "denspart.cache" in sys.modules\n'
+        'assert "h5py" not in sys.modules\n'
+    )
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(denspart.__file__))
+    env['PYTHONPATH'] = os.pathsep.join([root, env.get('PYTHONPATH', '')])
+    subprocess.check_call([sys.executable, '-c', script], env=env)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import numpy as np
+
+from .. poisson import get_spline_key, PoissonCache
+from horton.grid import ExpRTransform, RadialGrid, CubicSpline, solve_poisson_becke
+
+
+def get_test_splines():
+    rtf = ExpRTransform(1e-3, 1e1, 100)
+    rgrid = RadialGrid(rtf)
+    rho = np.exp(-rgrid.radii)
+    spline1 = CubicSpline(rho, -rho, rtf)
+    spline2 = CubicSpline(rho.copy(), -rho, rtf)
+    spline3 = CubicSpline(2 * rho, -2 * rho, rtf)
+    return spline1, spline2, spline3
+
+
+def test_spline_key():
+    spline1, spline2, spline3 = get_test_splines()
+    assert get_spline_key(spline1) == get_spline_key(spline2)
+    assert get_spline_key(spline1) != get_spline_key(spline3)
+
+
+def test_poisson_cache_solve_many():
+    spline1, spline2, spline3 = get_test_splines()
+    cache = PoissonCache()
+    v1, v2, v3 = cache.solve_many([[spline1], [spline2], [spline3]])
+    assert cache.nsolve == 2
+    assert len(cache) == 2
+    assert v1 is v2
+    expected = solve_poisson_becke([spline1])
+    assert abs(v1[0].y - expected[0].y).max() < 1e-12
+    assert abs(v3[0].y - 2 * expected[0].y).max() < 1e-10
+    # solutions are reused in later calls
+    cache.solve([spline3])
+    assert cache.nsolve == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_poisson_cache_maxsize():
+    spline1, spline2, spline3 = get_test_splines()
+    cache = PoissonCache(maxsize=1)
+    cache.solve([spline1])
+    cache.solve([spline3])
+    assert len(cache) == 1
+    cache.solve([spline1])
+    assert cache.nsolve == 3
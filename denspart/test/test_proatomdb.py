@@ -22,8 +22,8 @@
 
 import numpy as np
 
-from .. proatomdb import ProAtomDB
-from .common import get_fn, load_atoms_npz
+from .. proatomdb import ProAtomDB, load_proatom_records, load_proatomdb
+from .common import get_fn, get_atoms_npz, load_atoms_npz
 
 
 def test_db_basics():
@@ -195,3 +195,19 @@ def test_empty_proatom():
     records = load_atoms_npz(numbers=[8], max_cation=1, max_anion=0)
     padb = ProAtomDB(records)
     assert (padb.get_rho(8, {}) == 0.0).all()
+
+
+def test_load_proatomdb():
+    filenames = get_atoms_npz([8, 6, 1], 1, -1, 'pow', 'hf_sto3g')
+    records = load_proatom_records(filenames)
+    assert len(records) == len(filenames)
+    for filename, record in zip(filenames, records):
+        with np.load(filename) as npz:
+            assert record.number == npz['number']
+            assert record.charge == npz['charge']
+            assert (record.rho == npz['dens']).all()
+            assert record.rgrid.size == len(npz['dens'])
+    proatomdb = load_proatomdb(filenames)
+    assert proatomdb.get_numbers() == [1, 6, 8]
+    for record in records:
+        assert proatomdb.get_record(record.number, record.charge) == record
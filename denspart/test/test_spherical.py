@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+
+
+import numpy as np
+
+from horton.grid import AtomicGrid, ExpRTransform, RadialGrid
+from .. spherical import get_shell_shape, get_angular_weights, SphericalAverager
+
+
+def get_atgrids():
+    rgrid = RadialGrid(ExpRTransform(1e-3, 1e1, 20))
+    return [
+        AtomicGrid(8, 8, np.zeros(3), (rgrid, 26), random_rotate=False),
+        AtomicGrid(1, 1, np.array([0.0, 0.0, 1.5]), (rgrid, 26)),
+        AtomicGrid(1, 1, np.array([0.0, 1.5, 0.0]), (rgrid, 50)),
+    ]
+
+
+def test_shell_shape_angular_weights():
+    atgrids = get_atgrids()
+    assert get_shell_shape(atgrids[0]) == (20, 26)
+    assert get_shell_shape(atgrids[2]) == (20, 50)
+    weights = get_angular_weights(atgrids[0])
+    assert weights.shape == (26,)
+    assert abs(weights.sum() - 1) < 1e-12
+    # The random rotation does not affect the weights.
+    assert abs(weights - get_angular_weights(atgrids[1])).max() < 1e-13
+
+
+def test_spherical_averager():
+    atgrids = get_atgrids()
+    averager = SphericalAverager(atgrids)
+    rng = np.random.RandomState(1)
+    factors = [(rng.uniform(0, 1, atgrid.size), rng.uniform(0, 1, atgrid.size))
+               for atgrid in atgrids]
+    expected = [atgrid.get_spherical_average(*factors[index])
+                for index, atgrid in enumerate(atgrids)]
+    # all atoms at once
+    outputs = [np.zeros(20) for atgrid in atgrids]
+    averager.compute([0, 1, 2], lambda index: factors[index], outputs)
+    for index in range(3):
+        assert abs(outputs[index] - expected[index]).max() < 1e-12
+    # a subset of the atoms in a group
+    output = np.zeros(20)
+    averager.compute([1], lambda index: factors[index], [output])
+    assert abs(output - expected[1]).max() < 1e-12
+    # a single factor
+    averager.compute([0], lambda index: factors[index][:1], [output])
+    assert abs(output - atgrids[0].get_spherical_average(factors[0][0])).max() < 1e-12
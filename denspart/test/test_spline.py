@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+# --
+
+
+import numpy as np
+from nose.tools import assert_raises
+
+from horton.grid import CubicSpline, ExpRTransform, LinearRTransform, PowerRTransform
+from .. spline import RadialMap, RadialSplines
+
+
+def test_radial_map():
+    for rtf in [ExpRTransform(1e-3, 1e1, 50), LinearRTransform(1e-3, 1e1, 50),
+                PowerRTransform(1e-3, 1e1, 50)]:
+        rmap = RadialMap(rtf.get_radii())
+        t = np.arange(50, dtype=float)
+        assert abs(rmap.radius(t) - rtf.get_radii()).max() < 1e-12
+        assert abs(rmap.deriv(t) - rtf.get_deriv()).max() < 1e-10
+        assert abs(rmap.inv(rtf.get_radii()) - t).max() < 1e-8
+    with assert_raises(ValueError):
+        RadialMap([0.1, 0.2, 0.5, 0.6])
+
+
+def get_splines(rtf):
+    radii = rtf.get_radii()
+    ys = np.array([np.exp(-radii), 3 * np.exp(-2 * radii**2)])
+    dxs = np.array([-np.exp(-radii), -12 * radii * np.exp(-2 * radii**2)])
+    return [CubicSpline(y, dx, rtf) for y, dx in zip(ys, dxs)]
+
+
+def test_radial_splines_cubic_spline():
+    rtf = ExpRTransform(1e-3, 1e1, 100)
+    cubic_splines = get_splines(rtf)
+    splines = RadialSplines.from_cubic_splines(cubic_splines)
+    assert splines.nspline == 2
+    # Also outside the grid, to test the extrapolation.
+    r = np.random.uniform(0, 12, 200)
+    output = np.zeros(200)
+    deriv = np.zeros(200)
+    for ispline, cubic_spline in enumerate(cubic_splines):
+        splines(ispline, r, output, deriv)
+        assert abs(output - cubic_spline(r)).max() < 1e-10
+        assert abs(deriv - cubic_spline.deriv(r)).max() < 1e-8
+
+
+def test_radial_splines_eval_points():
+    rtf = ExpRTransform(1e-3, 1e1, 100)
+    cubic_splines = get_splines(rtf)
+    splines = RadialSplines.from_cubic_splines(cubic_splines)
+    rng = np.random.RandomState(1)
+    points = rng.normal(0, 2, (300, 3))
+    centers = rng.normal(0, 1, (3, 3))
+    isplines = [0, 1, 0]
+    # one array per center
+    outputs = np.zeros((3, 300))
+    gradients = np.zeros((3, 300, 3))
+    splines.eval_points(points, centers, isplines, outputs, gradients)
+    for icenter, ispline in enumerate(isplines):
+        deltas = points - centers[icenter]
+        distances = np.sqrt((deltas**2).sum(axis=1))
+        expected = cubic_splines[ispline](distances)
+        assert abs(outputs[icenter] - expected).max() < 1e-10
+        expected = cubic_splines[ispline].deriv(distances)[:, None] * deltas / distances[:, None]
+        assert abs(gradients[icenter] - expected).max() < 1e-8
+    # the sum over all centers
+    output = np.zeros(300)
+    gradient = np.zeros((300, 3))
+    splines.eval_points(points, centers, isplines, output, gradient)
+    assert abs(output - outputs.sum(axis=0)).max() < 1e-12
+    assert abs(gradient - gradients.sum(axis=0)).max() < 1e-12
+
+
+def test_radial_splines_natural():
+    rtf = ExpRTransform(1e-3, 1e1, 100)
+    radii = rtf.get_radii()
+    splines = RadialSplines(radii, np.exp(-radii))
+    r = np.linspace(1e-3, 1e1, 50)
+    assert abs(splines(0, r) - np.exp(-r)).max() < 1e-5
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+# --
+
+
+import numpy as np
+from nose.tools import assert_raises
+
+from horton.grid import AtomicGrid, ExpRTransform, RadialGrid, BeckeMolGrid
+from .common import load_molecule_npz
+from .. becke import BeckeWPart
+from .. template import get_cartesian_powers, get_pure_polynomials, get_radial_powers, \
+    TemplateCache, template_cache
+from .test_wpart import check_water_hf_sto3g
+
+
+def test_polynomials():
+    rng = np.random.RandomState(1)
+    deltas = rng.normal(0, 1, (10, 3))
+    x, y, z = deltas.T
+    r2 = x * x + y * y + z * z
+    expected = np.array([
+        np.ones(10), z, x, y,
+        (3 * z * z - r2) / 2, np.sqrt(3) * x * z, np.sqrt(3) * y * z,
+        np.sqrt(3) / 2 * (x * x - y * y), np.sqrt(3) * x * y,
+        z * (5 * z * z - 3 * r2) / 2, np.sqrt(3.0 / 8) * x * (5 * z * z - r2),
+        np.sqrt(3.0 / 8) * y * (5 * z * z - r2), np.sqrt(15) / 2 * z * (x * x - y * y),
+        np.sqrt(15) * x * y * z, np.sqrt(5.0 / 8) * x * (x * x - 3 * y * y),
+        np.sqrt(5.0 / 8) * y * (3 * x * x - y * y),
+    ])
+    assert abs(get_pure_polynomials(deltas, 3) - expected).max() < 1e-12
+    expected = np.array([np.ones(10), x, y, z, x * x, x * y, x * z, y * y, y * z, z * z])
+    assert abs(get_cartesian_powers(deltas, 2) - expected).max() < 1e-12
+    expected = np.array([np.ones(10), np.sqrt(r2), r2])
+    assert abs(get_radial_powers(np.sqrt(r2), 2) - expected).max() < 1e-12
+
+
+def get_atgrid(center, random_rotate=False):
+    rgrid = RadialGrid(ExpRTransform(1e-3, 1e1, 20))
+    return AtomicGrid(8, 8, center, (rgrid, 26), random_rotate=random_rotate)
+
+
+def test_template_cache():
+    cache = TemplateCache()
+    template = cache.get(get_atgrid(np.zeros(3)))
+    assert len(cache) == 1
+    # A translated grid has the same template.
+    assert cache.get(get_atgrid(np.array([1.0, -2.0, 0.5]))) is template
+    # A rotated grid has not and gets no template of its own.
+    atgrid = get_atgrid(np.zeros(3), True)
+    assert not template.matches(atgrid)
+    assert cache.get(atgrid) is None
+    assert len(cache) == 1
+    # The least recently used template is discarded.
+    rgrid = RadialGrid(ExpRTransform(1e-3, 1e1, 30))
+    atgrid = AtomicGrid(8, 8, np.zeros(3), (rgrid, 26), random_rotate=False)
+    cache = TemplateCache(maxsize=1)
+    cache.get(get_atgrid(np.zeros(3)))
+    cache.get(atgrid)
+    assert len(cache) == 1
+    assert cache.get(atgrid).matches(atgrid)
+
+
+def test_template_moments():
+    center = np.array([0.3, -0.2, 1.1])
+    atgrid = get_atgrid(center)
+    template = TemplateCache().get(atgrid)
+    assert abs(template.distances - np.sqrt(((atgrid.points - center)**2).sum(axis=1))).max() < 1e-10
+    rng = np.random.RandomState(2)
+    fn = rng.uniform(0, 1, atgrid.size)
+    for mtype in 1, 2, 3:
+        expected = atgrid.integrate(fn, center=center, lmax=3, mtype=mtype)
+        table = template.get_moment_table(3, mtype)
+        assert table is template.get_moment_table(3, mtype)
+        assert abs(np.dot(table, atgrid.weights * fn) - expected).max() < 1e-10
+    with assert_raises(ValueError):
+        template.get_moment_table(3, 4)
+
+
+def test_template_wpart():
+    wpart = check_water_hf_sto3g('mbis', None, needs_padb=False)
+    for index in range(wpart.natom):
+        atgrid = wpart.get_grid(index)
+        assert wpart.get_template(index).matches(atgrid)
+        center = wpart.coordinates[index]
+        aim = wpart.get_moldens(index) * wpart.cache.load('at_weights', index)
+        expected = -atgrid.integrate(aim, center=center, lmax=wpart.lmax, mtype=2)
+        expected[0] += wpart.pseudo_numbers[index]
+        assert abs(wpart['pure_multipoles'][index] - expected).max() < 1e-10
+        deltas = wpart.grid.points - center
+        assert abs(wpart.get_distances(index) - np.sqrt((deltas**2).sum(axis=1))).max() < 1e-10
+    # Both hydrogens share a template.
+    assert wpart.get_template(1) is wpart.get_template(2)
+
+
+def test_template_rotated_grid():
+    coords, nums, pseudo_nums = load_molecule_npz('water_sto3g_hf_g03_fchk_exp:5e-4:2e1:120:110.npz')[:3]
+    rgrid = RadialGrid(ExpRTransform(5e-4, 2e1, 120))
+    grid = BeckeMolGrid(coords, nums, pseudo_nums, (rgrid, 110), random_rotate=True, mode='only')
+    # A model density, the sum of Slater functions on the atoms
+    moldens = sum(np.exp(-2 * np.sqrt(((grid.points - center)**2).sum(axis=1)))
+                  for center in coords)
+    ntemplate = len(template_cache)
+    wpart = BeckeWPart(coords, nums, pseudo_nums, grid, moldens)
+    wpart.do_moments()
+    # No templates are made for the rotated atomic grids.
+    assert len(template_cache) == ntemplate
+    for index in range(wpart.natom):
+        assert wpart.get_template(index) is None
+        atgrid = wpart.get_grid(index)
+        center = wpart.coordinates[index]
+        aim = wpart.get_moldens(index) * wpart.cache.load('at_weights', index)
+        expected = -atgrid.integrate(aim, center=center, lmax=wpart.lmax, mtype=2)
+        expected[0] += wpart.pseudo_numbers[index]
+        assert abs(wpart['pure_multipoles'][index] - expected).max() < 1e-10
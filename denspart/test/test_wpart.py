@@ -20,13 +20,18 @@
 # --
 
 
+import os
+
+import h5py as h5
 import numpy as np
 from nose.plugins.attrib import attr
 
 from horton.grid import ExpRTransform, RadialGrid, BeckeMolGrid
+from .. iterstock import ChargesConvergedCallback
 from .. proatomdb import ProAtomDB
 from .. utils import wpart_schemes
-from .common import load_molecule_npz, load_atoms_npz, check_names, check_proatom_splines
+from .common import load_molecule_npz, load_atoms_npz, check_names, check_proatom_splines, \
+    tmpdir
 
 
 def check_water_hf_sto3g(scheme, expecting, needs_padb=True, **kwargs):
@@ -47,7 +52,8 @@ def check_water_hf_sto3g(scheme, expecting, needs_padb=True, **kwargs):
     wpart = WPartClass(coords, nums, pseudo_nums, grid, dens,  **kwargs)
     names = wpart.do_all()
     check_names(names, wpart)
-    assert abs(wpart['charges'] - expecting).max() < 2e-3
+    if expecting is not None:
+        assert abs(wpart['charges'] - expecting).max() < 2e-3
     assert abs(wpart['charges'] - wpart['cartesian_multipoles'][:,0]).max() < 1e-3
     assert abs(wpart['charges'] - wpart['pure_multipoles'][:,0]).max() < 1e-3
 
@@ -65,6 +71,29 @@ def test_hirshfeld_water_hf_sto3g_global():
     check_water_hf_sto3g('h', expecting, local=False)
 
 
+def test_hirshfeld_water_hf_sto3g_memory_report():
+    expecting = np.array([-0.246171541212, 0.123092011074, 0.123079530138]) # from HiPart
+    wpart = check_water_hf_sto3g('h', expecting)
+    report = wpart.get_memory_report()
+    assert report['families']['at_weights']['nalloc'] == 3
+    assert report['families']['at_weights']['nbyte'] == 8 * wpart.grid.size
+    assert report['peak'] >= report['nbyte'] > 0
+    assert report['estimate'] > 0
+
+
+def test_hirshfeld_water_hf_sto3g_pseudo_populations():
+    expecting = np.array([-0.246171541212, 0.123092011074, 0.123079530138]) # from HiPart
+    for local in True, False:
+        wpart = check_water_hf_sto3g('h', expecting, local=local)
+        pseudo_populations = wpart.compute_pseudo_populations()
+        for index in range(wpart.natom):
+            grid = wpart.get_grid(index)
+            expected = grid.integrate(wpart.cache.load('at_weights', index), wpart.get_moldens(index))
+            assert abs(pseudo_populations[index] - expected) < 1e-10
+        assert abs(wpart.compute_pseudo_populations([2, 0]) - pseudo_populations[[2, 0]]).max() < 1e-14
+        assert abs(wpart['pseudo_populations'] - pseudo_populations).max() < 1e-14
+
+
 def test_hirshfeld_i_water_hf_sto3g_local():
     expecting = np.array([-0.4214, 0.2107, 0.2107]) # From HiPart
     check_water_hf_sto3g('hi', expecting, local=True)
@@ -87,6 +116,116 @@ def test_mbis_water_hf_sto3g():
     assert (wpart['core_charges'] > 0).all()
     assert (wpart['valence_charges'] < 0).all()
     assert (wpart['valence_widths'] > 0).all()
+    # the per-atom changes add up to the total change in the last iteration
+    assert wpart['atom_changes'].shape == (3,)
+    assert abs(np.sqrt((wpart['atom_changes']**2).sum()) - wpart['change']) < 1e-12
+    # timings and counters
+    timings = wpart['timings']
+    assert timings['iterations']['count'] == wpart['niter']
+    assert timings['spherical_average']['count'] == wpart['niter']
+    assert timings['mbis_inner_solve']['count'] == 3 * wpart['niter']
+    assert timings['moments']['time'] > 0
+
+
+def test_gisa_water_hf_sto3g():
+    wpart = check_water_hf_sto3g('gisa', None, needs_padb=False)
+    charges = wpart['charges']
+    assert abs(charges.sum()) < 1e-3
+    assert charges[0] < -0.3
+    assert abs(charges[1] - charges[2]) < 1e-3
+    # the populations of the Gaussians are not negative
+    assert (wpart['propars'] >= 0).all()
+
+
+def check_freeze_water_hf_sto3g(scheme, expecting, needs_padb=True, **kwargs):
+    # The frozen atoms and charges after each iteration. The callback is
+    # called before atoms are frozen for the next iteration, so the mask
+    # contains the atoms whose update was skipped in this iteration.
+    frozen = []
+    charges = []
+
+    def record(part, info):
+        frozen.append(part._frozen.copy())
+        charges.append(info['charges'].copy())
+
+    wpart = check_water_hf_sto3g(scheme, expecting, needs_padb, callbacks=[record], **kwargs)
+    assert len(frozen) == wpart['niter']
+    # Atoms were frozen in some iterations and their charges did not change.
+    nskipped = 0
+    for iteration in range(1, len(frozen)):
+        mask = frozen[iteration]
+        assert (charges[iteration][mask] == charges[iteration - 1][mask]).all()
+        nskipped += mask.sum()
+    assert nskipped > 0
+    # The last iteration is done without frozen atoms.
+    assert not frozen[-1].any()
+    # Freezing does not affect the result and costs few extra iterations.
+    reference = check_water_hf_sto3g(scheme, expecting, needs_padb)
+    assert abs(wpart['charges'] - reference['charges']).max() < 1e-4
+    assert wpart['niter'] <= reference['niter'] + kwargs.get('freeze_recheck', 10)
+    return wpart
+
+
+def test_mbis_water_hf_sto3g_freeze():
+    expecting = np.array([-0.61891067, 0.3095756, 0.30932584])
+    check_freeze_water_hf_sto3g('mbis', expecting, needs_padb=False, freeze_threshold=1e-5,
+                                freeze_count=2, freeze_recheck=5)
+
+
+def test_is_water_hf_sto3g_history():
+    expecting = np.array([-0.490017586929, 0.245018706885, 0.244998880045]) # From HiPart
+    wpart = check_water_hf_sto3g('is', expecting, needs_padb=False, history=2)
+    assert wpart['history_propars'].shape == (2, len(wpart['propars']))
+    assert wpart['history_charges'].shape == (2, 3)
+    wpart = check_water_hf_sto3g('is', expecting, needs_padb=False, history=None)
+    assert 'history_propars' not in wpart.cache
+    with tmpdir('denspart.test.test_wpart.test_is_water_hf_sto3g_history') as dn:
+        fn = os.path.join(dn, 'history.h5')
+        wpart = check_water_hf_sto3g('is', expecting, needs_padb=False, history=fn)
+        # The file is closed after the iterations.
+        assert 'history_propars' not in wpart.cache
+        with h5.File(fn, 'r') as f:
+            assert f['history_propars'].shape == (wpart['niter'], len(wpart['propars']))
+            assert f['history_charges'].shape == (wpart['niter'], 3)
+
+
+def test_is_water_hf_sto3g_eval_proatom():
+    expecting = np.array([-0.490017586929, 0.245018706885, 0.244998880045]) # From HiPart
+    wpart = check_water_hf_sto3g('is', expecting, needs_padb=False)
+    for index in range(wpart.natom):
+        # On the molecular grid, the proatom is evaluated radially on its own
+        # atomic grid.
+        spline = wpart.get_proatom_spline(index)
+        expected = wpart.grid.zeros()
+        wpart.grid.eval_spline(spline, wpart.coordinates[index], expected)
+        proatom = wpart.grid.zeros()
+        wpart.eval_proatom(index, proatom, wpart.grid)
+        assert abs(proatom - expected).max() < 1e-10 * abs(expected).max()
+
+
+def test_mbis_water_hf_sto3g_callbacks():
+    expecting = np.array([-0.61891067, 0.3095756, 0.30932584])
+    infos = []
+
+    def record(part, info):
+        infos.append((info['iteration'], info['change'], info['charges'].copy()))
+        assert 'iterations' in info['timings']
+
+    wpart = check_water_hf_sto3g('mbis', expecting, needs_padb=False,
+                                 callbacks=[record, ChargesConvergedCallback(1e-4)])
+    niter = wpart['niter']
+    assert len(infos) == niter
+    assert [iteration for iteration, change, charges in infos] == list(range(1, niter + 1))
+    assert infos[-1][1] == wpart['change']
+    assert abs(infos[-1][2] - infos[-2][2]).max() < 1e-4
+    assert abs(infos[-2][2] - infos[-3][2]).max() >= 1e-4
+    # The callback stops well before the proatoms are converged.
+    assert wpart['change'] > 1e-6
+
+
+def test_hirshfeld_i_water_hf_sto3g_freeze():
+    expecting = np.array([-0.4214, 0.2107, 0.2107]) # From HiPart
+    check_freeze_water_hf_sto3g('hi', expecting, freeze_threshold=1e-5)
 
 
 def check_msa_hf_lan(scheme, expecting, needs_padb=True, **kwargs):
@@ -37,6 +37,9 @@ def wpart_schemes(scheme):
     elif scheme == 'is':
         from .iterstock import IterativeStockholderWPart
         wpart = IterativeStockholderWPart
+    elif scheme == 'gisa':
+        from .gisa import GaussianIterativeStockholderWPart
+        wpart = GaussianIterativeStockholderWPart
     elif scheme == 'mbis':
         from .mbis import MBISWPart
         wpart = MBISWPart
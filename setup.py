@@ -56,6 +56,9 @@ setup(
     package_dir={'denspart': 'denspart'},
     packages=['denspart', 'denspart.test'],
     include_package_data=True,
+    entry_points={
+        'console_scripts': ['denspart-batch = denspart.batch:main'],
+    },
     classifiers=[
         'Environment :: Console',
         'License :: OSI Approved :: GNU General Public License v3 or later (GPLv3+)',
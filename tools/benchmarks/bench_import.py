@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Benchmarks of the time needed to import DensPart.
+
+Every case is a statement that is executed in a fresh Python process. Only the
+execution of the statement is timed, not the startup of the interpreter. The
+median and interquartile range of the import times, and the heavy dependencies
+that got loaded, are written to a JSON file, which can be compared with a saved
+baseline:
+
+    python tools/benchmarks/bench_import.py -o new.json -b baseline.json
+"""
+
+
+from __future__ import print_function
+
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+from common import get_machine_info, dump_results, load_results, compare_results
+
+
+cases = [
+    ('package', 'import denspart'),
+    ('cache', 'from denspart import Cache'),
+    ('mulliken', 'from denspart import partition_mulliken'),
+    ('mbis', 'from denspart import MBISWPart'),
+    ('all', 'from denspart import *'),
+]
+
+# Dependencies that are expensive to import.
+heavy_modules = ['numpy', 'scipy', 'h5py', 'horton']
+
+script = """
+import json, sys, time
+timer = getattr(time, 'perf_counter', time.time)
+time0 = timer()
+%s
+elapsed = timer() - time0
+loaded = [name for name in %r if name in sys.modules]
+print(json.dumps({'time': elapsed, 'loaded': loaded}))
+"""
+
+
+def run_case(statement, repeat):
+    """Execute an import statement in fresh processes.
+
+       **Returns:** a dictionary with the statistics of the import time in
+       seconds and the heavy modules that were loaded.
+    """
+    times = np.zeros(repeat)
+    for irepeat in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, '-c', script % (statement, heavy_modules)])
+        result = json.loads(output.decode('utf-8'))
+        times[irepeat] = result['time']
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    return {
+        'median': median,
+        'q1': q1,
+        'q3': q3,
+        'iqr': q3 - q1,
+        'min': times.min(),
+        'repeat': repeat,
+        'loaded': result['loaded'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-r', '--repeat', type=int, default=11,
+                        help='The number of processes per case. [default=%(default)s]')
+    parser.add_argument('-o', '--output', default='bench_import.json',
+                        help='The JSON file for the results. [default=%(default)s]')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='A JSON file with results to compare with.')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2,
+                        help='The acceptable relative slowdown. [default=%(default)s]')
+    args = parser.parse_args(argv)
+
+    results = {'machine': get_machine_info(), 'cases': {}}
+    print('%-10s  %12s  %12s  %s' % ('Case', 'Median[ms]', 'IQR[ms]', 'Loaded'))
+    for name, statement in cases:
+        stats = run_case(statement, args.repeat)
+        results['cases'][name] = stats
+        print('%-10s  %12.3f  %12.3f  %s' % (
+            name, stats['median'] * 1e3, stats['iqr'] * 1e3, ' '.join(stats['loaded'])))
+    dump_results(args.output, results)
+
+    if args.baseline is not None:
+        baseline = load_results(args.baseline)
+        nregression = 0
+        print()
+        print('%-10s  %12s  %12s  %7s' % ('Case', 'Old[ms]', 'New[ms]', 'Ratio'))
+        for case, old, new, ratio, regression in compare_results(
+                results, baseline, 'median', args.tolerance):
+            print('%-10s  %12.3f  %12.3f  %7.3f%s' % (
+                case, old * 1e3, new * 1e3, ratio, '  SLOWER' if regression else ''))
+            nregression += regression
+        if nregression > 0:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Micro-benchmarks of the kernels used by the partitioning schemes.
+
+Each kernel is timed in isolation on fixed inputs, with warmup calls and
+repeated timings. The median and interquartile range of the time per call are
+written to a JSON file, which can be compared with a saved baseline:
+
+    python tools/benchmarks/bench_kernels.py -o new.json -b baseline.json
+
+Only the kernels whose name contains one of the ``-k`` patterns are run.
+"""
+
+
+from __future__ import print_function
+
+import argparse
+import sys
+
+import numpy as np
+
+from denspart.cache import Cache
+
+from common import measure, get_synthetic_system, get_machine_info, \
+    dump_results, load_results, compare_results
+
+
+kernels = []
+
+
+def kernel(fn):
+    """Register a kernel. The function sets up the inputs and returns the
+       function to be timed."""
+    kernels.append(fn)
+    return fn
+
+
+@kernel
+def cache_load_valid(system):
+    """Cache.load of a valid array, as done many times per iteration."""
+    cache = Cache()
+    cache.load('at_weights', 0, alloc=100)
+    return lambda: cache.load('at_weights', 0)
+
+
+@kernel
+def cache_load_alloc_valid(system):
+    """Cache.load with alloc and tags of an array that is already present."""
+    cache = Cache()
+    cache.load('at_weights', 0, alloc=(100,), tags='o')
+    return lambda: cache.load('at_weights', 0, alloc=(100,), tags='o')
+
+
+@kernel
+def cache_load_alloc_reuse(system):
+    """Cache.load with alloc of an invalidated array, whose memory is reused."""
+    cache = Cache()
+    cache.load('at_weights', 0, alloc=(100,))
+
+    def run():
+        cache.clear_item('at_weights', 0)
+        cache.load('at_weights', 0, alloc=(100,))
+    return run
+
+
+@kernel
+def eval_spline_subgrid(system):
+    """Evaluation of a proatom spline on the atomic grid of the oxygen atom."""
+    atgrid = system['grid'].subgrids[0]
+    spline = system['proatomdb'].get_spline(8)
+    center = system['coordinates'][0]
+    output = atgrid.zeros()
+
+    def run():
+        output[:] = 0.0
+        atgrid.eval_spline(spline, center, output)
+    return run
+
+
+@kernel
+def spherical_average(system):
+    """Spherical average of the weighted density, as in _update_propars_atom."""
+    atgrid = system['grid'].subgrids[0]
+    dens = system['moldens'][atgrid.begin:atgrid.end]
+    at_weights = np.random.RandomState(1).uniform(0, 1, atgrid.size)
+    return lambda: atgrid.get_spherical_average(at_weights, dens)
+
+
+@kernel
+def rgrid_integrate(system):
+    """Radial integral of one function, as in _opt_mbis_propars."""
+    rgrid = system['grid'].subgrids[0].rgrid
+    f = np.exp(-rgrid.radii)
+    return lambda: rgrid.integrate(f)
+
+
+@kernel
+def rgrid_integrate_product(system):
+    """Radial integral of a product of two functions, as in _opt_mbis_propars."""
+    rgrid = system['grid'].subgrids[0].rgrid
+    f = np.exp(-rgrid.radii)
+    return lambda: rgrid.integrate(f, rgrid.radii)
+
+
+@kernel
+def proatomdb_get_rho_charge(system):
+    """ProAtomDB.get_rho of a single charged proatom."""
+    proatomdb = system['proatomdb']
+    return lambda: proatomdb.get_rho(8, -1)
+
+
+@kernel
+def proatomdb_get_rho_linear(system):
+    """ProAtomDB.get_rho of a linear combination, as in Hirshfeld-I."""
+    proatomdb = system['proatomdb']
+    parameters = {1: 0.2, 0: 0.5, -1: 0.3}
+    return lambda: proatomdb.get_rho(8, parameters, do_deriv=True)
+
+
+@kernel
+def proatomdb_get_rho_geometric(system):
+    """ProAtomDB.get_rho of a geometric combination."""
+    proatomdb = system['proatomdb']
+    parameters = {1: 0.2, 0: 0.5, -1: 0.3}
+    return lambda: proatomdb.get_rho(8, parameters, combine='geometric', do_deriv=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-k', '--kernels', nargs='+', default=[''],
+                        help='Only run kernels whose name contains one of these patterns.')
+    parser.add_argument('-r', '--repeat', type=int, default=21,
+                        help='The number of timings per kernel. [default=%(default)s]')
+    parser.add_argument('-w', '--warmup', type=int, default=3,
+                        help='The number of calls before the timings. [default=%(default)s]')
+    parser.add_argument('-o', '--output', default='bench_kernels.json',
+                        help='The JSON file for the results. [default=%(default)s]')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='A JSON file with results to compare with.')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                        help='The acceptable relative slowdown. [default=%(default)s]')
+    args = parser.parse_args(argv)
+
+    system = get_synthetic_system(1)
+    results = {'machine': get_machine_info(), 'cases': {}}
+    print('%-30s  %12s  %12s  %8s' % ('Kernel', 'Median[us]', 'IQR[us]', 'Number'))
+    for fn in kernels:
+        name = fn.__name__
+        if not any(pattern in name for pattern in args.kernels):
+            continue
+        stats = measure(fn(system), repeat=args.repeat, warmup=args.warmup)
+        results['cases'][name] = stats
+        print('%-30s  %12.3f  %12.3f  %8i' % (
+            name, stats['median'] * 1e6, stats['iqr'] * 1e6, stats['number']))
+    dump_results(args.output, results)
+
+    if args.baseline is not None:
+        baseline = load_results(args.baseline)
+        nregression = 0
+        print()
+        print('%-30s  %12s  %12s  %7s' % ('Kernel', 'Old[us]', 'New[us]', 'Ratio'))
+        for case, old, new, ratio, regression in compare_results(
+                results, baseline, 'median', args.tolerance):
+            # Differences within the spread of the old timings are not
+            # considered to be significant.
+            if new - old < baseline['cases'][case]['iqr']:
+                regression = False
+            print('%-30s  %12.3f  %12.3f  %7.3f%s' % (
+                case, old * 1e6, new * 1e6, ratio, '  SLOWER' if regression else ''))
+            nregression += regression
+        if nregression > 0:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""End-to-end benchmarks of the WPart partitioning schemes.
+
+Every scheme is applied to synthetic water clusters of increasing size. The
+wall time of each phase, the number of iterations and the peak memory are
+written to a JSON file, which can be compared with a saved baseline:
+
+    python tools/benchmarks/bench_wpart.py -o new.json -b baseline.json
+
+The script exits with a non-zero status when a case became slower than the
+baseline by more than the tolerance. With ``--multi``, all schemes are also run
+together with a ``MultiWPart``, to compare with the sum of the separate runs.
+"""
+
+
+from __future__ import print_function
+
+import argparse
+import sys
+
+from denspart.multi import MultiWPart
+from denspart.utils import wpart_schemes
+
+from common import timer, PeakMemory, get_synthetic_system, get_machine_info, \
+    dump_results, load_results, compare_results
+
+
+# The phases are executed in this order. Each do_* method only does the work
+# that was not done by the previous ones.
+phases = ['partitioning', 'charges', 'moments']
+
+# Schemes that need a proatom database.
+padb_schemes = ['h', 'hi']
+
+
+def run_case(scheme, system):
+    """Run one partitioning scheme on one system.
+
+       **Returns:** a dictionary with the metrics of this case.
+    """
+    kwargs = {}
+    if scheme in padb_schemes:
+        kwargs['proatomdb'] = system['proatomdb']
+    WPartClass = wpart_schemes(scheme)
+    metrics = {}
+    with PeakMemory() as peak_memory:
+        time0 = timer()
+        wpart = WPartClass(system['coordinates'], system['numbers'],
+                           system['pseudo_numbers'], system['grid'],
+                           system['moldens'], **kwargs)
+        metrics['time_init'] = timer() - time0
+        for phase in phases:
+            time0 = timer()
+            getattr(wpart, 'do_%s' % phase)()
+            metrics['time_%s' % phase] = timer() - time0
+    metrics['time_total'] = metrics['time_init'] + sum(
+        metrics['time_%s' % phase] for phase in phases)
+    metrics['peak_memory'] = peak_memory.peak
+    metrics['niter'] = int(wpart['niter']) if 'niter' in wpart.cache else None
+    metrics['timings'] = dict(wpart['timings'])
+    memory_report = wpart.get_memory_report()
+    metrics['cache_peak_memory'] = memory_report['peak']
+    metrics['estimated_memory'] = memory_report['estimate']
+    metrics['natom'] = wpart.natom
+    metrics['npoint'] = wpart.grid.size
+    return metrics
+
+
+def run_multi_case(schemes, system):
+    """Run several partitioning schemes together with a MultiWPart.
+
+       **Returns:** a dictionary with the metrics of this case.
+    """
+    metrics = {}
+    with PeakMemory() as peak_memory:
+        time0 = timer()
+        multi = MultiWPart(system['coordinates'], system['numbers'],
+                           system['pseudo_numbers'], system['grid'],
+                           system['moldens'], schemes, system['proatomdb'])
+        multi.do_all()
+        metrics['time_total'] = timer() - time0
+    metrics['peak_memory'] = peak_memory.peak
+    metrics['niter'] = dict((scheme, int(multi[scheme]['niter']))
+                            for scheme in schemes if 'niter' in multi[scheme].cache)
+    metrics['natom'] = multi[schemes[0]].natom
+    metrics['npoint'] = system['grid'].size
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-s', '--schemes', nargs='+', default=['h', 'hi', 'is', 'mbis', 'b'],
+                        help='The partitioning schemes to run. [default=%(default)s]')
+    parser.add_argument('-n', '--sizes', nargs='+', type=int, default=[1, 2, 4, 8],
+                        help='The numbers of water molecules. [default=%(default)s]')
+    parser.add_argument('-o', '--output', default='bench_wpart.json',
+                        help='The JSON file for the results. [default=%(default)s]')
+    parser.add_argument('-b', '--baseline', default=None,
+                        help='A JSON file with results to compare with.')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2,
+                        help='The acceptable relative slowdown. [default=%(default)s]')
+    parser.add_argument('-m', '--multi', default=False, action='store_true',
+                        help='Also run all schemes together with a MultiWPart.')
+    args = parser.parse_args(argv)
+
+    results = {'machine': get_machine_info(), 'cases': {}}
+    for nwater in args.sizes:
+        system = get_synthetic_system(nwater)
+        for scheme in args.schemes:
+            case = '%s_water%i' % (scheme, nwater)
+            metrics = run_case(scheme, system)
+            results['cases'][case] = metrics
+            print('%-16s  natom=%4i  niter=%4s  time=%9.3fs  peak=%9.1fMB' % (
+                case, metrics['natom'], metrics['niter'], metrics['time_total'],
+                metrics['peak_memory'] / 1024.0**2))
+        if args.multi:
+            case = 'multi_water%i' % nwater
+            metrics = run_multi_case(args.schemes, system)
+            results['cases'][case] = metrics
+            time_separate = sum(results['cases']['%s_water%i' % (scheme, nwater)]['time_total']
+                                for scheme in args.schemes)
+            print('%-16s  natom=%4i  separate=%9.3fs  time=%9.3fs  peak=%9.1fMB' % (
+                case, metrics['natom'], time_separate, metrics['time_total'],
+                metrics['peak_memory'] / 1024.0**2))
+    dump_results(args.output, results)
+
+    if args.baseline is not None:
+        baseline = load_results(args.baseline)
+        nregression = 0
+        print()
+        print('%-16s  %10s  %10s  %7s' % ('Case', 'Old[s]', 'New[s]', 'Ratio'))
+        for case, old, new, ratio, regression in compare_results(
+                results, baseline, 'time_total', args.tolerance):
+            print('%-16s  %10.3f  %10.3f  %7.3f%s' % (
+                case, old, new, ratio, '  SLOWER' if regression else ''))
+            nregression += regression
+        if nregression > 0:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
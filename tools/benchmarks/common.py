@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+# HORTON: Helpful Open-source Research TOol for N-fermion systems.
+# Copyright (C) 2011-2017 The HORTON Development Team
+#
+# This file is part of HORTON.
+#
+# HORTON is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 3
+# of the License, or (at your option) any later version.
+#
+# HORTON is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>
+#
+# --
+"""Shared utilities for the DensPart benchmarks"""
+
+
+from __future__ import print_function
+
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from horton.grid import ExpRTransform, RadialGrid, BeckeMolGrid
+from denspart.proatomdb import ProAtomDB
+from denspart.test.common import load_atoms_npz
+
+
+__all__ = [
+    'timer', 'measure', 'PeakMemory', 'get_water_cluster', 'get_synthetic_system',
+    'get_machine_info', 'dump_results', 'load_results', 'compare_results',
+]
+
+
+# Use the most accurate wall-clock timer available.
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def measure(func, repeat=21, warmup=3, number=None, min_time=0.01):
+    """Time a function with repeats and warmup.
+
+       **Arguments:**
+
+       func
+            A function without arguments. All inputs must be prepared in
+            advance, such that only the kernel itself is timed.
+
+       **Optional arguments:**
+
+       repeat
+            The number of timings from which the statistics are derived.
+
+       warmup
+            The number of calls before the timings start. These fill caches
+            and trigger lazy initializations.
+
+       number
+            The number of calls per timing. When not given, it is chosen such
+            that one timing takes at least ``min_time`` seconds, which keeps
+            the resolution of the timer out of the results.
+
+       min_time
+            See number.
+
+       **Returns:** a dictionary with the statistics of the time per call in
+       seconds: ``median``, ``q1``, ``q3``, ``iqr`` and ``min``, plus
+       ``repeat`` and ``number``.
+    """
+    for iwarmup in range(warmup):
+        func()
+    if number is None:
+        number = 1
+        while True:
+            time0 = timer()
+            for icall in range(number):
+                func()
+            if timer() - time0 >= min_time:
+                break
+            number *= 2
+    times = np.zeros(repeat)
+    for irepeat in range(repeat):
+        time0 = timer()
+        for icall in range(number):
+            func()
+        times[irepeat] = (timer() - time0) / number
+    q1, median, q3 = np.percentile(times, [25, 50, 75])
+    return {
+        'median': median,
+        'q1': q1,
+        'q3': q3,
+        'iqr': q3 - q1,
+        'min': times.min(),
+        'repeat': repeat,
+        'number': number,
+    }
+
+
+class PeakMemory(object):
+    """Context manager that measures the peak memory of the enclosed block.
+
+       With tracemalloc (Python >= 3.4), the peak of the memory traced during
+       the block is reported, which includes NumPy arrays. Otherwise the
+       increase of the maximum resident set size of the process is used, which
+       is only a lower bound.
+
+       The result, in bytes, is available as the ``peak`` attribute after the
+       block.
+    """
+    def __init__(self):
+        self.peak = None
+
+    def __enter__(self):
+        try:
+            import tracemalloc
+        except ImportError:
+            tracemalloc = None
+        self._tracemalloc = tracemalloc
+        if tracemalloc is None:
+            self._start = _get_maxrss()
+        else:
+            self._was_tracing = tracemalloc.is_tracing()
+            if not self._was_tracing:
+                tracemalloc.start()
+            tracemalloc.clear_traces()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._tracemalloc is None:
+            self.peak = max(_get_maxrss() - self._start, 0)
+        else:
+            self.peak = self._tracemalloc.get_traced_memory()[1]
+            if not self._was_tracing:
+                self._tracemalloc.stop()
+
+
+def _get_maxrss():
+    """Return the maximum resident set size of the process in bytes."""
+    import resource
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+# Geometry of a water molecule in bohr, oxygen first.
+water_coordinates = np.array([
+    [0.000000, 0.000000, 0.221665],
+    [0.000000, 1.430901, -0.886659],
+    [0.000000, -1.430901, -0.886659],
+])
+
+
+def get_water_cluster(nwater, spacing=5.5):
+    """Return a cluster of water molecules placed on a cubic lattice.
+
+       **Arguments:**
+
+       nwater
+            The number of water molecules.
+
+       **Optional arguments:**
+
+       spacing
+            The distance between neighboring molecules in bohr.
+
+       **Returns:** ``coordinates, numbers``
+    """
+    nside = int(np.ceil(nwater**(1.0 / 3.0) - 1e-10))
+    coordinates = []
+    numbers = []
+    for iwater in range(nwater):
+        shift = spacing * np.array([iwater % nside, (iwater // nside) % nside,
+                                    iwater // nside**2], float)
+        coordinates.append(water_coordinates + shift)
+        numbers.extend([8, 1, 1])
+    return np.concatenate(coordinates), np.array(numbers)
+
+
+# Mixtures of charged proatoms used to make the synthetic density. The charge
+# transfer from hydrogen to oxygen makes sure that the iterative schemes do not
+# converge in the first iteration.
+synthetic_parameters = {
+    1: {0: 0.8, 1: 0.2},
+    8: {0: 0.6, -1: 0.4},
+}
+
+
+def get_synthetic_system(nwater, nrad=100, nang=110):
+    """Construct a synthetic test case for the partitioning schemes.
+
+       The molecular density is a superposition of (charged) proatoms from the
+       proatom database in ``denspart/test/cached``, such that no external
+       programs are needed to generate it.
+
+       **Arguments:**
+
+       nwater
+            The number of water molecules, see ``get_water_cluster``.
+
+       **Optional arguments:**
+
+       nrad, nang
+            The number of radial and angular grid points per atom.
+
+       **Returns:** a dictionary with the keys ``coordinates``, ``numbers``,
+       ``pseudo_numbers``, ``grid``, ``moldens`` and ``proatomdb``.
+    """
+    coordinates, numbers = get_water_cluster(nwater)
+    pseudo_numbers = numbers.astype(float)
+    records = load_atoms_npz(numbers=[8, 1], max_cation=1, max_anion=-1)
+    proatomdb = ProAtomDB(records)
+    rgrid = RadialGrid(ExpRTransform(5e-4, 2e1, nrad))
+    grid = BeckeMolGrid(coordinates, numbers, pseudo_numbers, (rgrid, nang),
+                        random_rotate=False, mode='only')
+    moldens = grid.zeros()
+    splines = {}
+    for number, parameters in synthetic_parameters.items():
+        splines[number] = proatomdb.get_spline(number, parameters)
+    for center, number in zip(coordinates, numbers):
+        grid.eval_spline(splines[number], center, moldens)
+    return {
+        'coordinates': coordinates,
+        'numbers': numbers,
+        'pseudo_numbers': pseudo_numbers,
+        'grid': grid,
+        'moldens': moldens,
+        'proatomdb': proatomdb,
+    }
+
+
+def get_machine_info():
+    """Return a description of the machine, stored along with the results."""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def dump_results(filename, results):
+    """Write benchmark results to a JSON file."""
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(filename):
+    """Load benchmark results from a JSON file."""
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare_results(results, baseline, key, tolerance=0.2):
+    """Compare benchmark results with a baseline.
+
+       **Arguments:**
+
+       results, baseline
+            Dictionaries with benchmark results, as written by ``dump_results``.
+            The ``cases`` item maps a case name to a dictionary of metrics.
+
+       key
+            The metric to compare, e.g. ``time_total``. Cases in which the
+            metric is missing are skipped.
+
+       **Optional arguments:**
+
+       tolerance
+            The relative increase of the metric that is still acceptable.
+
+       **Returns:** a list of ``(case, old, new, ratio, regression)`` tuples,
+       sorted by case name.
+    """
+    rows = []
+    old_cases = baseline['cases']
+    for case, metrics in sorted(results['cases'].items()):
+        if case not in old_cases:
+            continue
+        old = old_cases[case].get(key)
+        new = metrics.get(key)
+        if old is None or new is None or old <= 0:
+            continue
+        ratio = new / old
+        rows.append((case, old, new, ratio, ratio > 1 + tolerance))
+    return rows